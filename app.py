@@ -6,31 +6,113 @@
 #importing necessary libraries
 
 import time
+import uuid
+from functools import partial
 from typing import Literal
 import numpy as np
 import streamlit as st 
 import pandas as pd
+import psycopg2 as pg
 from PIL import Image
 from main import (
-    get_all_items, get_inventory, 
     # get_all_contribution, 
-    get_particular_contribution, 
-    add_new_items,
-    get_allocations, 
-    create_new_bill_record, is_bill_exists, get_all_cooking_teams, 
-    settings, check_for_item_availability, allocate_items_to_cooking_team
+    get_settings,
+    read_bill_file, import_bills, bill_import_columns, load_concurrently, validate_item_lines,
+    Catalog, catalog_snapshot, start_change_listener,
+    get_db, get_query_cache, get_query_stats,
+    offline_errors, is_offline_error, queue_bill_record, queue_allocation, get_write_journal, start_write_queue_flusher
 )
+from storage import Repository, get_repository
 
 
-inventory_data = get_inventory()
-# contributions = get_all_contribution()
-items = get_all_items()
+# rows shown per page in the View Allocations tab.
+allocations_page_size: int = 50
 
-allocations = get_allocations()
-cooking_teams = get_all_cooking_teams()
+# seconds between the checks of the Inventory tab for a newer snapshot.
+inventory_poll_interval: int = 2
+
+
+def get_catalog() -> Catalog:
+
+    """
+        Items and inventory of the page: the process wide catalog kept current by the change 
+        listener (shared by the sessions, nothing copied per rerun), or on the embedded database 
+        (a single process, no listener) a catalog read from it.
+    """
+
+    if get_settings().storage_backend == "postgres":
+        return catalog_snapshot.get()
+
+    repository: Repository = get_repository()
+
+    return Catalog(0, repository.get_all_items(), repository.get_inventory())
+
+
+@st.fragment(run_every = inventory_poll_interval)
+def show_inventory() -> None:
+
+    """
+        Inventory tab, re-run on its own every `inventory_poll_interval` seconds.
+
+        Reads the process wide catalog kept current by the change listener (no query per 
+        session), so a stock change shows up without a page reload or a button press.
+    """
+
+    catalog: Catalog = get_catalog()
+    inventory_data: pd.DataFrame | None = catalog.inventory
+
+    st.text('These are inventory data')
+
+    if inventory_data is not None:
+        st.caption(f"Updated at {catalog.refreshed_at:%H:%M:%S}")
+        st.dataframe(
+            data = inventory_data,
+            use_container_width = True,
+            hide_index = True
+        )
+    else:
+        st.error("No Inventory found in the database.")
+
+
+def save_bill_record(
+        repository: Repository,
+        bill_book_code: str, bill_id: int,
+        donar_name: str,
+        donar_phone_num: str,
+        contribution_df: pd.DataFrame,
+        policy: Literal["create", "replace", "add", "skip"] = "replace"
+) -> (tuple[bool, list[dict]] | None):
+
+    """
+        Saves the bill and returns whether it was created and the changed lines, or, if the postgres 
+        database is unreachable, keeps it in the local write queue (returns None) to be synced by the flusher, 
+        so the entry is not lost. A queued "create" is saved as "replace" (the bill cannot be checked offline).
+        The embedded database has no write queue, its errors are shown as they are.
+    """
+
+    # the same key goes with the queued entry: if this attempt did commit, the entry is not applied twice.
+    write_key: str = uuid.uuid4().hex
+
+    try:
+        written: tuple[bool, list[dict]] = repository.create_new_bill_record(
+            bill_book_code, bill_id, donar_name, donar_phone_num, contribution_df, 
+            policy = policy, idempotency_key = write_key
+        )
+    except offline_errors as e:
+        if not (get_settings().storage_backend == "postgres" and is_offline_error(e)):
+            # the server is reachable but refused the write (eg. a deadlock or a statement timeout).
+            st.error(f"Saving the bill failed, Please try again. ({e})")
+            st.stop()
+
+        queue_bill_record(
+            write_key, bill_book_code, bill_id, donar_name, donar_phone_num, contribution_df, 
+            policy = "replace" if policy == "create" else policy
+        )
+        return None
+
+    return written
 
 
-image = Image.open('./meenakshi_thirukalyanam.jpeg')
 def main() -> None:
 
     st.set_page_config(
@@ -38,6 +120,34 @@ def main() -> None:
         layout = 'centered'
     )
 
+    # the data is loaded per run (served from the query cache), importing this module touches no database.
+    # the independent reads are fanned out concurrently, the bill shown in the View Contribution tab 
+    # is the one currently selected in its widgets (kept in the session state).
+    # the items and the inventory are not part of it, they are the shared catalog kept current by the 
+    # change listener (see get_catalog).
+    # every read and write goes through the repository of the configured storage backend.
+    repository: Repository = get_repository()
+    uses_postgres: bool = get_settings().storage_backend == "postgres"
+
+    if uses_postgres:
+        start_change_listener()
+        start_write_queue_flusher()
+
+    page_data: dict = load_concurrently(
+        # contributions = get_all_contribution,
+        cooking_teams = repository.get_all_cooking_teams,
+        particular_contribution = partial(
+            repository.get_particular_contribution,
+            bill_book_code = st.session_state.get("contribution_bill_book_code", "B1"),
+            bill_id = st.session_state.get("contribution_bill_id", 1)
+        )
+    )
+    catalog: Catalog = get_catalog()
+    items: pd.DataFrame | None = catalog.items
+    cooking_teams = page_data["cooking_teams"]
+
+    image = Image.open('./meenakshi_thirukalyanam.jpeg')
+
     st.title('Meenakshi Thirukalyanam')
 
     with st.sidebar:
@@ -53,7 +163,9 @@ def main() -> None:
         allocations_tab,
         add_item_tab,
         bill_entry,
-        new_allocation_tab
+        new_allocation_tab,
+        reports_tab,
+        diagnostics_tab
         
         
     ) = st.tabs(
@@ -63,11 +175,14 @@ def main() -> None:
                 'View Contribution',
                 'View Allocations',  'Add Item',
                 "Bill Entry",
-                "Allocations"
+                "Allocations",
+                "Reports",
+                "Diagnostics"
             ]
     )
     
-    items_options = items["item_id"].astype(str) + " - " +  items["item"] + " - " + items["unit_of_measurement"] 
+    # precomputed once per catalog, not per rerun.
+    items_options: tuple[str, ...] = catalog.options
 
     column_config_dict = {
                 "items": st.column_config.SelectboxColumn(
@@ -90,32 +205,26 @@ def main() -> None:
 
         if items is not None:
             st.dataframe(
-                data = items.fillna(' ').set_index('item_id'),
-                use_container_width = True
+                data = items,
+                use_container_width = True,
+                hide_index = True
             )
         else:
             st.error("No Items found in the database.")
     
     with inventory_tab:
 
-        st.text('These are inventory data')
-        inventory_df = inventory_data.set_index("item_id")
-        st.dataframe(
-            data = inventory_df.fillna(' '),
-            use_container_width = True
-        )
+        show_inventory()
 
 
     with particular_contribution_tab:
         
         col1, col2 = st.columns(2)
-        bill_book_code = col1.selectbox('Bill Book Code', options = [f"B{x}" for x in np.arange(1, 101)])
-        bill_id = col2.number_input("Bill Id", min_value = 1, step = 1)
+        col1.selectbox('Bill Book Code', options = [f"B{x}" for x in np.arange(1, 101)], key = "contribution_bill_book_code")
+        col2.number_input("Bill Id", min_value = 1, step = 1, key = "contribution_bill_id")
 
-        donar_name, contribution = get_particular_contribution(
-            bill_book_code =  bill_book_code,
-            bill_id = bill_id
-        )
+        # loaded above together with the rest of the page data.
+        donar_name, contribution = page_data["particular_contribution"]
 
         if contribution is not None :
             st.text(f'The followings are contributed by {donar_name}')
@@ -129,7 +238,83 @@ def main() -> None:
         else:
             # st.text(contribution)
             st.error('No records found with this Bill')
-            
+
+        with st.expander("Check a bill book"):
+            col1, col2, col3 = st.columns(3)
+            audit_bill_book_code: str = col1.selectbox(
+                'Bill Book Code', options = [f"B{x}" for x in np.arange(1, 101)], key = "audit_bill_book_code"
+            )
+            first_bill_id: int = col2.number_input("From Bill Id", min_value = 1, step = 1, value = 1, key = "audit_first_bill_id")
+            last_bill_id: int = col3.number_input("To Bill Id", min_value = 1, step = 1, value = 500, key = "audit_last_bill_id")
+
+            if st.button("Check", key = "audit_bill_book"):
+                # the whole range in one query.
+                bills: dict[tuple[str, int], dict] = repository.get_bill_contributions(
+                    bill_book_code = audit_bill_book_code, first_bill_id = first_bill_id, last_bill_id = last_bill_id
+                )
+                missing_bill_ids: list[int] = sorted(
+                    set(range(first_bill_id, last_bill_id + 1)) - {bill_id for _, bill_id in bills}
+                )
+
+                st.caption(
+                    f"{len(bills)} bills found, {len(missing_bill_ids)} missing"
+                    + (f": {', '.join(map(str, missing_bill_ids[:50]))}" if missing_bill_ids else "")
+                    + (" ..." if len(missing_bill_ids) > 50 else "")
+                )
+
+                if bills:
+                    st.dataframe(
+                        data = pd.DataFrame([
+                            {
+                                "bill_id": bill_id,
+                                "donar_name": bill["donar_name"],
+                                "donar_phone_num": bill["donar_phone_num"],
+                                "line_items": len(bill["items"]),
+                                "items": ", ".join(
+                                    f"{line['item']} {line['quantity']:g} {line['unit_of_measurement']}" for line in bill["items"]
+                                )
+                            }
+                            for (_, bill_id), bill in bills.items()
+                        ]),
+                        use_container_width = True,
+                        hide_index = True
+                    )
+
+        st.divider()
+        st.subheader("Search donor")
+        donor_search: str = st.text_input(
+            "Name or phone number", key = "donor_search", placeholder = "e.g. Lakshmi or 98450"
+        )
+        donors = repository.search_donors(donor_search) if donor_search.strip() else None
+
+        if donors is not None:
+            st.dataframe(data = donors, use_container_width = True, hide_index = True)
+
+            donor_position: int = st.selectbox(
+                "Donor history of", options = range(len(donors)), key = "donor_history_of",
+                format_func = lambda position: " - ".join(
+                    str(value) for value in donors.iloc[position][["donor_name", "donor_phone"]] if pd.notna(value)
+                )
+            )
+            donor = donors.iloc[donor_position]
+            donor_name: str | None = donor["donor_name"] if pd.notna(donor["donor_name"]) else None
+            donor_phone: str | None = donor["donor_phone"] if pd.notna(donor["donor_phone"]) else None
+
+            col1, col2 = st.columns([2, 3])
+            col1.caption("Total per item")
+            col1.dataframe(
+                data = repository.get_donor_history(donor_name, donor_phone, aggregate = True),
+                use_container_width = True, hide_index = True
+            )
+            col2.caption("Bills")
+            col2.dataframe(
+                data = repository.get_donor_history(donor_name, donor_phone),
+                use_container_width = True, hide_index = True
+            )
+
+        elif donor_search.strip():
+            st.info("No donor found.")
+
 
     with add_item_tab:
 
@@ -144,8 +329,8 @@ def main() -> None:
 
                 if st.form_submit_button("Continue and Add Item"):
                     if username and password:
-                        if username == settings.admin_username and password == settings.admin_password:
-                            result = add_new_items(item_name = item_name, unit_of_measurement = unit_of_measurement)
+                        if username == get_settings().admin_username and password == get_settings().admin_password:
+                            result = repository.add_new_items(item_name = item_name, unit_of_measurement = unit_of_measurement)
                             if not result:
                                 st.error(f"{item_name} already exists")
                             else:
@@ -182,48 +367,100 @@ def main() -> None:
     with allocations_tab:
         
         st.markdown("<b><p style='text-align: center;'>Allocations details</p></b>", unsafe_allow_html = True) 
-        col1, col2, col3 = st.columns(3)
 
-        if (allocations is not None) and (items is not None):  
-            
-            options: list[str] = ['ALL'] + list(allocations['supervisor_name'].unique())
-            supervisor_name: str = col3.selectbox('Supervisor', options)
+        if (cooking_teams is not None) and (items is not None):  
 
-            data: pd.DataFrame = allocations if supervisor_name == 'ALL' else allocations[allocations['supervisor_name'] == supervisor_name].reset_index(drop = True)
-            grouped_data = data.groupby('item_id')['quantity'].sum().reset_index()
-            final_grouped_data = pd.merge(items, grouped_data, how = 'inner', on = 'item_id')
-            final_grouped_data = final_grouped_data[['item', 'quantity', 'unit_of_measurement']].sort_values('quantity', ascending=False).reset_index(drop = True)
+            col1, col2 = st.columns(2)
+            team_options: dict[str, int | None] = {"ALL": None} | dict(
+                zip(cooking_teams["supervisor_name"].str.upper(), cooking_teams["id"])
+            )
+            supervisor_name: str = col1.selectbox('Supervisor', list(team_options))
+            item_options: dict[str, int | None] = {"ALL": None} | dict(catalog.item_ids_by_name)
+            item_name: str = col2.selectbox('Item', list(item_options))
 
-            # remove the unnecessary columns
-            data.drop(['cooking_team_id', 'supervisor_name', 'item_id'], axis = 1, inplace = True)
-            
-            col3, col4 = st.columns(2, vertical_alignment = 'bottom')
-            col3.write('**Total Allocation:**')
-            with col4.popover('graph'):
-                st.bar_chart(
-                    final_grouped_data, x = 'item', y = 'quantity',
-                    horizontal = True, width = 400, height = 250  
-                )
-            st.dataframe(
-                final_grouped_data, use_container_width = True,
-                hide_index = True
-            )      
-            st.divider()
+            col1, col2 = st.columns(2)
+            date_range: tuple = col1.date_input("Allocated between", value = ())
+            dish_filter: str = col2.text_input("Dish")
+
+            # filters are applied by postgres, only the totals and one page of rows come back.
+            filters: dict = {
+                "cooking_team_id": team_options[supervisor_name],
+                "item_id": item_options[item_name],
+                "start_date": date_range[0] if len(date_range) > 0 else None,
+                "end_date": date_range[1] if len(date_range) > 1 else None,
+                "dish": dish_filter or None
+            }
+
+            final_grouped_data = repository.get_allocations(**filters, aggregate = True)
+
+            if final_grouped_data is not None:
+
+                final_grouped_data = final_grouped_data[['item', 'quantity', 'unit_of_measurement']]
+
+                col3, col4 = st.columns(2, vertical_alignment = 'bottom')
+                col3.write('**Total Allocation:**')
+                with col4.popover('graph'):
+                    st.bar_chart(
+                        final_grouped_data, x = 'item', y = 'quantity',
+                        horizontal = True, width = 400, height = 250  
+                    )
+                st.dataframe(
+                    final_grouped_data, use_container_width = True,
+                    hide_index = True
+                )      
+                st.divider()
 
-            st.write('**Individual Allocations:**')
-            st.dataframe(
-                data, use_container_width = True,
-                hide_index = True
-            )
+                # keyset pagination: the allocation_id each page starts after, reset when the filters change.
+                if st.session_state.get("allocations_filters") != filters:
+                    st.session_state["allocations_filters"] = filters
+                    st.session_state["allocations_pages"] = [None]
+                pages: list[int | None] = st.session_state["allocations_pages"]
+
+                data = repository.get_allocations(**filters, after = pages[-1], limit = allocations_page_size)
+
+                st.write('**Individual Allocations:**')
+
+                has_next_page: bool = (data is not None) and (len(data) == allocations_page_size)
+
+                if data is not None:
+                    last_allocation_id: int = int(data['allocation_id'].iloc[-1])
+
+                    # remove the unnecessary columns
+                    data.drop(['allocation_id', 'cooking_team_id', 'supervisor_name', 'item_id'], axis = 1, inplace = True)
+                    st.dataframe(
+                        data, use_container_width = True,
+                        hide_index = True
+                    )
+                else:
+                    st.info("No more allocations.")
+
+                col5, col6 = st.columns(2)
+                if col5.button("Previous", disabled = len(pages) == 1, use_container_width = True):
+                    pages.pop()
+                    st.rerun()
+
+                if col6.button("Next", disabled = not has_next_page, use_container_width = True):
+                    pages.append(last_allocation_id)
+                    st.rerun()
+            else:
+                st.error("No Allocation records found")
         else:
             st.error("No Allocation records found")
 
     with bill_entry:
         st.markdown("<p style='text-align: center;'><b>Record Contribution</b></p>", unsafe_allow_html = True)
+
+        if uses_postgres:
+            queue_counts: dict[str, int] = get_write_journal().counts()
+
+            if queue_counts["pending"]:
+                st.warning(f"{queue_counts['pending']} entries saved on this device are waiting for the database.")
+
+            if queue_counts["rejected"]:
+                with st.expander(f"{queue_counts['rejected']} queued entries were refused by the database"):
+                    st.dataframe(get_write_journal().rejected(), hide_index = True, use_container_width = True)
         
-        items_df =  get_all_items()
-        
-        if items_df is not None:
+        if items is not None:
 
             with st.form("bill", clear_on_submit = False):
                 col1, col2 = st.columns(2, vertical_alignment = "bottom", gap = "medium")
@@ -248,12 +485,18 @@ def main() -> None:
 
                 if st.form_submit_button("Submit", use_container_width = True):
                     # st.table(contribution_df)
+                    # checked against the catalog before any database call, the bill is written from the item ids.
+                    contribution_df, line_errors = validate_item_lines(contribution_df, catalog)
+
+                    if not line_errors.empty:
+                        st.error("Please correct these rows, nothing was saved.")
+                        st.dataframe(line_errors, hide_index = True, use_container_width = True)
+                        st.stop()
+
                     if contribution_df.empty:
                         st.error("No items have chosen.")
                         st.stop()
 
-                    bill_exists: bool = is_bill_exists(bill_book_code, bill_id)
-
                     @st.dialog("Bill Exists")
                     def ask_update_or_cancel(
                         bill_book_code: str, bill_id: int,
@@ -263,40 +506,84 @@ def main() -> None:
                     ):
                         st.markdown("<h2 style='text-align:center; color:red;'>Warning</h2>", unsafe_allow_html = True)
                         st.text(f"The bill book code {bill_book_code}, bill id {bill_id} already exists")
-                        col1, col2 = st.columns(2)
+                        st.caption("Replace: the bill keeps only these items. Add: quantities are added to the recorded ones.")
+                        col1, col2, col3 = st.columns(3)
+                        policy: str | None = None
                         
                         if col1.button("Cancel", use_container_width = True):
                             st.info("Transaction Cancelled")
                             time.sleep(0.5)
                             st.rerun()
 
-                        if col2.button("Update", use_container_width = True):
-                            create_new_bill_record(
+                        if col2.button("Replace Items", use_container_width = True):
+                            policy = "replace"
+
+                        if col3.button("Add to Items", use_container_width = True):
+                            policy = "add"
+
+                        if policy is not None:
+                            written = save_bill_record(
+                                repository,
                                 bill_book_code, bill_id, donar_name,
                                 donar_phone_num, 
-                                contribution_df
+                                contribution_df,
+                                policy = policy
                             )
-                            st.info("Transaction Success")
+                            if written is None:
+                                st.warning("Database unreachable, the bill is saved on this device and will be synced.")
+                            else:
+                                changed: int = sum(change["change"] != "unchanged" for change in written[1])
+                                st.info(f"Transaction Success, {changed} items changed")
                             time.sleep(0.5)
                             st.rerun()
                         
 
-                    if bill_exists:
+                    # a new bill is saved in the same round trip as the check, an existing one is left 
+                    # untouched until the user chooses how to merge (offline it is queued as replace).
+                    written: tuple[bool, list[dict]] | None = save_bill_record(
+                        repository,
+                        bill_book_code, bill_id, donar_name,
+                        donar_phone_num, 
+                        contribution_df,
+                        policy = "create"
+                    )
+
+                    if written is not None and not written[0]:
                         ask_update_or_cancel(bill_book_code, bill_id, donar_name,
                             donar_phone_num, 
                             contribution_df)
                     else:
-                        create_new_bill_record(
-                            bill_book_code, bill_id, donar_name,
-                            donar_phone_num, 
-                            contribution_df
-                        )
-                        st.toast("Success")
+                        st.toast("Success" if written is not None else "Saved on this device, will be synced.")
                         time.sleep(0.5)
                         st.rerun()
         else:
             st.error("Items Table is empty. No options to select and add.")
 
+        # the bulk import stages the file with COPY, postgres only.
+        with st.expander("Bulk import bills"):
+            st.caption(f"CSV or Excel file, one item per row with the columns: {', '.join(bill_import_columns)}")
+            bill_file = st.file_uploader("Bill file", type = ["csv", "xlsx", "xls"], disabled = not uses_postgres)
+
+            if bill_file is not None and st.button("Import", use_container_width = True):
+                try:
+                    imported, error_report = import_bills(read_bill_file(bill_file, file_name = bill_file.name))
+                except ValueError as e:
+                    st.error(str(e))
+                except (pg.Error, *offline_errors) as e:
+                    # the whole import is one transaction, nothing was imported.
+                    reason: str = "Database unreachable" if is_offline_error(e) else "Import failed"
+                    st.error(f"{reason}, nothing was imported. Please try again. ({e})")
+                else:
+                    st.info(f"{imported} items imported, {len(error_report)} rows rejected.")
+
+                    if not error_report.empty:
+                        st.dataframe(error_report, hide_index = True, use_container_width = True)
+                        st.download_button(
+                            "Download error report", 
+                            data = error_report.to_csv(index = False), 
+                            file_name = "bill_import_errors.csv"
+                        )
+
 
     with new_allocation_tab:
         st.text("Allocations Tab")
@@ -316,26 +603,160 @@ def main() -> None:
                 )              
                 
                 if st.form_submit_button("Allocate", use_container_width = True):
+                    allocation_lines, line_errors = validate_item_lines(entered_allocation_df, catalog)
 
-                    item_ids: list[int] = entered_allocation_df["items"].str.split("-").str[0].astype(int).tolist()
-                    quantities: list[float | int] = entered_allocation_df["quantity"].tolist()
-                    availability_df = check_for_item_availability(
-                        item_ids = item_ids,
-                        quantites = quantities
-                    )
+                    if not line_errors.empty:
+                        st.error("Please correct these rows, nothing was allocated.")
+                        st.dataframe(line_errors, hide_index = True, use_container_width = True)
 
-                    if not availability_df.empty:
-                        st.error("Some Items not available for requested quantity, See below.")
-                        st.dataframe(availability_df, hide_index = True, use_container_width = True)
-                        print(availability_df)
+                    elif allocation_lines.empty:
+                        st.error("No items have chosen.")
 
                     else:
+                        item_ids: list[int] = allocation_lines["item_id"].tolist()
+                        quantities: list[float | int] = allocation_lines["quantity"].tolist()
                         cooking_team_id = supervisor.split("-")[0]
-                        allocate_items_to_cooking_team(cooking_team_id, item_ids, quantities, dish)
 
-                        st.info('Allocated successfully.')
+                        # stock is checked and reserved in the same transaction as the insert.
+                        write_key: str = uuid.uuid4().hex
+                        try:
+                            allocated, availability_df = repository.allocate_items_to_cooking_team(
+                                cooking_team_id, item_ids, quantities, dish, idempotency_key = write_key
+                            )
+                        except offline_errors as e:
+                            if not (uses_postgres and is_offline_error(e)):
+                                st.error(f"Allocation failed, Please try again. ({e})")
+                                st.stop()
+
+                            queue_allocation(write_key, cooking_team_id, item_ids, quantities, dish)
+                            st.warning("Database unreachable, the allocation is saved on this device and will be synced (the stock is checked then).")
+
+                        else:
+                            if not availability_df.empty:
+                                st.error("Some Items not available for requested quantity, See below.")
+                                st.dataframe(availability_df, hide_index = True, use_container_width = True)
+                                print(availability_df)
+
+                            elif allocated is None:
+                                st.error("Allocation failed, Please try again.")
+
+                            else:
+                                st.info('Allocated successfully.')
                        
 
+    with reports_tab:
+        st.markdown("<b><p style='text-align: center;'>Reports</p></b>", unsafe_allow_html = True)
+
+        if items is not None:
+            # every report is read from the pre aggregated summaries (cached until the next write).
+            report_item_options: dict[str, int | None] = {"ALL": None} | dict(catalog.item_ids_by_name)
+            report_item: str = st.selectbox("Item", list(report_item_options), key = "report_item")
+            report_item_id: int | None = report_item_options[report_item]
+
+            report_data: dict = load_concurrently(
+                flow = partial(repository.get_daily_flow, item_id = report_item_id),
+                top_items = partial(repository.get_contribution_summary, "item", limit = 10),
+                top_donors = partial(repository.get_top_donors, item_id = report_item_id),
+                consumption = partial(repository.get_team_consumption, item_id = report_item_id)
+            )
+
+            st.write("**Donations vs Allocations per day**")
+            st.caption("Quantity of the item" if report_item_id is not None else "Number of items donated / allocated")
+            if report_data["flow"] is not None:
+                st.line_chart(report_data["flow"], x = "day", y = ["inflow", "outflow"])
+            else:
+                st.info("No donations or allocations yet.")
+
+            # ranked by the bills (the quantities are in different units), the chart shows the same measure.
+            st.write("**Top Items** (by bills)")
+            if report_data["top_items"] is not None:
+                top_items_df: pd.DataFrame = report_data["top_items"][["item", "bill_count", "total_quantity", "unit_of_measurement"]]
+                st.bar_chart(top_items_df, x = "item", y = "bill_count", horizontal = True)
+                st.dataframe(top_items_df, hide_index = True, use_container_width = True)
+
+            st.write("**Top Donors**")
+            if report_data["top_donors"] is not None:
+                st.dataframe(report_data["top_donors"], hide_index = True, use_container_width = True)
+
+            st.write("**Consumption per Team**")
+            if report_data["consumption"] is not None:
+                consumption_df: pd.DataFrame = report_data["consumption"].drop("item_id", axis = 1)
+                measure: str = "total_quantity" if report_item_id is not None else "allocation_count"
+                st.bar_chart(
+                    consumption_df.groupby("supervisor_name", as_index = False)[measure].sum(), 
+                    x = "supervisor_name", y = measure, horizontal = True
+                )
+                st.dataframe(consumption_df, hide_index = True, use_container_width = True)
+        else:
+            st.error("No Items found in the database.")
+
+    with diagnostics_tab:
+        st.markdown("<b><p style='text-align: center;'>Diagnostics</p></b>", unsafe_allow_html = True)
+
+        if not uses_postgres:
+            st.info("Diagnostics are available with the postgres storage backend.")
+
+        elif not st.session_state.get("diagnostics_unlocked", False):
+            with st.form("diagnostics_login", border = True):
+                username: str = st.text_input("Admin Username")
+                password: str = st.text_input("Admin Password", type = "password")
+
+                if st.form_submit_button("Show Diagnostics"):
+                    if username == get_settings().admin_username and password == get_settings().admin_password:
+                        st.session_state["diagnostics_unlocked"] = True
+                        st.rerun()
+                    else:
+                        st.error("Invalid Credentials.")
+        else:
+            # statistics of this server process (every session), since it started or the last reset.
+            query_stats = get_query_stats()
+            pool_metrics: dict = get_db().metrics()
+            query_cache = get_query_cache()
+
+            st.write("**Connection Pool**")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("In use", f"{pool_metrics['in_use']} / {pool_metrics['max_size']}")
+            col2.metric("Peak in use", pool_metrics["peak_in_use"])
+            col3.metric("Avg wait", f"{pool_metrics['avg_wait_ms']:.1f} ms")
+            col4.metric("Timeouts", pool_metrics["timeouts"])
+            st.caption(
+                f"Query cache: {query_cache.hits} hits, {query_cache.misses} misses. "
+                f"Slow query threshold: {query_stats.slow_query_threshold} s."
+            )
+
+            st.write("**Queries per Operation**")
+            summary_df: pd.DataFrame = query_stats.summary()
+            if not summary_df.empty:
+                st.dataframe(summary_df, hide_index = True, use_container_width = True)
+
+                operation: str = st.selectbox("Latency histogram of", summary_df["operation"], key = "diagnostics_operation")
+                histogram_df: pd.DataFrame = query_stats.histogram(operation)
+                st.dataframe(
+                    histogram_df, hide_index = True, use_container_width = True,
+                    column_config = {
+                        "statements": st.column_config.ProgressColumn(
+                            "Statements", format = "%d", min_value = 0, 
+                            max_value = max(int(histogram_df["statements"].max()), 1)
+                        )
+                    }
+                )
+            else:
+                st.info("No queries recorded yet.")
+
+            st.write("**Slow Queries**")
+            slow_queries: list[dict] = query_stats.slow_queries()
+            if not slow_queries:
+                st.info("No slow queries recorded.")
+            for slow_query in slow_queries:
+                with st.expander(f"{slow_query['at']:%H:%M:%S}  {slow_query['operation']}  {slow_query['duration_ms']} ms"):
+                    st.code(slow_query["statement"], language = "sql")
+                    if slow_query["plan"] is not None:
+                        st.json(slow_query["plan"], expanded = False)
+
+            if st.button("Reset statistics"):
+                query_stats.reset()
+                st.rerun()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,117 @@
+"""
+    Per call latency of the prepared statements against their plain text form.
+
+    The helpers using `main.prepared_statements` (get_particular_contribution, is_bill_exists,
+    get_inventory, get_all_items) are called once so their statements get registered. Then, on one
+    pooled connection, every registered statement is executed `--iterations` times as plain text
+    (parsed and planned by postgres on every call) and as `execute <name>` (prepared once), and the
+    helpers themselves are timed end to end with `prepare_statements` off and on (query cache cleared
+    before every call). The bill used is sampled from the database filled by `benchmarks.generate_data`.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_prepared --iterations 2000
+"""
+
+import argparse
+import random
+import statistics
+import time
+from functools import partial
+from typing import Any, Callable
+
+import pandas as pd
+
+import main
+
+
+def latencies_ms(call: Callable[[], Any], iterations: int, before: Callable[[], Any] | None = None) -> list[float]:
+
+    latencies: list[float] = []
+
+    for _ in range(iterations):
+        if before is not None:
+            before()
+
+        started_at: float = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started_at) * 1000)
+
+    return latencies
+
+
+def describe(latencies: list[float]) -> dict[str, float]:
+
+    latencies = sorted(latencies)
+
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3)
+    }
+
+
+def run() -> None:
+
+    parser = argparse.ArgumentParser(description = "Prepared statements against plain statements.")
+    parser.add_argument("--iterations", type = int, default = 1000, help = "Calls per statement and mode.")
+    parser.add_argument("--seed", type = int, default = 42, help = "Seed of the sampled bill.")
+    args = parser.parse_args()
+
+    with main.get_db().cursor() as cur:
+        cur.execute("select bill_book_code, bill_id from bill_books;")
+        bills: list[dict] = cur.fetchall()
+
+    if not bills:
+        raise SystemExit("No data to benchmark, run `python -m benchmarks.generate_data` first.")
+
+    bill: dict = random.Random(args.seed).choice(bills)
+    vars: dict = {"bill_book_code": bill["bill_book_code"], "bill_id": bill["bill_id"]}
+
+    helpers: dict[str, Callable[[], Any]] = {
+        "get_particular_contribution": partial(main.get_particular_contribution, **vars),
+        "is_bill_exists": partial(main.is_bill_exists, **vars),
+        "get_inventory": main.get_inventory,
+        "get_all_items": main.get_all_items
+    }
+    for helper in helpers.values():
+        helper() # registers the statements.
+
+    rows: list[dict] = []
+
+    # the statements alone, on one connection.
+    with main.get_db().cursor(cursor_factory = main.InstrumentedCursor) as cur:
+        for name, sql in main.prepared_statements.names().items():
+            for mode, call in (
+                ("plain", lambda: cur.execute(sql, vars = vars)),
+                ("prepared", lambda: main.prepared_statements.execute(cur, sql, vars = vars))
+            ):
+                call() # warm up (prepares on this connection).
+                rows.append({
+                    "case": f"statement {name}", "mode": mode,
+                    **describe(latencies_ms(lambda: (call(), cur.fetchall()), args.iterations))
+                })
+
+    # the helpers end to end, cache cleared before every call.
+    settings = main.get_settings()
+    for name, helper in helpers.items():
+        for prepare in (False, True):
+            settings.prepare_statements = prepare
+            rows.append({
+                "case": name, "mode": "prepared" if prepare else "plain",
+                **describe(latencies_ms(helper, args.iterations, before = main.get_query_cache().clear))
+            })
+
+    results = pd.DataFrame(rows).set_index(["case", "mode"])
+    print(results.to_string())
+
+    for case, modes in results.groupby(level = "case"):
+        plain, prepared = modes.loc[(case, "plain"), "p50_ms"], modes.loc[(case, "prepared"), "p50_ms"]
+        print(f"{case}: p50 {plain} -> {prepared} ms ({(prepared - plain) / plain:+.0%})")
+
+    print()
+    for name, sql in main.prepared_statements.names().items():
+        print(f"{name}: {' '.join(sql.split())[:120]}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,107 @@
+"""
+    Benchmark of the select result decoding in `main.execute_sql_select_query`.
+
+    Compares the previous pipeline (RealDictCursor rows -> DataFrame of dicts -> per cell Decimal to float)
+    with the current one (NUMERIC decoded to float by the driver -> DataFrame built column wise from tuples).
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_result_decoding --rows 100000
+        python -m benchmarks.bench_result_decoding --source allocations
+"""
+
+import argparse
+import time
+from decimal import Decimal
+
+import pandas as pd
+import psycopg2 as pg
+from psycopg2.extras import RealDictCursor
+
+import main
+
+
+# Same shape as the allocations table, so the benchmark does not depend on the data loaded.
+synthetic_allocations_sql: str = """
+    select
+        g as allocation_id,
+        (g %% 40) + 1 as cooking_team_id,
+        (g %% 250) + 1 as item_id,
+        round((random() * 25)::numeric, 2) as quantity,
+        now() - g * interval '1 second' as allocated_at,
+        'dish ' || (g %% 30) as dish
+    from
+        generate_series(1, %(rows)s) as g
+    ;
+"""
+
+allocations_sql: str = """
+    select
+        *
+    from
+        allocations
+    limit
+        %(rows)s
+    ;
+"""
+
+
+def decode_previous(sql: str, vars: dict) -> pd.DataFrame:
+
+    "The decoding pipeline used before: dict rows and a python level call per cell."
+
+    with main.db.cursor(cursor_factory = RealDictCursor) as cur:
+        pg.extensions.register_type(pg.extensions.DECIMAL, cur) # numeric back to Decimal for this cursor only.
+        cur.execute(sql, vars = vars)
+        data: list[dict] = cur.fetchall()
+
+    df = pd.DataFrame(data)
+    df = df.map(lambda x: float(x) if isinstance(x, Decimal) else x)
+
+    return df
+
+
+def decode_current(sql: str, vars: dict) -> pd.DataFrame:
+
+    return main.execute_sql_select_query(sql, vars = vars)
+
+
+def measure(decode, sql: str, vars: dict, repeat: int) -> tuple[int, float]:
+
+    "Returns the row count and the best wall time over `repeat` runs."
+
+    best: float = float("inf")
+    row_count: int = 0
+
+    for _ in range(repeat):
+        started_at: float = time.perf_counter()
+        df = decode(sql, vars)
+        best = min(best, time.perf_counter() - started_at)
+        row_count = 0 if df is None else len(df)
+
+    return (row_count, best)
+
+
+def run() -> None:
+
+    parser = argparse.ArgumentParser(description = "Rows/sec of the select result decoding.")
+    parser.add_argument("--rows", type = int, default = 100_000, help = "Rows to fetch.")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Runs per pipeline, the best one is reported.")
+    parser.add_argument(
+        "--source", choices = ["synthetic", "allocations"], default = "synthetic",
+        help = "synthetic: generated rows shaped like allocations, allocations: the real table."
+    )
+    args = parser.parse_args()
+
+    sql: str = synthetic_allocations_sql if args.source == "synthetic" else allocations_sql
+    vars: dict = {"rows": args.rows}
+
+    print(f"Decoding up to {args.rows} {args.source} rows, best of {args.repeat} runs")
+
+    for name, decode in (("previous", decode_previous), ("current", decode_current)):
+        row_count, seconds = measure(decode, sql, vars, args.repeat)
+        rows_per_second: float = row_count / seconds if seconds else 0.0
+        print(f"{name:>10}: {row_count} rows in {seconds:.3f} s -> {rows_per_second:,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,70 @@
+"""
+    Startup benchmark: time to import main.py (and app.py) in a fresh interpreter.
+
+    Importing must stay side-effect free: no settings read, no database connection, no DDL.
+    The check fails (exit code 1) if an import exceeds the time budget or creates the app context.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_startup --budget 1.5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+# run in a fresh interpreter so that nothing is already imported.
+import_script: str = """
+import time
+started_at = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started_at
+import main
+print(elapsed, main._app_context is not None)
+"""
+
+
+def measure_import(module: str) -> tuple[float, bool]:
+
+    "Returns the import time of the module in seconds and whether the import created the app context."
+
+    completed = subprocess.run(
+        [sys.executable, "-c", import_script.format(module = module)],
+        capture_output = True, text = True, check = True
+    )
+    elapsed, context_created = completed.stdout.split()
+
+    return (float(elapsed), context_created == "True")
+
+
+def run() -> None:
+
+    parser = argparse.ArgumentParser(description = "Import time budget of main.py and app.py.")
+    parser.add_argument("--budget", type = float, default = 1.5, help = "Maximum median import time in seconds.")
+    parser.add_argument("--repeat", type = int, default = 5, help = "Fresh interpreters per module.")
+    args = parser.parse_args()
+
+    failed: bool = False
+
+    for module in ("main", "app"):
+        results: list[tuple[float, bool]] = [measure_import(module) for _ in range(args.repeat)]
+        median: float = statistics.median(elapsed for elapsed, _ in results)
+        context_created: bool = any(created for _, created in results)
+
+        status: str = "ok"
+        if median > args.budget:
+            status = f"over budget ({args.budget:.2f} s)"
+            failed = True
+        if context_created:
+            status = "import created the app context (settings/database touched)"
+            failed = True
+
+        print(f"import {module:<5} median {median:.3f} s, max {max(elapsed for elapsed, _ in results):.3f} s -> {status}")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,262 @@
+"""
+    Benchmark suite of the public functions of main.py and of the app.py page render.
+
+    Every case is called `--iterations` times by each of `--sessions` concurrent threads (simulated
+    sessions) against the database configured in `.env`, filled with `benchmarks.generate_data`.
+    The query cache is cleared before every call unless `--warm-cache` is given, so the database
+    path is measured. The latencies (p50, p95, max) and the throughput are printed, and compared with
+    a saved baseline: a case whose p50 grew by more than `--tolerance` is a regression (exit code 1).
+
+    Write cases (bill entry, allocation) change the data, they only run with `--include-writes`.
+    The page render uses streamlit's AppTest and runs the whole app.py script once per call.
+
+    Usage (from the repository root):
+        python -m benchmarks.generate_data --reset
+        python -m benchmarks.bench_suite --sessions 8 --save-baseline benchmarks/baseline.json
+        python -m benchmarks.bench_suite --sessions 8 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable
+
+import pandas as pd
+
+import main
+from benchmarks.generate_data import table_counts
+
+
+# bill used by the write cases, outside the books of the generator (B1 .. B<books>).
+bench_bill_book_code: str = "B0"
+
+
+def sample_arguments(seed: int) -> dict[str, Any]:
+
+    "Picks an existing bill, item and cooking team for the cases."
+
+    sample: random.Random = random.Random(seed)
+
+    with main.get_db().cursor() as cur:
+        cur.execute(
+            "select bill_book_code, bill_id, donar_name, donar_phone_num from bill_books where bill_book_code <> %s;",
+            (bench_bill_book_code,)
+        )
+        bills: list[dict] = cur.fetchall()
+        cur.execute("select id from items order by id;")
+        item_ids: list[int] = [row["id"] for row in cur.fetchall()]
+        cur.execute("select id from cooking_teams order by id;")
+        team_ids: list[int] = [row["id"] for row in cur.fetchall()]
+
+    if not (bills and item_ids and team_ids):
+        raise SystemExit("No data to benchmark, run `python -m benchmarks.generate_data` first.")
+
+    bill: dict = sample.choice(bills)
+
+    return {
+        "bill_book_code": bill["bill_book_code"],
+        "bill_id": bill["bill_id"],
+        "donor_name": bill["donar_name"],
+        "donor_phone": bill["donar_phone_num"],
+        "item_id": sample.choice(item_ids),
+        "item_ids": sample.sample(item_ids, min(3, len(item_ids))),
+        "cooking_team_id": sample.choice(team_ids)
+    }
+
+
+def render_page() -> None:
+
+    "Runs the whole app.py script once, like a new session opening the page."
+
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file("app.py", default_timeout = 60)
+    app.run()
+
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+
+def build_cases(arguments: dict[str, Any], include_writes: bool, include_page: bool) -> dict[str, Callable[[], Any]]:
+
+    "Name -> function without arguments."
+
+    cases: dict[str, Callable[[], Any]] = {
+        "get_all_items": main.get_all_items,
+        "get_all_cooking_teams": main.get_all_cooking_teams,
+        "get_inventory": main.get_inventory,
+        "get_particular_contribution": partial(
+            main.get_particular_contribution, arguments["bill_book_code"], arguments["bill_id"]
+        ),
+        "is_bill_exists": partial(main.is_bill_exists, arguments["bill_book_code"], arguments["bill_id"]),
+        "get_bill_contributions (book)": partial(main.get_bill_contributions, bill_book_code = arguments["bill_book_code"]),
+        "get_allocations (first page)": partial(main.get_allocations, limit = 50),
+        "get_allocations (item)": partial(main.get_allocations, item_id = arguments["item_id"]),
+        "get_allocations (team, aggregate)": partial(
+            main.get_allocations, cooking_team_id = arguments["cooking_team_id"], aggregate = True
+        ),
+        "get_contribution_summary (donor)": partial(main.get_contribution_summary, "donor", limit = 100),
+        "get_contribution_summary (item)": partial(main.get_contribution_summary, "item"),
+        "search_donors (name)": partial(main.search_donors, (arguments["donor_name"] or "donor")[:6]),
+        "search_donors (phone)": partial(main.search_donors, (arguments["donor_phone"] or "9000")[-6:]),
+        "get_donor_history": partial(main.get_donor_history, arguments["donor_name"], arguments["donor_phone"]),
+        "get_donor_history (aggregate)": partial(
+            main.get_donor_history, arguments["donor_name"], arguments["donor_phone"], aggregate = True
+        ),
+        "get_daily_flow": main.get_daily_flow,
+        "get_top_donors": main.get_top_donors,
+        "get_team_consumption": partial(main.get_team_consumption, item_id = arguments["item_id"]),
+        "verify_inventory_balances": main.verify_inventory_balances,
+    }
+
+    if include_writes:
+        contribution_df: pd.DataFrame = pd.DataFrame({
+            "items": [f"{item_id} - item - Kg" for item_id in arguments["item_ids"]],
+            "quantity": [1.0] * len(arguments["item_ids"])
+        })
+        # the same bill is replaced every time, so repeated runs keep the data size stable.
+        cases["create_new_bill_record"] = partial(
+            main.create_new_bill_record, bench_bill_book_code, 1, "benchmark", "9999999999", contribution_df
+        )
+        cases["allocate_items_to_cooking_team"] = partial(
+            main.allocate_items_to_cooking_team, arguments["cooking_team_id"], arguments["item_ids"][:1], [0.1], "benchmark"
+        )
+
+    if include_page:
+        cases["app.py page render"] = render_page
+
+    return cases
+
+
+def measure(case: Callable[[], Any], sessions: int, iterations: int, warm_cache: bool) -> dict[str, float]:
+
+    "Calls the case `iterations` times from each of `sessions` threads, returns the latency statistics."
+
+    def session() -> list[float]:
+
+        latencies: list[float] = []
+
+        for _ in range(iterations):
+            if not warm_cache:
+                main.get_query_cache().clear()
+
+            started_at: float = time.perf_counter()
+            case()
+            latencies.append(time.perf_counter() - started_at)
+
+        return latencies
+
+    case() # warm up (connections, statement parsing).
+
+    started_at: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = sessions) as executor:
+        latencies: list[float] = [
+            latency for result in [executor.submit(session) for _ in range(sessions)] for latency in result.result()
+        ]
+    elapsed: float = time.perf_counter() - started_at
+
+    latencies_ms: list[float] = sorted(latency * 1000 for latency in latencies)
+
+    return {
+        "calls": len(latencies_ms),
+        "p50_ms": round(statistics.median(latencies_ms), 3),
+        "p95_ms": round(latencies_ms[min(int(len(latencies_ms) * 0.95), len(latencies_ms) - 1)], 3),
+        "max_ms": round(latencies_ms[-1], 3),
+        "calls_per_second": round(len(latencies_ms) / elapsed, 1)
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict, tolerance: float, noise_floor_ms: float) -> list[str]:
+
+    "Returns the names of the cases whose p50 regressed against the baseline."
+
+    regressions: list[str] = []
+
+    for name, result in results.items():
+        previous: dict | None = baseline["cases"].get(name)
+
+        if previous is None:
+            result["change"] = "new"
+            continue
+
+        change: float = (result["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] if previous["p50_ms"] else 0.0
+        result["change"] = f"{change:+.0%}"
+
+        if change > tolerance and result["p50_ms"] - previous["p50_ms"] > noise_floor_ms:
+            result["change"] += " REGRESSION"
+            regressions.append(name)
+
+    return regressions
+
+
+def run() -> None:
+
+    parser = argparse.ArgumentParser(description = "Latency of the main.py functions and of the page render.")
+    parser.add_argument("--sessions", type = int, default = 4, help = "Concurrent simulated sessions (threads).")
+    parser.add_argument("--iterations", type = int, default = 20, help = "Calls per session and case.")
+    parser.add_argument("--seed", type = int, default = 42, help = "Seed of the sampled bill, item and team.")
+    parser.add_argument("--only", nargs = "*", default = None, help = "Run only the cases whose name contains one of these.")
+    parser.add_argument("--warm-cache", action = "store_true", help = "Keep the query cache between calls.")
+    parser.add_argument("--include-writes", action = "store_true", help = "Also run the write cases (they change the data).")
+    parser.add_argument("--skip-page", action = "store_true", help = "Skip the app.py page render.")
+    parser.add_argument("--baseline", default = None, help = "Baseline json to compare with.")
+    parser.add_argument("--save-baseline", default = None, help = "Save the results as the baseline json.")
+    parser.add_argument("--tolerance", type = float, default = 0.20, help = "Allowed p50 growth before a regression.")
+    parser.add_argument("--noise-floor", type = float, default = 1.0, help = "p50 growth in ms always tolerated.")
+    args = parser.parse_args()
+
+    arguments: dict[str, Any] = sample_arguments(args.seed)
+    counts: dict[str, int] = table_counts()
+    cases: dict[str, Callable[[], Any]] = build_cases(arguments, args.include_writes, not args.skip_page)
+
+    if args.only:
+        cases = {name: case for name, case in cases.items() if any(part in name for part in args.only)}
+
+    print(f"Data: {', '.join(f'{table} {count:,}' for table, count in counts.items())}")
+    print(f"{args.sessions} sessions x {args.iterations} calls per case, {'warm' if args.warm_cache else 'cold'} query cache\n")
+
+    results: dict[str, dict] = {}
+
+    for name, case in cases.items():
+        results[name] = measure(case, args.sessions, args.iterations, args.warm_cache)
+
+    regressions: list[str] = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline: dict = json.load(file)
+
+        if (baseline["sessions"], baseline["warm_cache"], baseline["data"]) != (args.sessions, args.warm_cache, counts):
+            print("Note: the baseline was recorded with other sessions, cache mode or data, the comparison is indicative.\n")
+
+        regressions = compare(results, baseline, args.tolerance, args.noise_floor)
+
+    print(pd.DataFrame.from_dict(results, orient = "index").to_string())
+
+    if args.save_baseline:
+        baseline = {
+            "created_at": datetime.now().isoformat(timespec = "seconds"),
+            "sessions": args.sessions,
+            "iterations": args.iterations,
+            "warm_cache": args.warm_cache,
+            "data": counts,
+            "cases": {
+                name: {key: value for key, value in result.items() if key != "change"}
+                for name, result in results.items()
+            }
+        }
+        with open(args.save_baseline, "w") as file:
+            json.dump(baseline, file, indent = 2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    run()
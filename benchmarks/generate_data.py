@@ -0,0 +1,196 @@
+"""
+    Synthetic festival scale data for the benchmarks.
+
+    Fills `items`, `cooking_teams`, `bill_books`, `transactions` and `allocations` of the database
+    configured in `.env` (use a local benchmark database, never the live one), then rebuilds the
+    inventory balances and the summaries. The data is generated by postgres itself
+    (generate_series), so a full festival loads in seconds. The same seed gives the same data.
+
+    The tables must be empty, `--reset` empties them first (all their rows are deleted).
+
+    Usage (from the repository root):
+        python -m benchmarks.generate_data --books 100 --bills-per-book 500 --allocations 200000
+        python -m benchmarks.generate_data --reset --books 10 --bills-per-book 50 --allocations 5000
+"""
+
+import argparse
+import time
+from datetime import date
+
+import main
+
+
+data_tables: tuple[str, ...] = ("items", "cooking_teams", "bill_books", "transactions", "allocations")
+
+reset_sql: str = f"""
+    truncate {", ".join(data_tables + main.contribution_summary_tables + main.allocation_summary_tables)},
+        inventory_balances
+    restart identity;
+"""
+
+# every bill gets between 1 and `max_items_per_bill` distinct items, donors come back across bills
+# (same name and phone number), the timestamps are spread over the festival days.
+generate_sql: str = """
+    select setseed(%(seed)s);
+
+    insert into items
+        (name, unit_of_measurement)
+    select
+        'item ' || g,
+        (array['Kg', 'L', 'Nos'])[1 + g %% 3]
+    from
+        generate_series(1, %(items)s) as g
+    ;
+
+    insert into cooking_teams
+        (supervisor_name, supervisor_phone_num)
+    select
+        'supervisor ' || g,
+        (8000000000 + g)::text
+    from
+        generate_series(1, %(teams)s) as g
+    ;
+
+    create temporary table generated_bills on commit drop as
+    select
+        'B' || book as bill_book_code,
+        bill as bill_id,
+        1 + floor(random() * %(donors)s)::int as donor,
+        1 + floor(random() * %(max_items_per_bill)s)::int as item_count,
+        floor(random() * %(items)s)::int as first_item,
+        %(start)s::timestamp + random() * %(days)s * interval '1 day' as donated_at
+    from
+        generate_series(1, %(books)s) as book,
+        generate_series(1, %(bills_per_book)s) as bill
+    ;
+
+    insert into bill_books
+        (bill_book_code, bill_id, donar_name, donar_phone_num)
+    select
+        bill_book_code, bill_id, 'donor ' || donor, (9000000000 + donor)::text
+    from
+        generated_bills
+    ;
+
+    with item_ids as (
+        select array_agg(id order by id) as ids from items
+    )
+    insert into transactions
+        (bill_book_code, bill_id, item_id, quantity, donated_at)
+    select
+        b.bill_book_code,
+        b.bill_id,
+        -- the items of a bill are spread `items / max_items_per_bill` apart, so they are distinct.
+        i.ids[1 + (b.first_item + k * (%(items)s / %(max_items_per_bill)s)) %% %(items)s],
+        round((0.5 + random() * 20)::numeric, 1),
+        b.donated_at
+    from
+        generated_bills as b
+        cross join item_ids as i
+        cross join lateral generate_series(0, b.item_count - 1) as k
+    ;
+
+    with ids as (
+        select
+            (select array_agg(id order by id) from items) as item_ids,
+            (select array_agg(id order by id) from cooking_teams) as team_ids
+    )
+    insert into allocations
+        (cooking_team_id, item_id, quantity, dish, allocated_at)
+    select
+        ids.team_ids[1 + floor(random() * %(teams)s)::int],
+        ids.item_ids[1 + floor(random() * %(items)s)::int],
+        round((0.1 + random() * 2)::numeric, 1),
+        'dish ' || (1 + g %% 30),
+        %(start)s::timestamp + random() * %(days)s * interval '1 day'
+    from
+        ids, generate_series(1, %(allocations)s) as g
+    ;
+"""
+
+
+def table_counts() -> dict[str, int]:
+
+    "Returns the row count of every data table."
+
+    counts_sql: str = " union all ".join(
+        f"select '{table}' as table_name, count(*) as row_count from {table}" for table in data_tables
+    )
+
+    with main.get_db().cursor() as cur:
+        cur.execute(counts_sql)
+        return {row["table_name"]: row["row_count"] for row in cur.fetchall()}
+
+
+def generate(
+        books: int,
+        bills_per_book: int,
+        max_items_per_bill: int,
+        items: int,
+        teams: int,
+        donors: int,
+        allocations: int,
+        start: date,
+        days: int,
+        seed: float
+) -> dict[str, int]:
+
+    "Loads the synthetic data in one transaction, rebuilds the derived tables, returns the row counts."
+
+    if max_items_per_bill > items:
+        raise ValueError("max_items_per_bill cannot exceed items (the items of a bill are distinct).")
+
+    with main.get_db().cursor() as cur:
+        cur.execute(generate_sql, vars = {
+            "books": books, "bills_per_book": bills_per_book, "max_items_per_bill": max_items_per_bill,
+            "items": items, "teams": teams, "donors": donors, "allocations": allocations,
+            "start": start, "days": days, "seed": seed
+        })
+
+    main.rebuild_inventory_balances()
+    main.rebuild_contribution_summaries()
+    main.rebuild_allocation_summaries()
+
+    return table_counts()
+
+
+def run() -> None:
+
+    parser = argparse.ArgumentParser(description = "Fill the database with synthetic festival data.")
+    parser.add_argument("--books", type = int, default = 100, help = "Bill books (B1, B2, ...).")
+    parser.add_argument("--bills-per-book", type = int, default = 500, help = "Bills in every book.")
+    parser.add_argument("--max-items-per-bill", type = int, default = 4, help = "Items donated per bill (1 to this).")
+    parser.add_argument("--items", type = int, default = 250, help = "Distinct items.")
+    parser.add_argument("--teams", type = int, default = 40, help = "Cooking teams.")
+    parser.add_argument("--donors", type = int, default = 20_000, help = "Distinct donors the bills are drawn from.")
+    parser.add_argument("--allocations", type = int, default = 200_000, help = "Allocations to cooking teams.")
+    parser.add_argument("--start", type = date.fromisoformat, default = date(2024, 4, 12), help = "First festival day.")
+    parser.add_argument("--days", type = int, default = 12, help = "Festival days.")
+    parser.add_argument("--seed", type = float, default = 0.42, help = "Random seed (-1 to 1).")
+    parser.add_argument("--reset", action = "store_true", help = "Delete all the rows of the data tables first.")
+    args = parser.parse_args()
+
+    main.migrate_db()
+
+    if args.reset:
+        with main.get_db().cursor() as cur:
+            cur.execute(reset_sql)
+
+    existing: dict[str, int] = {table: count for table, count in table_counts().items() if count}
+    if existing:
+        raise SystemExit(f"The tables are not empty ({existing}), run with --reset to replace their rows.")
+
+    started_at: float = time.perf_counter()
+    counts: dict[str, int] = generate(
+        books = args.books, bills_per_book = args.bills_per_book, max_items_per_bill = args.max_items_per_bill,
+        items = args.items, teams = args.teams, donors = args.donors, allocations = args.allocations,
+        start = args.start, days = args.days, seed = args.seed
+    )
+
+    print(f"Generated in {time.perf_counter() - started_at:.1f} s")
+    for table, count in counts.items():
+        print(f"{table:>15}: {count:,} rows")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,286 @@
+"""
+    Load test: concurrent volunteers at the Bill Entry and Allocations forms.
+
+    Every simulated volunteer is a thread looping over a weighted mix of actions: saving a bill
+    (`create_new_bill_record`), allocating to a cooking team (`allocate_items_to_cooking_team`) and
+    the reads of the page (inventory, a bill, the allocations). The number of volunteers is ramped
+    stage by stage, each stage running for `--duration` seconds. For every stage it reports the
+    throughput, the p50/p99 latency per action, the pool exhaustion errors (PoolTimeout), the
+    constraint failures (IntegrityError), the rejected allocations (not enough stock), the other
+    errors, the peak pool usage and the peak number of sessions waiting on a row/table lock.
+
+    Bills are written to the books `LT1` .. `LT<--books>` with a small bill range, so volunteers
+    regularly hit the same bill (an upsert race), and allocations draw on `--hot-items` items, so they
+    queue on the same balance rows. Run it against a benchmark database filled with
+    `benchmarks.generate_data`, it adds bills and allocations.
+
+    Usage (from the repository root):
+        python -m benchmarks.load_test --ramp 1 4 8 16 32 --duration 20
+        python -m benchmarks.load_test --ramp 8 16 32 64 --pool-size 12 --pool-timeout 2
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+import pandas as pd
+import psycopg2 as pg
+
+import main
+
+
+lock_waits_sql: str = """
+    select
+        count(*)
+    from
+        pg_stat_activity
+    where
+        datname = current_database()
+        and wait_event_type = 'Lock'
+    ;
+"""
+
+
+class LockWaitSampler:
+
+    "Samples (on its own connection, outside the pool) the sessions waiting on a lock."
+
+    def __init__(self, interval: float = 0.2) -> None:
+
+        self.interval: float = interval
+        self.peak: int = 0
+        self._stopped: threading.Event = threading.Event()
+        self._thread: threading.Thread = threading.Thread(target = self._run, name = "lock-wait-sampler", daemon = True)
+
+    def _run(self) -> None:
+
+        conn: pg.extensions.connection = main.get_db().open_dedicated_connection()
+        conn.autocommit = True
+
+        try:
+            with conn.cursor(cursor_factory = pg.extensions.cursor) as cur:
+                while not self._stopped.wait(self.interval):
+                    cur.execute(lock_waits_sql)
+                    self.peak = max(self.peak, cur.fetchone()[0])
+        finally:
+            conn.close()
+
+    def __enter__(self) -> "LockWaitSampler":
+
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+
+        self._stopped.set()
+        self._thread.join()
+
+
+def build_actions(args: argparse.Namespace) -> tuple[list[str], list[float], dict[str, Callable[[random.Random], str]]]:
+
+    "Returns the action names, their weights and name -> function(random) returning the outcome."
+
+    with main.get_db().cursor() as cur:
+        cur.execute("select id from items order by id;")
+        item_ids: list[int] = [row["id"] for row in cur.fetchall()]
+        cur.execute("select id from cooking_teams order by id;")
+        team_ids: list[int] = [row["id"] for row in cur.fetchall()]
+        cur.execute("select bill_book_code, bill_id from bill_books limit 1000;")
+        bills: list[dict] = cur.fetchall()
+
+    if not (item_ids and team_ids and bills):
+        raise SystemExit("No data to load, run `python -m benchmarks.generate_data` first.")
+
+    hot_item_ids: list[int] = item_ids[:args.hot_items]
+
+    def save_bill(rng: random.Random) -> str:
+
+        bill_item_ids: list[int] = rng.sample(item_ids, rng.randint(1, 4))
+        contribution_df: pd.DataFrame = pd.DataFrame({
+            "items": [f"{item_id} - item - Kg" for item_id in bill_item_ids],
+            "quantity": [round(rng.uniform(0.5, 20), 1) for _ in bill_item_ids]
+        })
+        main.create_new_bill_record(
+            f"LT{rng.randint(1, args.books)}", rng.randint(1, args.bills_per_book),
+            f"volunteer donor {rng.randint(1, 500)}", f"{rng.randint(6000000000, 9999999999)}",
+            contribution_df, policy = rng.choice(["replace", "add"])
+        )
+        return "ok"
+
+    def allocate(rng: random.Random) -> str:
+
+        allocation_item_ids: list[int] = rng.sample(hot_item_ids, rng.randint(1, min(3, len(hot_item_ids))))
+        allocated, shortfall_df = main.allocate_items_to_cooking_team(
+            rng.choice(team_ids), allocation_item_ids, [0.1] * len(allocation_item_ids), "load test"
+        )
+        if not shortfall_df.empty:
+            return "rejected"
+        return "ok" if allocated is not None else "error"
+
+    def read_inventory(rng: random.Random) -> str:
+
+        main.get_inventory()
+        return "ok"
+
+    def read_bill(rng: random.Random) -> str:
+
+        bill: dict = rng.choice(bills)
+        main.get_particular_contribution(bill["bill_book_code"], bill["bill_id"])
+        return "ok"
+
+    def read_allocations(rng: random.Random) -> str:
+
+        main.get_allocations(item_id = rng.choice(hot_item_ids), limit = 50)
+        return "ok"
+
+    actions: dict[str, Callable[[random.Random], str]] = {
+        "save_bill": save_bill,
+        "allocate": allocate,
+        "read_inventory": read_inventory,
+        "read_bill": read_bill,
+        "read_allocations": read_allocations
+    }
+    weights: list[float] = [args.bill_weight, args.allocation_weight, args.read_weight / 3, args.read_weight / 3, args.read_weight / 3]
+
+    return (list(actions), weights, actions)
+
+
+def run_stage(
+        volunteers: int,
+        duration: float,
+        names: list[str],
+        weights: list[float],
+        actions: dict[str, Callable[[random.Random], str]],
+        seed: int
+) -> tuple[list[tuple[str, float, str]], float, int]:
+
+    "Runs the volunteers for `duration` seconds, returns (action, seconds, outcome) per call, the wall time and the peak lock waits."
+
+    samples: list[tuple[str, float, str]] = []
+    samples_lock: threading.Lock = threading.Lock()
+    deadline: float = time.perf_counter() + duration
+
+    def volunteer(number: int) -> None:
+
+        rng: random.Random = random.Random(seed * 1000 + number)
+        local_samples: list[tuple[str, float, str]] = []
+
+        while time.perf_counter() < deadline:
+            name: str = rng.choices(names, weights)[0]
+            started_at: float = time.perf_counter()
+
+            try:
+                outcome: str = actions[name](rng)
+            except main.PoolTimeout:
+                outcome = "pool_timeout"
+            except pg.IntegrityError:
+                outcome = "constraint"
+            except Exception:
+                outcome = "error"
+
+            local_samples.append((name, time.perf_counter() - started_at, outcome))
+
+        with samples_lock:
+            samples.extend(local_samples)
+
+    threads: list[threading.Thread] = [
+        threading.Thread(target = volunteer, args = (number,), name = f"volunteer-{number}") for number in range(volunteers)
+    ]
+
+    started_at: float = time.perf_counter()
+    with LockWaitSampler() as lock_waits:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return (samples, time.perf_counter() - started_at, lock_waits.peak)
+
+
+def summarize(samples: list[tuple[str, float, str]], elapsed: float) -> pd.DataFrame:
+
+    "One row per action: calls, throughput, p50/p99 latency and the outcome counts."
+
+    df = pd.DataFrame(samples, columns = ["action", "seconds", "outcome"])
+    df["ms"] = df["seconds"] * 1000
+
+    summary = df.groupby("action").agg(
+        calls = ("ms", "size"),
+        p50_ms = ("ms", "median"),
+        p99_ms = ("ms", lambda ms: ms.quantile(0.99))
+    )
+    summary["per_second"] = summary["calls"] / elapsed
+    outcomes = pd.crosstab(df["action"], df["outcome"])
+
+    return summary.join(outcomes).fillna(0).round(1)
+
+
+def run() -> None:
+
+    parser = argparse.ArgumentParser(description = "Ramp concurrent bill entry / allocation volunteers.")
+    parser.add_argument("--ramp", type = int, nargs = "+", default = [1, 4, 8, 16, 32], help = "Volunteers per stage.")
+    parser.add_argument("--duration", type = float, default = 20.0, help = "Seconds per stage.")
+    parser.add_argument("--bill-weight", type = float, default = 0.35, help = "Share of bill saves.")
+    parser.add_argument("--allocation-weight", type = float, default = 0.15, help = "Share of allocations.")
+    parser.add_argument("--read-weight", type = float, default = 0.5, help = "Share of page reads.")
+    parser.add_argument("--books", type = int, default = 5, help = "Bill books written to (LT1 ..).")
+    parser.add_argument("--bills-per-book", type = int, default = 200, help = "Bill ids written to per book.")
+    parser.add_argument("--hot-items", type = int, default = 5, help = "Items the allocations draw on.")
+    parser.add_argument("--pool-size", type = int, default = None, help = "Overrides db_pool_max_size.")
+    parser.add_argument("--pool-timeout", type = float, default = None, help = "Overrides db_pool_timeout (seconds).")
+    parser.add_argument("--seed", type = int, default = 42, help = "Seed of the volunteers' choices.")
+    args = parser.parse_args()
+
+    # the settings are read when the app context is created (first use), so the overrides apply.
+    if args.pool_size is not None:
+        os.environ["DB_POOL_MAX_SIZE"] = str(args.pool_size)
+    if args.pool_timeout is not None:
+        os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+
+    names, weights, actions = build_actions(args)
+    pool_settings = main.get_settings()
+    print(f"Pool: max {pool_settings.db_pool_max_size} connections, checkout timeout {pool_settings.db_pool_timeout} s\n")
+
+    stages: list[dict[str, Any]] = []
+
+    for volunteers in args.ramp:
+        before: dict = main.get_db().metrics()
+        samples, elapsed, peak_lock_waits = run_stage(volunteers, args.duration, names, weights, actions, args.seed)
+        after: dict = main.get_db().metrics()
+
+        summary: pd.DataFrame = summarize(samples, elapsed)
+        outcomes: dict[str, int] = defaultdict(int)
+        for _, _, outcome in samples:
+            outcomes[outcome] += 1
+
+        print(f"--- {volunteers} volunteers, {elapsed:.1f} s ---")
+        print(summary.to_string())
+        print()
+
+        stages.append({
+            "volunteers": volunteers,
+            "calls_per_second": round(len(samples) / elapsed, 1),
+            "p50_ms": round(pd.Series([seconds for _, seconds, _ in samples]).median() * 1000, 1),
+            "p99_ms": round(pd.Series([seconds for _, seconds, _ in samples]).quantile(0.99) * 1000, 1),
+            "pool_timeouts": after["timeouts"] - before["timeouts"],
+            "constraint_failures": outcomes["constraint"],
+            "rejected_allocations": outcomes["rejected"],
+            "errors": outcomes["error"],
+            "peak_pool_in_use": after["peak_in_use"],
+            "peak_lock_waits": peak_lock_waits
+        })
+
+    print("=== Ramp ===")
+    print(pd.DataFrame(stages).set_index("volunteers").to_string())
+
+    exhausted: list[int] = [stage["volunteers"] for stage in stages if stage["pool_timeouts"]]
+    if exhausted:
+        print(f"\nThe pool was exhausted from {exhausted[0]} volunteers on.")
+
+
+if __name__ == "__main__":
+    run()
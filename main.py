@@ -3,14 +3,34 @@
     Date: Mon Oct 21, 9:10 am
 """
 
-from decimal import Decimal
-from typing import Literal
+import argparse
+import asyncio
+import io
+import json
+import logging
+import re
+import select
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from functools import wraps
+from types import MappingProxyType
+from typing import Any, Callable, Iterator, Literal, Mapping
+import numpy as np
 import psycopg2 as pg 
-from psycopg2 import pool
+from psycopg2.pool import PoolError
 import pandas as pd 
 from psycopg2.extras import execute_values
 from psycopg2.errors import UniqueViolation
 from psycopg2.extras import RealDictCursor
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import pandas as pd
 
@@ -18,687 +38,4652 @@ import pandas as pd
 
 class Settings(BaseSettings):
 
-    db_user: str 
-    db_name: str 
-    db_password: str 
-    db_host: str 
-    db_port: int 
+    # storage backend (see storage.py): the postgres server below, or an embedded sqlite 
+    # database file at `sqlite_path` for a single laptop deployment without a database server.
+    storage_backend: Literal["postgres", "sqlite"] = "postgres"
+    sqlite_path: str = "meenakshi.sqlite3"
+
+    # required by the postgres backend.
+    db_user: str | None = None
+    db_name: str | None = None
+    db_password: str | None = None
+    db_host: str | None = None
+    db_port: int | None = None
 
     admin_username: str 
     admin_password: str 
 
+    # read query cache: entries expire after `query_cache_ttl` seconds (expired ones are still served 
+    # while the database is unreachable), the least recently used ones are evicted beyond `query_cache_size`.
+    query_cache_ttl: float = 30.0
+    query_cache_size: int = 256
+
+    # connection pool: connections are opened on demand, a checkout waits up to `db_pool_timeout` 
+    # seconds for a free connection, connections held longer than `db_leak_threshold` seconds are logged with their call site.
+    db_pool_max_size: int = 12
+    db_pool_timeout: float = 10.0
+    db_leak_threshold: float = 60.0
+    # seconds to wait for a new connection, so an unreachable server fails fast instead of hanging the page.
+    db_connect_timeout: int = 5
+
+    # python type NUMERIC columns are decoded to.
+    numeric_type: Literal["float", "decimal"] = "float"
+
+    # statements running longer than `slow_query_threshold` seconds are logged (with their plan if `explain_slow_queries`).
+    slow_query_threshold: float = 0.5
+    explain_slow_queries: bool = True
+
+    # the fixed statements of the hot helpers are prepared once per pooled connection and run by name.
+    prepare_statements: bool = True
+
+    # offline write queue: bills and allocations that could not reach the database are kept in the 
+    # local journal file and flushed every `write_queue_flush_interval` seconds, `write_queue_batch_size` per transaction.
+    write_journal_path: str = "pending_writes.sqlite3"
+    write_queue_flush_interval: float = 5.0
+    write_queue_batch_size: int = 50
+
+    model_config = SettingsConfigDict(env_file = ".env")
+
+    @model_validator(mode = "after")
+    def check_database_settings(self) -> "Settings":
+
+        if self.storage_backend == "postgres":
+            missing: list[str] = [
+                name for name in ("db_user", "db_name", "db_password", "db_host", "db_port") 
+                if getattr(self, name) is None
+            ]
+            if missing:
+                raise ValueError(f"The postgres backend requires the settings : {', '.join(missing)}")
+
+        return self
+
+    
+
+#Database Setup
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+
+    "Raised when no database connection becomes free within the pool timeout."
+
+
+# errors that may mean the database cannot be reached (network down, server restarting, pool exhausted). 
+# OperationalError also covers errors of a reachable server (deadlock, serialization failure, statement 
+# timeout), so an error caught as one of these is checked with `is_offline_error` before a write is queued.
+offline_errors: tuple[type[Exception], ...] = (pg.OperationalError, pg.InterfaceError, PoolTimeout)
+
+
+def is_offline_error(e: BaseException) -> bool:
+
+    """
+        Whether the error means the database cannot be reached, a write failing with it can be 
+        queued and retried later (see `queue_bill_record`).
+
+        True for a pool timeout, a closed connection, an OperationalError without an SQLSTATE 
+        (raised by libpq when the connection is lost or cannot be made), a connection exception 
+        (class 08) or the server shutting down or starting (57P01 - 57P03). 
+        False for any other error, eg. a deadlock or a cancelled statement of a reachable server.
+    """
+
+    if isinstance(e, (PoolTimeout, pg.InterfaceError)):
+        return True
+
+    if not isinstance(e, pg.OperationalError) or isinstance(
+        e, (pg.extensions.TransactionRollbackError, pg.extensions.QueryCanceledError)
+    ):
+        return False
+
+    pgcode: str | None = getattr(e, "pgcode", None)
+    cursor = getattr(e, "cursor", None)
+
+    if cursor is not None and cursor.connection.closed:
+        return True
+
+    return pgcode is None or pgcode.startswith("08") or pgcode in ("57P01", "57P02", "57P03")
+
+
+class ConnectionPool:
+
+    """
+        Thread safe pool of database connections.
+
+        Connections are checked out with `with db.connection() as conn:` or `with db.cursor() as cur:`.
+        Connections are opened on demand (none at creation), up to `maxconn`.
+        A checkout blocks until a connection is free (at most `timeout` seconds, then `PoolTimeout`),
+        connections idle for longer than `health_check_after` seconds are pinged before they are handed out,
+        and a background watcher logs the call site of every connection held longer than `leak_threshold` seconds.
+
+        Parameters
+        ----------
+        maxconn: int 
+            Upper bound on the open connections.
+        timeout: float 
+            Seconds a checkout waits for a free connection.
+        leak_threshold: float 
+            Seconds after which a checked out connection is reported as leaked.
+        health_check_after: float 
+            Idle seconds after which a connection is pinged on checkout.
+        on_connect: Callable | None
+            Called with every newly opened connection (e.g. to register type adapters).
+        on_checkout: Callable | None
+            Called with the seconds every checkout waited for its connection.
+        **connection_params
+            Passed to `psycopg2.connect`.
+    """
+
+    def __init__(
+            self, 
+            maxconn: int, 
+            timeout: float = 10.0, 
+            leak_threshold: float = 60.0,
+            health_check_after: float = 30.0,
+            on_connect: Callable[[pg.extensions.connection], None] | None = None,
+            on_checkout: Callable[[float], None] | None = None,
+            **connection_params
+    ) -> None:
+
+        self.maxconn: int = maxconn
+        self.timeout: float = timeout
+        self.leak_threshold: float = leak_threshold
+        self.health_check_after: float = health_check_after
+        self.on_connect: Callable[[pg.extensions.connection], None] | None = on_connect
+        self.on_checkout: Callable[[float], None] | None = on_checkout
+        self.connection_params: dict = connection_params
+
+        self._condition: threading.Condition = threading.Condition()
+        self._idle: list[tuple[pg.extensions.connection, float]] = [] # (connection, released at)
+        self._in_use: dict[int, dict] = {} # id(connection) -> checkout details
+        self._opened: int = 0
+        self._waiting: int = 0
+        self._closed: bool = False
+        self._leak_watcher: threading.Thread | None = None
+
+        # metrics
+        self._checkouts: int = 0
+        self._timeouts: int = 0
+        self._discarded: int = 0
+        self._leaks: int = 0
+        self._total_wait: float = 0.0
+        self._peak_in_use: int = 0
+
+    def _connect(self) -> pg.extensions.connection:
+
+        conn: pg.extensions.connection = pg.connect(**self.connection_params)
+
+        if self.on_connect is not None:
+            self.on_connect(conn)
+
+        return conn
+
+    def open_dedicated_connection(self) -> pg.extensions.connection:
+
+        "Opens a connection outside the pool (eg. for LISTEN), the caller closes it."
+
+        return self._connect()
+
+    def _is_healthy(self, conn: pg.extensions.connection, released_at: float) -> bool:
+
+        "Checks a pooled connection before it is handed out."
+
+        if conn.closed:
+            return False
+        
+        if time.monotonic() - released_at < self.health_check_after:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1;")
+            conn.rollback()
+            return True
+        
+        except pg.Error:
+            return False
+
+    def _discard(self, conn: pg.extensions.connection) -> None:
+
+        try:
+            conn.close()
+        except pg.Error:
+            pass
+
+        with self._condition:
+            self._opened -= 1
+            self._discarded += 1
+            self._condition.notify()
+
+    def getconn(self, timeout: float | None = None) -> pg.extensions.connection:
+
+        """
+            Checks out a connection, waiting up to `timeout` seconds (pool default if None) for one to be free.
+            Every connection must be returned with `putconn`, prefer `connection()` / `cursor()`.
+        """
+
+        timeout = self.timeout if timeout is None else timeout
+        started_at: float = time.monotonic()
+        deadline: float = started_at + timeout
+
+        while True:
+
+            conn: pg.extensions.connection | None = None
+            released_at: float = 0.0
+
+            with self._condition:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+
+                self._waiting += 1
+                try:
+                    while True:
+                        if self._idle:
+                            conn, released_at = self._idle.pop()
+                            break
+
+                        if self._opened < self.maxconn:
+                            self._opened += 1 # reserve the slot, the connection is opened outside the lock.
+                            break
+
+                        remaining: float = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeout(
+                                f"No database connection became free within {timeout} seconds "
+                                f"({self._opened} open, {len(self._in_use)} in use)."
+                            )
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._condition:
+                        self._opened -= 1
+                        self._condition.notify()
+                    raise
+
+            elif not self._is_healthy(conn, released_at):
+                logger.warning("Discarding a broken pooled connection.")
+                self._discard(conn)
+                continue
+
+            break
+
+        checked_out_at: float = time.monotonic()
+
+        with self._condition:
+            self._in_use[id(conn)] = {
+                "connection": conn,
+                "checked_out_at": checked_out_at,
+                "stack": traceback.extract_stack(limit = 12)[:-1], # call site of the checkout.
+                "reported": False
+            }
+            self._checkouts += 1
+            self._total_wait += checked_out_at - started_at
+            self._peak_in_use = max(self._peak_in_use, len(self._in_use))
+
+        if self.on_checkout is not None:
+            self.on_checkout(checked_out_at - started_at)
+
+        self._start_leak_watcher()
+
+        return conn
+
+    def putconn(self, conn: pg.extensions.connection, close: bool = False) -> None:
+
+        "Returns a checked out connection, any open transaction on it is rolled back."
+
+        with self._condition:
+            checkout: dict | None = self._in_use.pop(id(conn), None)
+
+        if checkout is not None:
+            held_for: float = time.monotonic() - checkout["checked_out_at"]
+            if held_for > self.leak_threshold and not checkout["reported"]:
+                self._report_leak(checkout, held_for)
+
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != pg.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except pg.Error:
+                close = True
+
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: float | None = None) -> Iterator[pg.extensions.connection]:
+
+        """
+            Context managed checkout, the connection is rolled back on error 
+            and always returned to the pool. Commit explicitly.
+        """
+
+        conn: pg.extensions.connection = self.getconn(timeout = timeout)
+
+        try:
+            yield conn
+
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+        finally:
+            self.putconn(conn)
+
+    @contextmanager
+    def cursor(
+            self, 
+            commit: bool = True, 
+            timeout: float | None = None, 
+            **cursor_kwargs
+    ) -> Iterator[pg.extensions.cursor]:
+
+        """
+            Context managed cursor on a pooled connection.
+            The transaction is committed on success (unless `commit` is False) and rolled back on error.
+        """
+
+        with self.connection(timeout = timeout) as conn:
+            with conn.cursor(**cursor_kwargs) as cur:
+                yield cur
+
+            if commit:
+                conn.commit()
+
+    def _report_leak(self, checkout: dict, held_for: float) -> None:
+
+        checkout["reported"] = True
+        self._leaks += 1
+        call_site: str = "".join(traceback.format_list(checkout["stack"]))
+        logger.warning(
+            "Database connection held for %.1f seconds (threshold %.1f), checked out at:\n%s", 
+            held_for, self.leak_threshold, call_site
+        )
+
+    def _watch_for_leaks(self) -> None:
+
+        while not self._closed:
+            time.sleep(max(self.leak_threshold / 2, 1.0))
+
+            now: float = time.monotonic()
+            with self._condition:
+                leaked: list[tuple[dict, float]] = [
+                    (checkout, now - checkout["checked_out_at"]) 
+                    for checkout in self._in_use.values()
+                    if not checkout["reported"] and now - checkout["checked_out_at"] > self.leak_threshold
+                ]
+
+            for checkout, held_for in leaked:
+                self._report_leak(checkout, held_for)
+
+    def _start_leak_watcher(self) -> None:
+
+        if self._leak_watcher is not None:
+            return
+        
+        with self._condition:
+            if self._leak_watcher is None:
+                self._leak_watcher = threading.Thread(
+                    target = self._watch_for_leaks, name = "db-pool-leak-watcher", daemon = True
+                )
+                self._leak_watcher.start()
+
+    def metrics(self) -> dict[str, int | float]:
+
+        "Returns the current size and usage counters of the pool."
+
+        with self._condition:
+            return {
+                "max_size": self.maxconn,
+                "open": self._opened,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "leaks": self._leaks,
+                "avg_wait_ms": (self._total_wait / self._checkouts * 1000) if self._checkouts else 0.0
+            }
+
+    def closeall(self) -> None:
+
+        with self._condition:
+            self._closed = True
+            idle: list[tuple[pg.extensions.connection, float]] = self._idle
+            self._idle = []
+            self._condition.notify_all()
+
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+# Result decoding: NUMERIC values are turned into floats by the driver itself while reading 
+# the rows, instead of converting every Decimal cell of the dataframe afterwards.
+NUMERIC_AS_FLOAT = pg.extensions.new_type(
+    pg.extensions.DECIMAL.values, "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None
+)
+NUMERIC_ARRAY_AS_FLOAT = pg.extensions.new_array_type(
+    (1231,), "NUMERIC_ARRAY_AS_FLOAT", NUMERIC_AS_FLOAT # 1231 is the oid of numeric[]
+)
+
+
+def register_result_adapters(conn: pg.extensions.connection) -> None:
+
+    "Registers the type adapters of `settings.numeric_type` on a new connection."
+
+    if get_settings().numeric_type == "float":
+        pg.extensions.register_type(NUMERIC_AS_FLOAT, conn)
+        pg.extensions.register_type(NUMERIC_ARRAY_AS_FLOAT, conn)
+
+
+def rows_to_dataframe(rows: list[tuple], columns: list[str]) -> pd.DataFrame:
+
+    "Builds a dataframe column by column from the tuples of a cursor."
+
+    # transposing the rows once lets pandas infer each column's dtype from a plain list.
+    data: dict[int, list] = {
+        position: list(values) for position, values in enumerate(zip(*rows))
+    }
+    df = pd.DataFrame(data)
+    df.columns = columns # assigned afterwards so that duplicate column names survive.
+
+    return df
+
+
+# Instrumentation: every statement run through the pooled connections is timed by the cursor 
+# classes below and recorded in the process wide `QueryStats`, under the public helper 
+# (eg. `get_inventory`) that issued it.
+current_operation: ContextVar[str] = ContextVar("current_operation", default = "other")
+
+
+def instrumented(func: Callable) -> Callable:
+
+    """
+        Records the statements run by `func` under its name.
+        A helper called from another instrumented helper keeps the caller's name.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+
+        if current_operation.get() != "other":
+            return func(*args, **kwargs)
+
+        token = current_operation.set(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+
+    return wrapper
+
+
+def log_event(level: int, event: str, **fields: Any) -> None:
+
+    "Logs the event as one json line (structured log)."
+
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event} | fields, default = str))
+
+
+class QueryStats:
+
+    """
+        Per operation statement statistics: calls, errors, rows, pool wait time and a latency 
+        histogram (fixed buckets, so recording is O(log buckets) and the memory is bounded).
+        The last `max_slow_queries` slow statements are kept with their plan.
+    """
+
+    # upper bounds of the latency buckets in milliseconds, the last bucket is unbounded.
+    buckets_ms: tuple[float, ...] = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+    def __init__(self, slow_query_threshold: float = 0.5, max_slow_queries: int = 50) -> None:
+
+        self.slow_query_threshold: float = slow_query_threshold
+        self._lock: threading.Lock = threading.Lock()
+        self._operations: dict[str, dict] = {}
+        self._slow_queries: deque[dict] = deque(maxlen = max_slow_queries)
+
+    def _operation(self, operation: str) -> dict:
+
+        stats: dict | None = self._operations.get(operation)
+
+        if stats is None:
+            stats = self._operations[operation] = {
+                "calls": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "pool_waits": 0, "pool_wait_ms": 0.0,
+                "histogram": [0] * len(self.buckets_ms)
+            }
+
+        return stats
+
+    def record(self, operation: str, elapsed: float, rows: int, failed: bool = False) -> None:
+
+        elapsed_ms: float = elapsed * 1000
+
+        with self._lock:
+            stats: dict = self._operation(operation)
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["rows"] += max(rows, 0)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["histogram"][bisect_left(self.buckets_ms, elapsed_ms)] += 1
+
+    def record_pool_wait(self, waited: float) -> None:
+
+        with self._lock:
+            stats: dict = self._operation(current_operation.get())
+            stats["pool_waits"] += 1
+            stats["pool_wait_ms"] += waited * 1000
+
+    def record_slow_query(self, slow_query: dict) -> None:
+
+        with self._lock:
+            self._slow_queries.append(slow_query)
+
+    def _percentile(self, histogram: list[int], fraction: float) -> float:
+
+        "Upper bound of the bucket holding the given fraction of the calls."
+
+        target: float = sum(histogram) * fraction
+        seen: int = 0
+
+        for upper_bound, count in zip(self.buckets_ms, histogram):
+            seen += count
+            if count and seen >= target:
+                return upper_bound
+
+        return 0.0
+
+    def summary(self) -> pd.DataFrame:
+
+        "Returns one row per operation, the slowest (by total time) first."
+
+        with self._lock:
+            operations: dict[str, dict] = {
+                operation: stats | {"histogram": list(stats["histogram"])} 
+                for operation, stats in self._operations.items()
+            }
+
+        rows: list[dict] = [
+            {
+                "operation": operation,
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "rows": stats["rows"],
+                "total_ms": round(stats["total_ms"], 1),
+                "mean_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                "p50_ms": self._percentile(stats["histogram"], 0.50),
+                "p95_ms": self._percentile(stats["histogram"], 0.95),
+                "p99_ms": self._percentile(stats["histogram"], 0.99),
+                "max_ms": round(stats["max_ms"], 2),
+                "avg_pool_wait_ms": round(stats["pool_wait_ms"] / stats["pool_waits"], 2) if stats["pool_waits"] else 0.0
+            }
+            for operation, stats in operations.items()
+        ]
+
+        columns: list[str] = [
+            "operation", "calls", "errors", "rows", "total_ms", "mean_ms", 
+            "p50_ms", "p95_ms", "p99_ms", "max_ms", "avg_pool_wait_ms"
+        ]
+
+        return pd.DataFrame(rows, columns = columns).sort_values("total_ms", ascending = False, ignore_index = True)
+
+    def histogram(self, operation: str) -> pd.DataFrame:
+
+        "Returns the statement count per latency bucket of the operation."
+
+        with self._lock:
+            counts: list[int] = list(self._operations.get(operation, {}).get("histogram", [0] * len(self.buckets_ms)))
+
+        labels: list[str] = [f"<= {bound:g} ms" for bound in self.buckets_ms[:-1]] + [f"> {self.buckets_ms[-2]:g} ms"]
+
+        return pd.DataFrame({"latency": labels, "statements": counts})
+
+    def slow_queries(self) -> list[dict]:
+
+        "Returns the recent slow statements, the latest first."
+
+        with self._lock:
+            return list(reversed(self._slow_queries))
+
+    def reset(self) -> None:
+
+        with self._lock:
+            self._operations.clear()
+            self._slow_queries.clear()
+
+
+class InstrumentedCursorMixin:
+
+    """
+        Times every `execute` and records it in the app's `QueryStats`.
+
+        Statements slower than the threshold are logged with their plan: a plain EXPLAIN (the 
+        statement is not run again) on the same connection, inside a savepoint so that a 
+        statement which cannot be explained leaves the caller's transaction untouched.
+    """
+
+    # only single data statements (or prepared ones) have a plan.
+    explainable: tuple[str, ...] = ("select", "with", "insert", "update", "delete", "execute")
+
+    def execute(self, query, vars = None):
+
+        operation: str = current_operation.get()
+        started_at: float = time.perf_counter()
+
+        try:
+            result = super().execute(query, vars)
+
+        except Exception as e:
+            elapsed: float = time.perf_counter() - started_at
+            get_query_stats().record(operation, elapsed, 0, failed = True)
+            log_event(
+                logging.ERROR, "query_failed", operation = operation, 
+                duration_ms = round(elapsed * 1000, 2), error = repr(e)
+            )
+            raise e
+
+        elapsed = time.perf_counter() - started_at
+        query_stats: QueryStats = get_query_stats()
+        query_stats.record(operation, elapsed, self.rowcount)
+        log_event(
+            logging.DEBUG, "query", operation = operation, 
+            duration_ms = round(elapsed * 1000, 2), rows = self.rowcount
+        )
+
+        if elapsed >= query_stats.slow_query_threshold:
+            self._record_slow_query(query_stats, operation, elapsed)
+
+        return result
+
+    def _record_slow_query(self, query_stats: QueryStats, operation: str, elapsed: float) -> None:
+
+        statement: str = self.query.decode(pg.extensions.encodings[self.connection.encoding]) if self.query else ""
+        plan: Any = None
+
+        if get_settings().explain_slow_queries:
+            plan = self._explain(statement)
+
+        slow_query: dict = {
+            "at": datetime.now(),
+            "operation": operation,
+            "duration_ms": round(elapsed * 1000, 2),
+            "rows": self.rowcount,
+            "statement": statement,
+            "plan": plan
+        }
+        query_stats.record_slow_query(slow_query)
+        log_event(logging.WARNING, "slow_query", **slow_query)
+
+    def _explain(self, statement: str) -> Any:
+
+        body: str = statement.strip().rstrip(";").strip()
+
+        if (
+            self.name is not None # a named cursor is still open on its statement.
+            or self.connection.autocommit
+            or ";" in body # several statements.
+            or not body.lower().startswith(self.explainable)
+        ):
+            return None
+
+        with self.connection.cursor(cursor_factory = pg.extensions.cursor) as cur:
+            cur.execute("savepoint capture_plan;")
+            try:
+                cur.execute("explain (format json) " + body)
+                plan: Any = cur.fetchone()[0]
+                cur.execute("release savepoint capture_plan;")
+            except pg.Error as e:
+                cur.execute("rollback to savepoint capture_plan;")
+                plan = f"not available: {e}"
+
+        return plan
+
+
+class InstrumentedCursor(InstrumentedCursorMixin, pg.extensions.cursor):
+    pass
+
+
+class InstrumentedRealDictCursor(InstrumentedCursorMixin, RealDictCursor):
+    pass
+
+
+class PreparingConnection(pg.extensions.connection):
+
+    "Connection of the pool, remembers the names of the statements prepared on its session."
+
+    def __init__(self, *args, **kwargs) -> None:
+
+        super().__init__(*args, **kwargs)
+        self.prepared_statements: set[str] = set()
+
+
+class PreparedStatements:
+
+    """
+        Registry of the fixed statements run as server side prepared statements.
+
+        A statement is registered on first use under a name of its own (the same on every 
+        connection), its psycopg2 placeholders (`%(bill_id)s`) become the `$1, $2 ..` parameters 
+        of the PREPARE. `execute` prepares it on the cursor's connection the first time that 
+        connection runs it, then sends `execute <name> (...)`: postgres parses and plans the 
+        statement once per connection instead of on every call, and after a few executions 
+        keeps a generic plan when it is not worse than the custom ones.
+
+        Only for statements whose text never changes and whose parameter types postgres can 
+        infer from the context (eg. `bill_id = %(bill_id)s`). A PREPARE is not undone by a 
+        rollback, so the names remembered on the connection stay valid.
+    """
+
+    placeholder: re.Pattern = re.compile(r"%\((\w+)\)s")
+
+    def __init__(self) -> None:
+
+        self._statements: dict[str, tuple[str, str, list[str]]] = {} # sql -> (name, prepare sql, parameters)
+        self._lock: threading.Lock = threading.Lock()
+
+    def register(self, sql: str) -> tuple[str, str, list[str]]:
+
+        "Returns the name, the prepare statement and the parameter names of the statement."
+
+        statement: tuple[str, str, list[str]] | None = self._statements.get(sql)
+
+        if statement is not None:
+            return statement
+
+        with self._lock:
+            if sql not in self._statements:
+                parameters: list[str] = []
+
+                def number(match: re.Match) -> str:
+                    if match.group(1) not in parameters:
+                        parameters.append(match.group(1))
+                    return f"${parameters.index(match.group(1)) + 1}"
+
+                name: str = f"prepared_{len(self._statements) + 1}"
+                body: str = self.placeholder.sub(number, sql.strip().rstrip(";")).replace("%%", "%")
+                self._statements[sql] = (name, f"prepare {name} as {body}", parameters)
+
+        return self._statements[sql]
+
+    def execute(self, cur: pg.extensions.cursor, sql: str, vars: dict | None = None) -> None:
+
+        """
+            Runs the statement on the cursor, prepared if its connection is a pooled one (and 
+            `settings.prepare_statements`), else as plain text. Fetch the rows from the cursor.
+        """
+
+        prepared: set[str] | None = getattr(cur.connection, "prepared_statements", None)
+
+        if prepared is None or not get_settings().prepare_statements:
+            cur.execute(sql, vars = vars)
+            return
+
+        name, prepare_sql, parameters = self.register(sql)
+
+        if name not in prepared:
+            cur.execute(prepare_sql)
+            prepared.add(name)
+
+        if parameters:
+            cur.execute(f"execute {name} ({', '.join(f'%({parameter})s' for parameter in parameters)});", vars = vars)
+        else:
+            cur.execute(f"execute {name};")
+
+    def names(self) -> dict[str, str]:
+
+        "Name -> statement text of the registered statements."
+
+        return {name: sql for sql, (name, _, _) in self._statements.items()}
+
+
+prepared_statements: PreparedStatements = PreparedStatements()
+
+
+class QueryCache:
+
+    """
+        Process wide cache for the results of select queries.
+
+        Entries are keyed by the sql statement and its parameters, expire after `ttl` seconds 
+        and the least recently used entry is evicted once `maxsize` entries are stored.
+        Every entry is tagged with the tables its query reads, so a write only drops 
+        the entries that depend on the tables it changed (see `invalidate`).
+
+        Streamlit serves every session on its own thread, so all access goes through a lock.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0) -> None:
+
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self._entries: OrderedDict[tuple, tuple[float, frozenset[str], Any]] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def make_key(sql: str, vars: tuple | dict | None = None) -> tuple:
+
+        "Builds a hashable key from the sql statement and its parameters."
+
+        def freeze(value: Any) -> Any:
+            if isinstance(value, dict):
+                return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+            if isinstance(value, (list, tuple, set)):
+                return tuple(freeze(item) for item in value)
+            return value
+
+        return (sql, freeze(vars))
+
+    def get(self, key: tuple, stale_ok: bool = False) -> tuple[bool, Any]:
+
+        """
+            Returns (True, value) if a fresh entry is found for the key, else (False, None).
+            With `stale_ok` an expired entry is returned too (fallback while the database is unreachable).
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return (False, None)
+
+            expires_at, _, value = entry
+
+            if expires_at < time.monotonic() and not stale_ok:
+                # stale entry, kept (until evicted or invalidated) as the offline fallback.
+                self.misses += 1
+                return (False, None)
+
+            self._entries.move_to_end(key) # mark as most recently used.
+            self.hits += 1
+
+            return (True, value)
+
+    def set(self, key: tuple, value: Any, tables: tuple[str, ...]) -> None:
+
+        "Stores the value for the key, tagged with the tables the query reads."
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, frozenset(tables), value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False) # evict the least recently used entry.
+
+    def invalidate(self, *tables: str) -> None:
+
+        "Drops every entry whose query reads any of the given tables."
+
+        changed: set[str] = set(tables)
+
+        with self._lock:
+            stale_keys: list[tuple] = [
+                key for key, (_, entry_tables, _) in self._entries.items() if entry_tables & changed
+            ]
+            for key in stale_keys:
+                del self._entries[key]
+
+    def clear(self) -> None:
+
+        with self._lock:
+            self._entries.clear()
+
+
+class AppContext:
+
+    """
+        Runtime state of main.py: the settings, the connection pool, the query cache, the query statistics 
+        and the offline write journal (postgres backend only).
+
+        Created on first use by `get_app_context`, so importing main.py reads no configuration 
+        and opens no database connection. The pool itself opens connections on demand.
+    """
+
+    def __init__(self) -> None:
+
+        self.settings: Settings = Settings()
+
+        self.query_stats: QueryStats = QueryStats(slow_query_threshold = self.settings.slow_query_threshold)
+
+        # the offline write queue of the postgres backend, the embedded database needs none.
+        self.write_journal: WriteJournal | None = (
+            WriteJournal(self.settings.write_journal_path) if self.settings.storage_backend == "postgres" else None
+        )
+
+        self.query_cache: QueryCache = QueryCache(
+            maxsize = self.settings.query_cache_size, 
+            ttl = self.settings.query_cache_ttl
+        )
+
+        #connection parameters
+        connection_params: dict[str, str | int] = {
+            'host': self.settings.db_host,
+            'port': self.settings.db_port,
+            'database': self.settings.db_name,
+            'password': self.settings.db_password,
+            'user': self.settings.db_user,
+            'connect_timeout': self.settings.db_connect_timeout,
+            "connection_factory": PreparingConnection,
+            "cursor_factory": InstrumentedRealDictCursor
+        }
+
+        self.db: ConnectionPool = ConnectionPool(
+            maxconn = self.settings.db_pool_max_size,
+            timeout = self.settings.db_pool_timeout,
+            leak_threshold = self.settings.db_leak_threshold,
+            on_connect = register_result_adapters,
+            on_checkout = self.query_stats.record_pool_wait,
+            **connection_params
+        )
+
+
+_app_context: AppContext | None = None
+_app_context_lock: threading.Lock = threading.Lock()
+
+
+def get_app_context() -> AppContext:
+
+    "Returns the process wide app context, creating it on first use."
+
+    global _app_context
+
+    if _app_context is None:
+        with _app_context_lock:
+            if _app_context is None:
+                _app_context = AppContext()
+
+    return _app_context
+
+
+def get_settings() -> Settings:
+
+    return get_app_context().settings
+
+
+def get_db() -> ConnectionPool:
+
+    return get_app_context().db
+
+
+def get_query_cache() -> QueryCache:
+
+    return get_app_context().query_cache
+
+
+def get_query_stats() -> QueryStats:
+
+    return get_app_context().query_stats
+
+
+def get_write_journal() -> "WriteJournal":
+
+    write_journal: WriteJournal | None = get_app_context().write_journal
+
+    if write_journal is None:
+        raise ValueError("The offline write queue is used by the postgres backend only.")
+
+    return write_journal
+
+
+def __getattr__(name: str) -> Any:
+
+    "Keeps `main.settings`, `main.db` and `main.query_cache` importable, resolved lazily from the app context."
+
+    if name in ("settings", "db", "query_cache"):
+        return getattr(get_app_context(), name)
+    
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def execute_sql_select_query(
+        sql_statement: str, 
+        vars: tuple | dict | None = None,
+        cache_tables: tuple[str, ...] | None = None,
+        prepared: bool = False
+) -> (pd.DataFrame | None):
+
+    """
+        Return the select sql statement as pandas dataframe object
+
+        If `cache_tables` (the tables the statement reads) is given, the result is served 
+        from the process wide `query_cache` until it expires or one of those tables is written.
+        If `prepared`, the statement (fixed text, dict `vars`) runs through `prepared_statements`.
+    """
+
+    if cache_tables:
+        cache_key: tuple = QueryCache.make_key(sql_statement, vars)
+        found, cached_df = get_query_cache().get(cache_key)
+
+        if found:
+            # callers are free to modify the returned dataframe, so never hand out the cached object.
+            return None if cached_df is None else cached_df.copy()
+
+        try:
+            df = execute_sql_select_query(sql_statement, vars = vars, prepared = prepared)
+        except offline_errors as e:
+            # database unreachable: the last known result keeps the page (and data entry) usable.
+            found, cached_df = get_query_cache().get(cache_key, stale_ok = True)
+            if not found or not is_offline_error(e):
+                raise
+            logger.warning("Database unreachable, serving a stale cached result.")
+            return None if cached_df is None else cached_df.copy()
+
+        get_query_cache().set(cache_key, df, tables = cache_tables)
+
+        return None if df is None else df.copy()
+
+    # the connection goes back to the pool only after the rows are fetched.
+    # a plain (instrumented) tuple cursor is used, the dataframe is built column wise from the tuples.
+    with get_db().cursor(cursor_factory = InstrumentedCursor) as cur:
+        # executing the sql statement
+        if prepared:
+            prepared_statements.execute(cur, sql_statement, vars = vars)
+        else:
+            cur.execute(sql_statement, vars = vars) # stores the value in cursor object
+
+        #fetching the data from the cursor
+        data: list[tuple] = cur.fetchall()
+        columns: list[str] = [column.name for column in cur.description]
+
+    if not data:
+        # if the result is empty list then we return None
+        return None
+    
+    df = rows_to_dataframe(data, columns)
+    
+    return df
+
+def execute_sql_statements(
+        sql: str, vars: tuple | dict | None = None, 
+        # fetch: Literal["all", "one", "no_fetch"] = "no_fetch"
+) -> list[tuple] : 
+
+    """
+        This function is used to execute the sql statements specially Insert clause except Select clause
+
+        Args
+        -----
+            sql: str 
+                sql statement.
+            vars: tuple 
+                A parameter which need to insert.
+    """
+
+    # checking out a pooled connection, the changes are committed when the block ends without error.
+    with get_db().cursor() as cur:
+
+        # executing the statement.
+        cur.execute(sql, vars = vars)
+
+        result: list[RealDictCursor] = cur.fetchall() # fetching results from a cur obj.
+    
+    return result
+
+
+async def execute_sql_select_query_async(
+        sql_statement: str, 
+        vars: tuple | dict | None = None,
+        cache_tables: tuple[str, ...] | None = None
+) -> (pd.DataFrame | None):
+
+    """
+        asyncio counterpart of `execute_sql_select_query`.
+
+        The query runs on a worker thread with its own connection from the (thread safe) pool, 
+        so several awaited queries run concurrently on separate connections.
+    """
+
+    return await asyncio.to_thread(execute_sql_select_query, sql_statement, vars, cache_tables)
+
+
+async def execute_sql_statements_async(
+        sql: str, vars: tuple | dict | None = None
+) -> list[tuple]:
+
+    "asyncio counterpart of `execute_sql_statements`."
+
+    return await asyncio.to_thread(execute_sql_statements, sql, vars)
+
+
+async def gather_queries(**loaders: Callable[[], Any]) -> dict[str, Any]:
+
+    """
+        Runs the data loading functions concurrently.
+
+        Parameters
+        ----------
+        **loaders: Callable[[], Any]
+            Name -> function without arguments (eg. `get_inventory` or a `functools.partial`).
+
+        Returns
+        -------
+        dict[str, Any]
+            Name -> result of the function.
+    """
+
+    results: list[Any] = await asyncio.gather(
+        *(asyncio.to_thread(loader) for loader in loaders.values())
+    )
+
+    return dict(zip(loaders, results))
+
+
+def load_concurrently(**loaders: Callable[[], Any]) -> dict[str, Any]:
+
+    """
+        Blocking entry point of `gather_queries` for synchronous callers (the streamlit script).
+        The page waits roughly for the slowest query instead of the sum of all of them.
+    """
+
+    return asyncio.run(gather_queries(**loaders))
+
+
+def stream_sql_select_query(
+        sql_statement: str, 
+        vars: tuple | dict | None = None,
+        chunk_size: int = 10_000,
+        as_dataframe: bool = True
+) -> Iterator[pd.DataFrame | list[tuple]]:
+
+    """
+        Streams the result of a select statement in chunks, using a named (server side) cursor.
+
+        Only `chunk_size` rows are held in memory at a time, so reports over the full history 
+        run in bounded memory. The pooled connection stays checked out until the generator 
+        is exhausted or closed.
+
+        Parameters
+        ----------
+        sql_statement: str 
+            select statement.
+        vars: tuple | dict | None 
+            Parameters of the statement.
+        chunk_size: int 
+            Rows fetched from the server per round trip (and per yielded chunk).
+        as_dataframe: bool 
+            Yield pandas dataframes if True, else the raw row tuples.
+
+        Yields
+        ------
+        pd.DataFrame | list[tuple]
+            the next chunk of rows.
+    """
+
+    # declare cursor does not accept the statement terminator.
+    sql_statement = sql_statement.strip().rstrip(";")
+    cursor_name: str = f"stream_{uuid.uuid4().hex}"
+
+    with get_db().cursor(name = cursor_name, cursor_factory = InstrumentedCursor) as cur:
+        cur.itersize = chunk_size
+        cur.execute(sql_statement, vars = vars)
+
+        columns: list[str] | None = None
+
+        while True:
+            rows: list[tuple] = cur.fetchmany(chunk_size)
+
+            if not rows:
+                break
+
+            if not as_dataframe:
+                yield rows
+                continue
+
+            if columns is None:
+                # the description of a named cursor is known only after the first fetch.
+                columns = [column.name for column in cur.description]
+
+            yield rows_to_dataframe(rows, columns)
+  
+  
+@instrumented
+def get_all_items() -> (pd.DataFrame | None) : 
+
+    "This function returns all the items list"
+
+    sql: str = """
+        select 
+            i.id as item_id,
+            initcap(i.name) as item,
+            i.unit_of_measurement
+        from
+            items as i
+        order by 
+            i.id
+    """    
+    items_df = execute_sql_select_query(sql, cache_tables = ("items",), prepared = True)
+    
+    return items_df
+
+
+all_contribution_sql: str = """
+
+    select 
+        b.*,
+        i.name as item,
+        t.quantity,
+        i.unit_of_measurement,
+        t.donated_at::date
+    from 
+        transactions as t 
+    join 
+        items as i 
+    on 
+        i.id = t.item_id
+    join 
+        bill_books as b
+    on 
+        (b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id)
+    ;
+
+"""
+
+
+@instrumented
+def get_all_contribution() -> (pd.DataFrame | None):
+
+    "This returns the contribution of all donar"
+
+    contribution_df = execute_sql_select_query(all_contribution_sql)
+    
+    return contribution_df
+
+
+def stream_all_contribution(chunk_size: int = 10_000) -> Iterator[pd.DataFrame]:
+
+    "Same rows as `get_all_contribution`, streamed in dataframes of `chunk_size` rows."
+
+    yield from stream_sql_select_query(all_contribution_sql, chunk_size = chunk_size)
+
+
+ 
+@instrumented
+def get_particular_contribution(
+        bill_book_code: str, 
+        bill_id: int
+) -> (tuple[str, pd.DataFrame] | tuple[None, None]): 
+    
+    """
+    This function returns the items contributed in a particular bill.
+
+    Parameter
+    ----------
+    bill_book_code: str 
+        Unique code represents particular bill_book eg.B1, B2 etc.   
+    bill_id: int 
+        Unique id/page represents the particular bill entered in the bill book.
+        
+    Returns
+    --------
+        tuple[str, pd.DataFrame] 
+            which is the donar name and the contribution if bill found with bill_id and bill_book_code.
+        tuple[None, None] 
+            if no bill is found with bill_id and bill_book_code.
+
+    """
+
+    sql: str = """
+
+        select
+            initcap(i.name) as item,
+            x.quantity,
+            i.unit_of_measurement,
+            x.donated_at::date as donated_on, 
+            to_char(x.donated_at, 'HH12 : MI : SS AM') as donated_at,
+            b.donar_name
+        from(
+            select 
+                *
+            from 
+                transactions as t 
+            where 
+                t.bill_book_code = %(bill_book_code)s and t.bill_id = %(bill_id)s
+        )x
+        join 
+            bill_books as b
+        on 
+            b.bill_book_code = x.bill_book_code and b.bill_id = x.bill_id
+        join 
+            items as i 
+        on 
+            i.id = x.item_id
+        ;
+    """
+
+    contribution_df = execute_sql_select_query(
+        sql, 
+        vars = {
+            'bill_book_code': bill_book_code, 
+            'bill_id': bill_id
+        },
+        cache_tables = ("transactions", "bill_books", "items"),
+        prepared = True
+    )
+    
+    if contribution_df is None:
+        print("The contribution df is ", contribution_df)
+        return (None, None)
+    
+    donar_column: str = 'donar_name'
+    donar_name: str = contribution_df[donar_column].iloc[0]
+
+    final_df = contribution_df.drop(donar_column, axis=1)
+
+    return (donar_name, final_df)
+
+
+# columns of the bill contribution rows, in the order `group_bill_contributions` reads them.
+bill_contribution_columns: list[str] = [
+    "bill_book_code", "bill_id", "donar_name", "donar_phone_num", 
+    "item_id", "item", "quantity", "unit_of_measurement", "donated_on", "donated_at"
+]
+
+
+def group_bill_contributions(rows: list[tuple]) -> dict[tuple[str, int], dict]:
+
+    """
+        Groups the rows (`bill_contribution_columns`, sorted by bill) in one pass: 
+        (bill_book_code, bill_id) -> {"donar_name", "donar_phone_num", "items": [line item dicts]}.
+        A bill without line items (left joined) gets an empty list.
+    """
+
+    bills: dict[tuple[str, int], dict] = {}
+    item_columns: list[str] = bill_contribution_columns[4:]
+
+    for row in rows:
+        key: tuple[str, int] = (row[0], row[1])
+        bill: dict | None = bills.get(key)
+
+        if bill is None:
+            bill = bills[key] = {"donar_name": row[2], "donar_phone_num": row[3], "items": []}
+
+        if row[4] is not None:
+            bill["items"].append(dict(zip(item_columns, row[4:])))
+
+    return bills
+
+
+@instrumented
+def get_bill_contributions(
+        bills: list[tuple[str, int]] | None = None,
+        bill_book_code: str | None = None,
+        first_bill_id: int | None = None,
+        last_bill_id: int | None = None
+) -> dict[tuple[str, int], dict]:
+
+    """
+        Returns the donor and the line items of many bills, fetched in one query.
+
+        Either the `bills` pairs, or a whole bill book (`bill_book_code`), optionally limited to 
+        the bill ids from `first_bill_id` to `last_bill_id` (inclusive).
+
+        Parameters
+        ----------
+        bills: list[tuple[str, int]] | None
+            (bill_book_code, bill_id) pairs.
+        bill_book_code: str | None
+            bill book to read when `bills` is not given.
+        first_bill_id: int | None
+            first bill id of the book range.
+        last_bill_id: int | None
+            last bill id of the book range.
+
+        Returns
+        -------
+        dict[tuple[str, int], dict]
+            (bill_book_code, bill_id) -> {"donar_name", "donar_phone_num", "items"}, in bill order. 
+            "items" is a list of dicts (item_id, item, quantity, unit_of_measurement, donated_on, 
+            donated_at). Bills that do not exist are left out.
+    """
+
+    if bills is not None:
+        if not bills:
+            return {}
+
+        # the pairs (each once) are sent as two arrays and zipped back by unnest, one parameter each.
+        bill_book_codes, bill_ids = zip(*dict.fromkeys((code, int(bill_id)) for code, bill_id in bills))
+        source: str = """
+            unnest(%(bill_book_codes)s::varchar[], %(bill_ids)s::integer[]) as r (bill_book_code, bill_id)
+            join 
+                bill_books as b 
+            on 
+                b.bill_book_code = r.bill_book_code and b.bill_id = r.bill_id
+        """
+        where_clause: str = ""
+        vars: dict = {"bill_book_codes": list(bill_book_codes), "bill_ids": list(bill_ids)}
+
+    elif bill_book_code is not None:
+        source = "bill_books as b"
+        conditions: list[str] = ["b.bill_book_code = %(bill_book_code)s"]
+        vars = {"bill_book_code": bill_book_code}
+
+        if first_bill_id is not None:
+            conditions.append("b.bill_id >= %(first_bill_id)s")
+            vars["first_bill_id"] = int(first_bill_id)
+
+        if last_bill_id is not None:
+            conditions.append("b.bill_id <= %(last_bill_id)s")
+            vars["last_bill_id"] = int(last_bill_id)
+
+        where_clause = f"where {' and '.join(conditions)}"
+
+    else:
+        raise ValueError("Pass either bills or a bill_book_code.")
+
+    sql: str = f"""
+        select
+            b.bill_book_code,
+            b.bill_id,
+            b.donar_name,
+            b.donar_phone_num,
+            t.item_id,
+            initcap(i.name) as item,
+            t.quantity,
+            i.unit_of_measurement,
+            t.donated_at::date as donated_on,
+            to_char(t.donated_at, 'HH12 : MI : SS AM') as donated_at
+        from 
+            {source}
+        left join 
+            transactions as t
+        on 
+            t.bill_book_code = b.bill_book_code and t.bill_id = b.bill_id
+        left join 
+            items as i 
+        on 
+            i.id = t.item_id
+        {where_clause}
+        order by 
+            length(b.bill_book_code), b.bill_book_code, b.bill_id, t.item_id
+        ;
+    """
+
+    with get_db().cursor(cursor_factory = InstrumentedCursor) as cur:
+        cur.execute(sql, vars = vars)
+        rows: list[tuple] = cur.fetchall()
+
+    return group_bill_contributions(rows)
+
+
+
+
+@instrumented
+def add_new_items(
+        item_name: str, 
+        unit_of_measurement: Literal['Kg', 'L', 'Nos']
+) -> tuple | None:
+
+    """
+        This function is used to add a new item in the items table
+    """
+
+    if not item_name:
+        print('Item name must include')
+        return None
+    
+    # Check the item is already exists in our database.
+
+    existance_check_sql: str = """
+        select 
+            1
+        from 
+            items as i 
+        where 
+            i.name like lower(%(item_name)s)
+        ;
+    """
+
+    previous_record = execute_sql_select_query(existance_check_sql, vars = {"item_name": item_name})
+
+    if previous_record is not None:
+        print(previous_record)
+        return None
+    
+    item_name = item_name.strip().lower() # standardizing the item names for backend convenience.
+    
+    sql: str = """
+        
+        insert into items
+            (name, unit_of_measurement)
+        values
+            (%(item_name)s, %(unit_of_measurement)s)
+        returning *
+        ;
+
+    """
+    result: tuple = execute_sql_statements(
+        notify_changes_sql("items") + sql, 
+        vars = {
+            'item_name': item_name,
+            'unit_of_measurement': unit_of_measurement
+        }
+    )
+
+    get_query_cache().invalidate("items")
+    print(f"{item_name} added successfully.")
+    
+    return result 
+
+@instrumented
+def add_new_cooking_team(
+        supervisor_name: str, 
+        supervisor_phone_num: str | None = None,         
+) -> (tuple | None):
+    # need to fix the empty strings ' '
+    if not supervisor_name:
+        print('Supervisor name must include')
+        return None
+
+    sql: str = """
+        
+        insert into cooking_teams
+            (supervisor_name, supervisor_phone_num)
+        values
+            (%(supervisor_name)s, %(supervisor_phone_num)s)
+        returning *
+        ;
+    """
+    result = None 
+    try:
+        result = execute_sql_statements(
+            notify_changes_sql("cooking_teams") + sql, 
+            vars = {
+                "supervisor_name": supervisor_name,
+                "supervisor_phone_num": supervisor_phone_num
+            }
+        )
+    except UniqueViolation:
+        print("Error occuring in inserting the data: Cooking team already found with this supervisor name")
+        return result
+    
+    get_query_cache().invalidate("cooking_teams")
+    
+    return result
+
+
+# Available quantity of every item received so far (`get_inventory`).
+inventory_sql: str = """
+    select 
+        b.item_id,
+        initcap(i.name) as item,
+        (b.received_quantity - b.allocated_quantity) as available_quantity, 
+        i.unit_of_measurement
+    from 
+        inventory_balances as b
+    join
+        items as i
+    on 
+        i.id = b.item_id
+    where 
+        b.received_quantity > 0
+    order by 
+        b.item_id
+    ;
+"""
+
+
+@instrumented
+def get_inventory() -> (pd.DataFrame | None) :
+
+    """
+        Returns the available quantity of every item received so far.
+
+        The quantities are read from the `inventory_balances` table which is kept
+        current by the bill and allocation write paths, so this is a read of one row per item.
+    """
+
+    inventory_df = execute_sql_select_query(inventory_sql, cache_tables = ("inventory_balances", "items"), prepared = True)
+
+    return inventory_df
+
+
+# Recomputes the balance of every item from the raw transactions and allocations tables.
+inventory_ledger_sql: str = """
+    select 
+        i.id as item_id,
+        coalesce(t.total_quantity, 0) as received_quantity,
+        coalesce(a.total_quantity, 0) as allocated_quantity
+    from 
+        items as i
+    left join (
+        select 
+            item_id, 
+            sum(quantity) as total_quantity 
+        from 
+            transactions 
+        group by 
+            item_id
+    ) as t 
+    on 
+        t.item_id = i.id
+    left join (
+        select 
+            item_id, 
+            sum(quantity) as total_quantity 
+        from 
+            allocations 
+        group by 
+            item_id
+    ) as a 
+    on 
+        a.item_id = i.id
+    where 
+        t.item_id is not null or a.item_id is not null
+"""
+
+
+def update_inventory_balances(
+        cur: pg.extensions.cursor, 
+        item_ids: list[int],
+        quantities: list[int | float],
+        column: Literal["received_quantity", "allocated_quantity"]
+) -> None:
+    
+    """
+        Adds the quantities to the running balance of each item. 
+
+        Must be called with the cursor of the transaction that writes the
+        transactions/allocations rows so that both commit (or rollback) together.
+
+        Parameters
+        ----------
+        cur: pg.extensions.cursor
+            Cursor of the open transaction.
+        item_ids: list[int]
+            Items whose balance changed.
+        quantities: list[int | float]
+            Quantity to add for each item (same order as item_ids).
+        column: Literal["received_quantity", "allocated_quantity"]
+            Which side of the balance to increase.
+    """
+
+    if column not in ("received_quantity", "allocated_quantity"):
+        raise ValueError(f"Invalid balance column : {column}")
+
+    sql: str = f"""
+        insert into inventory_balances
+            (item_id, {column})
+        values
+            %s
+        on conflict (item_id) do update set 
+            {column} = inventory_balances.{column} + excluded.{column},
+            updated_at = now()
+        ;
+    """
+    values: list[tuple] = [
+        (int(item_id), quantity) for item_id, quantity in zip(item_ids, quantities, strict = True)
+    ]
+    # sorting the rows keeps the row lock order stable across concurrent writers (avoids deadlocks).
+    values.sort(key = lambda row: row[0])
+
+    execute_values(cur, sql, argslist = values)
+
+
+@instrumented
+def rebuild_inventory_balances() -> int:
+
+    """
+        Recomputes the `inventory_balances` table from the raw transactions and allocations.
+
+        Returns
+        -------
+        int 
+            Number of item balances written.
+    """
+
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            # block the writers while rebuilding so no transaction/allocation is missed.
+            cur.execute("lock table transactions, allocations in share mode;")
+            cur.execute("lock table inventory_balances in exclusive mode;")
+            cur.execute("delete from inventory_balances;")
+            cur.execute(f"""
+                insert into inventory_balances
+                    (item_id, received_quantity, allocated_quantity)
+                {inventory_ledger_sql}
+                ;
+            """)
+            row_count: int = cur.rowcount
+            cur.execute(notify_changes_sql("inventory_balances"))
+            conn.commit()
+            get_query_cache().invalidate("inventory_balances")
+
+        except Exception as e:
+            conn.rollback()
+            print(f"Error occur during rebuilding inventory balances: {str(e)}")
+            raise e
+
+    print(f"Inventory balances rebuilt for {row_count} items.")
+
+    return row_count
+
+
+@instrumented
+def verify_inventory_balances() -> (pd.DataFrame | None):
+
+    """
+        Checks the `inventory_balances` table against the raw transactions and allocations tables.
+
+        Returns
+        -------
+        pd.DataFrame
+            items whose stored balance differs from the recomputed one.
+        None
+            if every balance matches.
+    """
+
+    sql: str = f"""
+        with ledger as (
+            {inventory_ledger_sql}
+        )
+        select 
+            coalesce(l.item_id, b.item_id) as item_id,
+            l.received_quantity as expected_received_quantity,
+            b.received_quantity as stored_received_quantity,
+            l.allocated_quantity as expected_allocated_quantity,
+            b.allocated_quantity as stored_allocated_quantity
+        from 
+            ledger as l
+        full join
+            inventory_balances as b
+        on 
+            b.item_id = l.item_id
+        where 
+            coalesce(l.received_quantity, 0) <> coalesce(b.received_quantity, 0) or 
+            coalesce(l.allocated_quantity, 0) <> coalesce(b.allocated_quantity, 0)
+        order by 
+            1
+        ;
+    """
+
+    mismatch_df = execute_sql_select_query(sql)
+
+    return mismatch_df
+
+
+# Change notifications: every write path notifies the tables it changed on `change_channel` 
+# (delivered by postgres when the transaction commits). One listener thread per process drops 
+# those tables from its query cache and refreshes the shared catalog (items and inventory), so the open 
+# sessions see new stock without each of them querying the database.
+change_channel: str = "data_changed"
+
+
+def notify_changes_sql(*tables: str, condition: str = "true") -> str:
+
+    "Returns the statement notifying the listeners that the tables changed (if the sql `condition` holds)."
+
+    return f"select pg_notify('{change_channel}', '{','.join(tables)}') where {condition};\n"
+
+
+def read_only(values: np.ndarray) -> np.ndarray:
+
+    "Marks the array read only (shared between sessions) and returns it."
+
+    values.setflags(write = False)
+
+    return values
+
+
+class Catalog:
+
+    """
+        Immutable items and inventory of the process, one instance per refresh, shared by all the sessions.
+
+        The columns are built once: numpy arrays marked read only, item names and units as 
+        categoricals, plus the precomputed options of the item pickers ("<id> - <item> - <unit>") 
+        and their lookups. The dataframes wrap those arrays. Sessions reference the catalog they 
+        got (no copy per session or rerun) and must not modify it, a refresh builds a new one.
+
+        Parameters
+        ----------
+        version: int
+            Increases with every refresh.
+        items_df: pd.DataFrame | None
+            result of `get_all_items`.
+        inventory_df: pd.DataFrame | None
+            result of `get_inventory`.
+    """
+
+    def __init__(self, version: int, items_df: pd.DataFrame | None, inventory_df: pd.DataFrame | None) -> None:
+
+        self.version: int = version
+        self.refreshed_at: datetime = datetime.now()
+
+        if items_df is None:
+            items_df = pd.DataFrame({"item_id": [], "item": [], "unit_of_measurement": []})
+
+        names: pd.Series = items_df["item"].fillna("").astype(str)
+        units: pd.Series = items_df["unit_of_measurement"].fillna("").astype(str)
+
+        self.item_ids: np.ndarray = read_only(items_df["item_id"].to_numpy(dtype = np.int64))
+        self.item_names: pd.Categorical = pd.Categorical(names)
+        self.units: pd.Categorical = pd.Categorical(units)
+
+        # the data_editor's SelectboxColumn options and the lookups back to the item.
+        self.options: tuple[str, ...] = tuple(
+            f"{item_id} - {name} - {unit}" for item_id, name, unit in zip(self.item_ids.tolist(), names, units)
+        )
+        self.option_item_ids: Mapping[str, int] = MappingProxyType(dict(zip(self.options, self.item_ids.tolist())))
+        self.item_ids_by_name: Mapping[str, int] = MappingProxyType(dict(zip(names, self.item_ids.tolist())))
+        # option -> position in the columns, for vectorized lookups (see `validate_item_lines`).
+        self.option_index: pd.Index = pd.Index(self.options)
+
+        self.items: pd.DataFrame | None = None
+
+        if len(self.item_ids):
+            self.items = pd.DataFrame(
+                {"item_id": self.item_ids, "item": self.item_names, "unit_of_measurement": self.units}, 
+                copy = False
+            )
+
+        self.inventory: pd.DataFrame | None = None
+
+        if inventory_df is not None:
+            self.inventory = pd.DataFrame(
+                {
+                    "item_id": read_only(inventory_df["item_id"].to_numpy(dtype = np.int64)),
+                    "item": pd.Categorical(inventory_df["item"].fillna("")),
+                    "available_quantity": read_only(inventory_df["available_quantity"].to_numpy(dtype = np.float64)),
+                    "unit_of_measurement": pd.Categorical(inventory_df["unit_of_measurement"].fillna(""))
+                },
+                copy = False
+            )
+
+
+class CatalogSnapshot:
+
+    """
+        Latest `Catalog` of the process, refreshed by the change listener when the items or 
+        the inventory change. The catalog is replaced (never modified) on refresh.
+    """
+
+    def __init__(self) -> None:
+
+        self._lock: threading.Lock = threading.Lock()
+        self.catalog: Catalog | None = None
+
+    def refresh(self) -> None:
+
+        # loaded outside the lock, readers keep the previous catalog meanwhile.
+        items_df, inventory_df = get_all_items(), get_inventory()
+
+        with self._lock:
+            version: int = 1 if self.catalog is None else self.catalog.version + 1
+            self.catalog = Catalog(version, items_df, inventory_df)
+
+    def get(self) -> Catalog:
+
+        "Returns the current catalog, loading it on first use."
+
+        if self.catalog is None:
+            self.refresh()
+
+        return self.catalog
+
+
+catalog_snapshot: CatalogSnapshot = CatalogSnapshot()
+
+
+class ChangeListener:
+
+    """
+        Background thread listening on `change_channel` with a dedicated connection.
+
+        Notifications arriving together are handled as one change. The connection is 
+        re-opened (with backoff) if it drops, and the snapshot is refreshed after every 
+        reconnect to catch up on the changes missed meanwhile.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot) -> None:
+
+        self.snapshot: CatalogSnapshot = snapshot
+        self._stopped: threading.Event = threading.Event()
+        self._thread: threading.Thread = threading.Thread(
+            target = self._run, name = "db-change-listener", daemon = True
+        )
+
+    def start(self) -> None:
+
+        self._thread.start()
+
+    def stop(self) -> None:
+
+        self._stopped.set()
+
+    def _handle(self, tables: set[str]) -> None:
+
+        get_query_cache().invalidate(*tables)
+
+        if tables & {"inventory_balances", "items"}:
+            self.snapshot.refresh()
+
+    def _run(self) -> None:
+
+        backoff: float = 1.0
+
+        while not self._stopped.is_set():
+            conn: pg.extensions.connection | None = None
+
+            try:
+                conn = get_db().open_dedicated_connection()
+                conn.autocommit = True
+
+                with conn.cursor() as cur:
+                    cur.execute(f"listen {change_channel};")
+
+                self.snapshot.refresh()
+                backoff = 1.0
+
+                while not self._stopped.is_set():
+                    # wait for the connection to become readable (a notification arrived).
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+
+                    conn.poll()
+                    tables: set[str] = set()
+
+                    while conn.notifies:
+                        tables.update(conn.notifies.pop(0).payload.split(","))
+
+                    if tables:
+                        self._handle(tables)
+
+            except Exception as e:
+                logger.warning("Change listener disconnected (%s), retrying in %.0f seconds.", e, backoff)
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+_change_listener: ChangeListener | None = None
+_change_listener_lock: threading.Lock = threading.Lock()
+
+
+def start_change_listener() -> ChangeListener:
+
+    "Starts the process wide change listener once, returns it."
+
+    global _change_listener
+
+    with _change_listener_lock:
+        if _change_listener is None:
+            _change_listener = ChangeListener(catalog_snapshot)
+            _change_listener.start()
+
+    return _change_listener
+
+
+@instrumented
+def check_for_item_availability(
+        item_ids: list[int],
+        quantites: list[int | float]
+) -> (pd.DataFrame):
+    
+    """
+        Returns the items that are requested greater than available quantity.
+
+        Parameters
+        ---------
+        item_ids: list[int]
+            List of item ids requesting to allocate.
+        quantities: list[int | float]
+            List of quantities that maps the item.
+        
+        Returns
+        -------
+        availability_df: pd.DataFrame
+            items which are requested greater than available quantity.
+    """
+    
+    inventory_df: pd.DataFrame = get_inventory() # get the inventory data for all items.
+    required_columns: list[str] = ['item_id', 'item', 'unit_of_measurement', 'available_quantity']
+    required_items_df: pd.DataFrame = inventory_df[required_columns]
+
+    requested_items_df: pd.DataFrame = pd.DataFrame({'item_id': item_ids, 'requested_quantity': quantites}) # create temporary dataframe with input item_ids and quantites for further operations(join).
+
+    final_df: pd.DataFrame = pd.merge(required_items_df, requested_items_df, how ='inner', on ='item_id') # join(inner) the two dataframe to get necessary details of required items.
+
+    avaialability_df: pd.DataFrame = final_df[final_df['available_quantity'] < final_df['requested_quantity']] # filter the items that are requested greater than the available quantity.
+
+    return avaialability_df
+        
+    
+
+allocation_shortfall_columns: list[str] = ['item_id', 'item', 'unit_of_measurement', 'available_quantity', 'requested_quantity']
+
+
+@instrumented
+def allocate_items_to_cooking_team(
+    cooking_team_id: int, 
+    item_ids: list[int],
+    quantities: list[int | float], 
+    dish: str | None = None,
+    idempotency_key: str | None = None
+) -> (tuple[list[dict] | None, pd.DataFrame]):
+    
+    """
+        Allocates the items to the cooking team if every item has enough stock.
+
+        The stock check and the insert run as a single statement: only the balance rows 
+        of the requested items are locked (`for update`), so concurrent allocations of the 
+        same item wait for each other and can never overdraw it, while allocations of other items 
+        proceed in parallel.
+
+        Parameters
+        ----------
+        cooking_team_id: int 
+            Id of the cooking team receiving the items.
+        item_ids: list[int]
+            List of item ids requesting to allocate.
+        quantities: list[int | float]
+            List of quantities that maps the item.
+        dish: str | None 
+            Dish the items are allocated for.
+        idempotency_key: str | None 
+            Unique key of this allocation, it is applied at most once (see `claim_write`).
+
+        Returns
+        -------
+        tuple[list[dict], pd.DataFrame]
+            the inserted allocation records and an empty dataframe, if every item is available 
+            (no record if the allocation with this idempotency key was already applied).
+        tuple[None, pd.DataFrame]
+            if any item is requested greater than available quantity, the dataframe holds those items 
+            (item_id, item, unit_of_measurement, available_quantity, requested_quantity) and nothing is allocated.
+    """
+
+    if len(item_ids) != len(quantities):
+        print("Size of Item and Quantity must be same.")
+        return (None, pd.DataFrame(columns = allocation_shortfall_columns))
+
+    # get a pooled connection, it is released back to the pool when the block ends.
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            if idempotency_key is not None and not claim_write(cur, idempotency_key, "allocation"):
+                # already applied (eg. the first attempt committed but its reply was lost).
+                conn.rollback()
+                return ([], pd.DataFrame(columns = allocation_shortfall_columns))
+
+            allocations, shortfall_df = write_allocation(cur, cooking_team_id, item_ids, quantities, dish)
+
+            if allocations is None:
+                # Items requested the quantity greater than available quantity, nothing is allocated.
+                conn.rollback()
+                return (None, shortfall_df)
+
+            conn.commit() # save the data into the database.
+            get_query_cache().invalidate("allocations", "inventory_balances", *allocation_summary_tables)
+            return (allocations, shortfall_df)
+    
+        except ValueError:
+            conn.rollback()
+            raise
+
+        except Exception as e:
+            if is_offline_error(e):
+                # the caller can queue the allocation (see `queue_allocation`).
+                raise
+
+            conn.rollback()
+            print(f'Error occur during inserting the record: {str(e)}')
+            return (None, pd.DataFrame(columns = allocation_shortfall_columns))
+
+
+# Allocation of `write_allocation`: locks the balance rows of the requested items, checks the stock and 
+# inserts the allocations (nothing if an item is short or the team does not exist).
+write_allocation_sql: str = """
+    with requested as (
+        select 
+            r.item_id,
+            sum(r.quantity) as requested_quantity,
+            count(*) as allocation_count
+        from 
+            unnest(%(item_ids)s::integer[], %(quantities)s::numeric[]) as r(item_id, quantity)
+        group by 
+            r.item_id
+    ),
+    team as (
+        select 
+            c.id 
+        from 
+            cooking_teams as c
+        where 
+            c.id = %(cooking_team_id)s
+    ),
+    balances as (
+        -- lock only the balance rows of the requested items.
+        select 
+            b.item_id,
+            (b.received_quantity - b.allocated_quantity) as available_quantity
+        from 
+            inventory_balances as b
+        where 
+            b.item_id = any(%(item_ids)s::integer[])
+        order by 
+            b.item_id
+        for update
+    ),
+    shortfalls as (
+        select 
+            r.item_id,
+            initcap(i.name) as item,
+            i.unit_of_measurement,
+            coalesce(b.available_quantity, 0) as available_quantity,
+            r.requested_quantity
+        from 
+            requested as r
+        left join 
+            balances as b
+        on 
+            b.item_id = r.item_id
+        left join 
+            items as i
+        on 
+            i.id = r.item_id
+        where 
+            coalesce(b.available_quantity, 0) < r.requested_quantity
+    ),
+    inserted as (
+        insert into allocations
+            (cooking_team_id, item_id, quantity, dish)
+        select 
+            t.id, r.item_id, r.quantity, %(dish)s
+        from 
+            unnest(%(item_ids)s::integer[], %(quantities)s::numeric[]) with ordinality as r(item_id, quantity, position)
+        cross join 
+            team as t
+        where 
+            not exists (select 1 from shortfalls)
+        order by 
+            r.position
+        returning *
+    ),
+    updated as (
+        update 
+            inventory_balances as b
+        set 
+            allocated_quantity = b.allocated_quantity + r.requested_quantity,
+            updated_at = now()
+        from 
+            requested as r
+        where 
+            b.item_id = r.item_id and 
+            exists (select 1 from team) and 
+            not exists (select 1 from shortfalls)
+        returning 
+            b.item_id
+    ),
+    daily as (
+        -- keep the allocation summaries of the reports current.
+        insert into daily_allocation_summary as s
+            (allocated_on, item_id, total_quantity, allocation_count)
+        select 
+            now()::date, r.item_id, r.requested_quantity, r.allocation_count
+        from 
+            requested as r
+        where 
+            exists (select 1 from team) and 
+            not exists (select 1 from shortfalls)
+        order by 
+            r.item_id
+        on conflict (allocated_on, item_id) do update set 
+            total_quantity = s.total_quantity + excluded.total_quantity,
+            allocation_count = s.allocation_count + excluded.allocation_count
+    ),
+    team_summary as (
+        insert into team_allocation_summary as s
+            (cooking_team_id, item_id, total_quantity, allocation_count)
+        select 
+            t.id, r.item_id, r.requested_quantity, r.allocation_count
+        from 
+            requested as r
+        cross join 
+            team as t
+        where 
+            not exists (select 1 from shortfalls)
+        order by 
+            r.item_id
+        on conflict (cooking_team_id, item_id) do update set 
+            total_quantity = s.total_quantity + excluded.total_quantity,
+            allocation_count = s.allocation_count + excluded.allocation_count
+    )
+    select 
+        exists (select 1 from team) as team_exists,
+        (select coalesce(json_agg(s order by s.item_id), '[]') from shortfalls as s) as shortfalls,
+        (select coalesce(json_agg(ins), '[]') from inserted as ins) as allocations,
+        (select count(*) from updated) as updated_items
+    ;
+"""
+
+
+def check_allocation_quantities(item_ids: list[int], quantities: list[int | float]) -> None:
+
+    "Raises ValueError if a quantity is not positive (it would add to the stock instead of taking from it)."
+
+    invalid: list[str] = [
+        f"{item_id} ({quantity})" for item_id, quantity in zip(item_ids, quantities) 
+        if pd.isna(quantity) or float(quantity) <= 0
+    ]
+
+    if invalid:
+        raise ValueError(f"Allocated quantities must be greater than 0, items : {', '.join(invalid)}")
+
+
+def write_allocation(
+    cur: pg.extensions.cursor,
+    cooking_team_id: int, 
+    item_ids: list[int],
+    quantities: list[int | float], 
+    dish: str | None = None
+) -> (tuple[list[dict] | None, pd.DataFrame]):
+
+    """
+        Runs the allocation statement of `allocate_items_to_cooking_team` in the cursor's transaction, 
+        without committing. Nothing is written if an item is short (the shortfall is returned) or 
+        the cooking team does not exist or a quantity is not positive (ValueError).
+    """
+
+    check_allocation_quantities(item_ids, quantities)
+
+    # delivered to the listeners only if the allocation commits.
+    sql: str = notify_changes_sql("allocations", "inventory_balances", *allocation_summary_tables) + write_allocation_sql
+
+    cur.execute(sql, vars = {
+        'cooking_team_id': int(cooking_team_id),
+        'item_ids': [int(item_id) for item_id in item_ids],
+        'quantities': [float(quantity) for quantity in quantities],
+        'dish': dish
+    })
+    result: dict = cur.fetchone()
+
+    if not result['team_exists']:
+        # if no cooking team is found with the id, we stop the operation.
+        raise ValueError(f"No cooking team found with this id : {cooking_team_id}.\nPlease create the team to allocate items.")
+
+    shortfall_df: pd.DataFrame = pd.DataFrame(result['shortfalls'], columns = allocation_shortfall_columns)
+
+    if not shortfall_df.empty:
+        return (None, shortfall_df)
+
+    return (result['allocations'], shortfall_df)
+
+
+def build_allocations_query(
+        cooking_team_id: int | None = None,
+        item_id: int | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        dish: str | None = None,
+        after: int | None = None,
+        limit: int | None = None,
+        aggregate: bool = False
+) -> tuple[str, dict]:
+    
+    """
+        Builds the allocations select statement and its parameters for the given filters.
+        See `get_allocations` for the parameters.
+    """
+
+    conditions: list[str] = []
+    vars: dict = {}
+
+    if cooking_team_id is not None:
+        conditions.append("a.cooking_team_id = %(cooking_team_id)s")
+        vars["cooking_team_id"] = int(cooking_team_id)
+
+    if item_id is not None:
+        conditions.append("a.item_id = %(item_id)s")
+        vars["item_id"] = int(item_id)
+
+    if start_date is not None:
+        conditions.append("a.allocated_at >= %(start_date)s")
+        vars["start_date"] = start_date
+
+    if end_date is not None:
+        # end date is inclusive.
+        conditions.append("a.allocated_at < %(end_date)s")
+        vars["end_date"] = end_date + timedelta(days = 1)
+
+    if dish:
+        conditions.append("a.dish ilike %(dish)s")
+        vars["dish"] = f"%{escape_like_pattern(dish.strip())}%"
+
+    if aggregate:
+        # per item totals, the grouping is done by postgres.
+        where_clause: str = f"where {' and '.join(conditions)}" if conditions else ""
+        sql: str = f"""
+            select 
+                i.id as item_id,
+                initcap(i.name) as item,
+                x.quantity,
+                i.unit_of_measurement
+            from (
+                select 
+                    a.item_id,
+                    sum(a.quantity) as quantity
+                from 
+                    allocations as a
+                {where_clause}
+                group by 
+                    a.item_id
+            ) as x
+            join 
+                items as i 
+            on 
+                i.id = x.item_id
+            order by 
+                x.quantity desc
+            ;
+        """
+        return (sql, vars)
+
+    if after is not None:
+        # keyset pagination: rows strictly after the last allocation of the previous page.
+        conditions.append("""
+            (a.allocated_at, a.allocation_id) > (
+                select 
+                    p.allocated_at, p.allocation_id 
+                from 
+                    allocations as p 
+                where 
+                    p.allocation_id = %(after)s
+            )
+        """)
+        vars["after"] = int(after)
+
+    where_clause: str = f"where {' and '.join(conditions)}" if conditions else ""
+    limit_clause: str = ""
+
+    if limit is not None:
+        limit_clause = "limit %(limit)s"
+        vars["limit"] = int(limit)
+
+    sql: str = f"""
+        select 
+            a.allocation_id,
+            a.cooking_team_id,
+            upper(c.supervisor_name) as supervisor_name,
+            --c.supervisor_phone_num,
+            initcap(i.name) as item,
+            a.quantity,
+            i.id as item_id,
+            i.unit_of_measurement,
+            a.dish,
+            a.allocated_at::date as alloacted_on,
+            to_char(a.allocated_at, 'HH12 : MI : SS AM') as allocated_at
+        from 
+            allocations as a
+        join 
+            cooking_teams as c
+        on 
+            a.cooking_team_id = c.id
+        join 
+            items as i 
+        on 
+            a.item_id = i.id
+        {where_clause}
+        order by 
+            a.allocated_at, a.allocation_id
+        {limit_clause}
+        ;
+    """
+
+    return (sql, vars)
+
+
+@instrumented
+def get_allocations(
+        cooking_team_id: int | None = None,
+        item_id: int | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        dish: str | None = None,
+        after: int | None = None,
+        limit: int | None = None,
+        aggregate: bool = False
+) -> (pd.DataFrame | None):
+    
+    """
+        Returns the allocations matching the filters, oldest first.
+
+        Parameters
+        ----------
+        cooking_team_id: int | None 
+            Only the allocations of this supervisor's cooking team.
+        item_id: int | None 
+            Only the allocations of this item.
+        start_date: date | None 
+            Only the allocations made on or after this date.
+        end_date: date | None 
+            Only the allocations made on or before this date.
+        dish: str | None 
+            Only the allocations whose dish contains this text (case insensitive).
+        after: int | None 
+            Keyset pagination, the allocation_id of the last row of the previous page.
+        limit: int | None 
+            Maximum number of rows (page size).
+        aggregate: bool 
+            If True, returns the total quantity per item (item_id, item, quantity, unit_of_measurement) 
+            for the filtered allocations instead of the individual rows, `after` and `limit` are ignored.
+
+        Returns
+        -------
+        pd.DataFrame
+            the allocations or the per item totals.
+        None
+            if no allocation matches.
+    """
+
+    sql, vars = build_allocations_query(
+        cooking_team_id = cooking_team_id, item_id = item_id, 
+        start_date = start_date, end_date = end_date, dish = dish,
+        after = after, limit = limit, aggregate = aggregate
+    )
+    alloactions = execute_sql_select_query(sql, vars = vars, cache_tables = ("allocations", "cooking_teams", "items"))
+
+    return alloactions    
+
+
+def stream_allocations(chunk_size: int = 10_000, **filters) -> Iterator[pd.DataFrame]:
+
+    "Same rows as `get_allocations` (accepts the same filters), streamed in dataframes of `chunk_size` rows."
+
+    sql, vars = build_allocations_query(**filters)
+
+    yield from stream_sql_select_query(sql, vars = vars, chunk_size = chunk_size)
+
+
+def export_report_to_csv(
+        report: Literal["contributions", "allocations"], 
+        path: str,
+        chunk_size: int = 10_000
+) -> int:
+
+    """
+        Writes a full history report to a csv file chunk by chunk, in bounded memory.
+
+        Returns
+        -------
+        int 
+            Number of rows written.
+    """
+
+    reports: dict[str, Callable[[int], Iterator[pd.DataFrame]]] = {
+        "contributions": stream_all_contribution,
+        "allocations": stream_allocations
+    }
+
+    row_count: int = 0
+
+    with open(path, "w", newline = "", encoding = "utf-8") as file:
+        for chunk in reports[report](chunk_size):
+            chunk.to_csv(file, header = (row_count == 0), index = False)
+            row_count += len(chunk)
+
+    print(f"{row_count} {report} rows exported to {path}")
+
+    return row_count
+
+
+@instrumented
+def is_bill_exists(
+    bill_book_code: str, 
+    bill_id: int, 
+    cur: pg.extensions.cursor | None = None
+) -> bool: 
+    
+    """
+        Helper function used to check the bill is already created.
+    """
+    sql: str = """
+        select 
+            1 as bill_exist
+        from 
+            bill_books
+        where 
+            bill_book_code = %(bill_book_code)s and 
+            bill_id = %(bill_id)s
+        ;
+    """
+    
+    if not cur: 
+        with get_db().cursor() as cur:
+            prepared_statements.execute(cur, sql, vars = {"bill_book_code": bill_book_code, "bill_id": bill_id})
+            result = cur.fetchone()
+    else:
+        prepared_statements.execute(cur, sql, vars = {"bill_book_code": bill_book_code, "bill_id": bill_id})
+        result = cur.fetchone()
+
+    return bool(result)    
+
+
+@instrumented
+def create_new_bill_record(
+    bill_book_code: str, 
+    bill_id: int, 
+    contributor_name: str, 
+    contributor_phone_num: str, 
+    contribution_df: pd.DataFrame,
+    policy: Literal["create", "replace", "add", "skip"] = "replace",
+    idempotency_key: str | None = None
+) -> tuple[bool, list[dict]]:
+    
+    """
+        Creates the bill or updates it if it already exists, in a single round trip (see `write_bill_record`).
+
+        The donor details of an existing bill are updated with the given ones (blank values keep 
+        the stored ones) and its line items are merged according to the policy.
+        Inventory balances are adjusted by the difference in the same transaction.
+
+        Parameters
+        ----------
+        bill_book_code: str 
+            Unique code represents particular bill_book eg.B1, B2 etc.   
+        bill_id: int 
+            Unique id/page represents the particular bill entered in the bill book.
+        contributor_name: str 
+            Name of the donor.
+        contributor_phone_num: str 
+            Phone number of the donor.
+        contribution_df: pd.DataFrame
+            item_id and quantity (eg. the lines of `validate_item_lines`), or items 
+            ("<item_id> - <item> - <unit>" as selected in the app) and quantity. 
+            An item listed more than once is summed.
+        policy: Literal["create", "replace", "add", "skip"]
+            How the items of an existing bill are merged:
+                create: an existing bill is left untouched (returns (False, [])), so the caller can ask.
+                replace: the bill ends up with exactly the given items and quantities.
+                add: the given quantities are added to the recorded ones, other recorded items are kept.
+                skip: items already on the bill are left untouched, only new items are added.
+        idempotency_key: str | None 
+            Unique key of this bill entry, it is applied at most once (see `claim_write`).
+
+        Returns
+        -------
+        tuple[bool, list[dict]]
+            whether the bill was created (False if it existed) and the diff of the line items 
+            (item_id, previous_quantity, quantity, change: added | updated | removed | unchanged), 
+            (False, []) if the entry with this idempotency key was already applied.
+    """
+
+    if policy not in ("create", "replace", "add", "skip"):
+        raise ValueError(f"Invalid policy : {policy}")
+
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            written: tuple[bool, list[dict]] | None = write_bill_record(
+                cur, bill_book_code, bill_id, contributor_name, contributor_phone_num, contribution_df, policy, 
+                idempotency_key = idempotency_key
+            )
+
+            if written is None:
+                # already applied (eg. the first attempt committed but its reply was lost).
+                conn.rollback()
+                return (False, [])
+
+            bill_created, changes = written
+            conn.commit()
+            get_query_cache().invalidate("bill_books", "transactions", "inventory_balances", *contribution_summary_tables)
+
+            print("All records inserted")
+
+        except Exception as e: 
+            conn.rollback()
+            print(str(e))
+            raise e
+
+    return (bill_created, changes)
+
+
+def write_bill_record(
+    cur: pg.extensions.cursor,
+    bill_book_code: str, 
+    bill_id: int, 
+    contributor_name: str, 
+    contributor_phone_num: str, 
+    contribution_df: pd.DataFrame,
+    policy: Literal["create", "replace", "add", "skip"] = "replace",
+    idempotency_key: str | None = None
+) -> (tuple[bool, list[dict]] | None):
+
+    """
+        Runs the statements of `create_new_bill_record` in the cursor's transaction, without committing.
+        Returns None if the entry with this idempotency key was already applied.
+
+        The statements are sent in one execute (one round trip) and pass their outcome on through 
+        transaction local settings. Each one reads with its own snapshot: the bill row is locked 
+        before its lines are read, so a session writing the same bill concurrently (even a new bill, 
+        whose insert is waited for) is applied on top of the other one instead of both starting 
+        from the same lines.
+    """
+
+    # Create transactions.
+    quantities: pd.Series = bill_line_quantities(contribution_df)
+    write_lines: str = "current_setting('meenakshi.write_lines')::boolean"
+
+    sql: str = f"""
+        -- claim the idempotency key and create the bill if it does not exist, 
+        -- waits for a concurrent session inserting the same bill or key.
+        with claimed as (
+            insert into applied_writes
+                (idempotency_key, kind)
+            select 
+                %(idempotency_key)s, 'bill'
+            where 
+                %(idempotency_key)s::varchar is not null
+            on conflict (idempotency_key) do nothing
+            returning 
+                idempotency_key
+        ),
+        created as (
+            insert into bill_books
+                (bill_book_code, bill_id, donar_name, donar_phone_num)
+            select 
+                %(bill_book_code)s, %(bill_id)s, %(donar_name)s, %(donar_phone_num)s
+            where 
+                %(idempotency_key)s::varchar is null or exists (select from claimed)
+            on conflict (bill_book_code, bill_id) do nothing
+            returning 
+                bill_id
+        )
+        select 
+            set_config('meenakshi.applied', (%(idempotency_key)s::varchar is null or exists (select from claimed))::text, true),
+            set_config('meenakshi.bill_created', (exists (select from created))::text, true)
+        ;
+
+        -- lock the bill row, 'create' leaves an existing bill untouched.
+        with locked as (
+            select 
+                bill_id
+            from 
+                bill_books
+            where 
+                bill_book_code = %(bill_book_code)s and 
+                bill_id = %(bill_id)s and 
+                current_setting('meenakshi.applied')::boolean and 
+                (%(policy)s <> 'create' or current_setting('meenakshi.bill_created')::boolean)
+            for update
+        )
+        select 
+            set_config('meenakshi.write_lines', (exists (select from locked))::text, true)
+        ;
+
+        -- the bill's previous lines are taken out of the contribution summaries, 
+        -- under the donor they were summarized for.
+        {contribution_summary_delta_sql(-1, condition = write_lines)}
+
+        -- then the donor details are updated (blank values keep the stored ones).
+        update 
+            bill_books
+        set 
+            donar_name = coalesce(%(donar_name)s, donar_name),
+            donar_phone_num = coalesce(%(donar_phone_num)s, donar_phone_num)
+        where 
+            bill_book_code = %(bill_book_code)s and 
+            bill_id = %(bill_id)s and 
+            {write_lines}
+        ;
+
+        with new_lines as (
+            select 
+                n.item_id, n.quantity
+            from 
+                unnest(%(item_ids)s::integer[], %(quantities)s::numeric[]) as n(item_id, quantity)
+            where 
+                {write_lines}
+        ),
+        old_lines as (
+            select 
+                t.item_id, t.quantity
+            from 
+                transactions as t
+            where 
+                t.bill_book_code = %(bill_book_code)s and t.bill_id = %(bill_id)s and 
+                {write_lines}
+        ),
+        merged as (
+            select 
+                coalesce(n.item_id, o.item_id) as item_id,
+                o.quantity as previous_quantity,
+                case 
+                    when o.item_id is null then n.quantity
+                    when n.item_id is null then (case when %(policy)s = 'replace' then null else o.quantity end)
+                    when %(policy)s in ('create', 'replace') then n.quantity
+                    when %(policy)s = 'add' then o.quantity + n.quantity
+                    else o.quantity
+                end as quantity
+            from 
+                new_lines as n
+            full join 
+                old_lines as o
+            on 
+                o.item_id = n.item_id
+        ),
+        removed as (
+            delete from 
+                transactions as t
+            using 
+                merged as m
+            where 
+                t.bill_book_code = %(bill_book_code)s and 
+                t.bill_id = %(bill_id)s and 
+                t.item_id = m.item_id and 
+                m.quantity is null
+        ),
+        written as (
+            insert into transactions
+                (bill_book_code, bill_id, item_id, quantity)
+            select 
+                %(bill_book_code)s, %(bill_id)s, m.item_id, m.quantity
+            from 
+                merged as m
+            where 
+                m.quantity is not null and 
+                m.quantity is distinct from m.previous_quantity
+            on conflict (bill_book_code, bill_id, item_id) do update set 
+                quantity = excluded.quantity
+        ),
+        balances as (
+            insert into inventory_balances
+                (item_id, received_quantity)
+            select 
+                m.item_id, 
+                coalesce(m.quantity, 0) - coalesce(m.previous_quantity, 0)
+            from 
+                merged as m
+            where 
+                m.quantity is distinct from m.previous_quantity
+            order by 
+                m.item_id
+            on conflict (item_id) do update set 
+                received_quantity = inventory_balances.received_quantity + excluded.received_quantity,
+                updated_at = now()
+        )
+        select 
+            set_config('meenakshi.bill_changes', coalesce(json_agg(c order by c.item_id), '[]')::text, true)
+        from (
+            select 
+                m.item_id,
+                m.previous_quantity,
+                m.quantity,
+                case 
+                    when m.previous_quantity is null then 'added'
+                    when m.quantity is null then 'removed'
+                    when m.quantity = m.previous_quantity then 'unchanged'
+                    else 'updated'
+                end as change
+            from 
+                merged as m
+        ) as c
+        ;
+
+        -- and its new lines added back.
+        {contribution_summary_delta_sql(1, condition = write_lines)}
+        {notify_changes_sql("bill_books", "transactions", "inventory_balances", *contribution_summary_tables, condition = write_lines)}
+
+        -- one row even if the bill has no items (item_id null).
+        select 
+            current_setting('meenakshi.applied')::boolean as applied,
+            current_setting('meenakshi.bill_created')::boolean as bill_created,
+            c.item_id,
+            c.previous_quantity,
+            c.quantity,
+            c.change
+        from 
+            (select 1) as bill
+        left join 
+            json_to_recordset(current_setting('meenakshi.bill_changes')::json) 
+                as c(item_id integer, previous_quantity numeric, quantity numeric, change varchar)
+        on 
+            true
+        order by 
+            c.item_id
+        ;
+    """
+
+    vars: dict = {
+        "bill_book_code": bill_book_code, 
+        "bill_id": int(bill_id), 
+        "donar_name": contributor_name or None, 
+        "donar_phone_num": contributor_phone_num or None,
+        "item_ids": [int(item_id) for item_id in quantities.index],
+        "quantities": quantities.tolist(),
+        "policy": policy,
+        "idempotency_key": idempotency_key,
+        "bill_book_codes": [bill_book_code],
+        "bill_ids": [int(bill_id)]
+    }
+
+    # psycopg2 returns the rows of the last statement only.
+    cur.execute(sql, vars = vars)
+    rows: list[dict] = cur.fetchall()
+
+    if not rows[0]["applied"]:
+        # already applied (eg. the first attempt committed but its reply was lost).
+        return None
+
+    bill_created: bool = bool(rows[0]["bill_created"])
+    changes: list[dict] = [
+        {key: value for key, value in row.items() if key not in ("applied", "bill_created")} 
+        for row in rows if row["item_id"] is not None
+    ]
+
+    return (bill_created, changes)
+
+
+# Bill book codes printed on the paper bill books.
+bill_book_codes: list[str] = [f"B{x}" for x in range(1, 101)]
+
+bill_import_columns: list[str] = [
+    "bill_book_code", "bill_id", "donar_name", "donar_phone_num", "item_id", "quantity"
+]
+
+
+def read_bill_file(source: Any, file_name: str | None = None) -> pd.DataFrame:
+
+    """
+        Reads a csv or excel file of bills, one line item per row.
+
+        Parameters
+        ----------
+        source: Any 
+            Path or file like object.
+        file_name: str | None 
+            Name used to detect the format when `source` is a file object (eg. an uploaded file).
+    """
+
+    file_name = file_name or str(source)
+
+    # everything is read as text, the values are validated in `validate_bill_rows`.
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(source, dtype = str)
+    
+    return pd.read_csv(source, dtype = str, skipinitialspace = True)
+
+
+def validate_bill_rows(bills_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+
+    """
+        Validates the rows of a bill file against the items table in one vectorized pass.
+
+        Expected columns are `bill_import_columns`, an optional `unit_of_measurement` column 
+        is checked against the unit of the item.
+
+        Returns
+        -------
+        tuple[pd.DataFrame, pd.DataFrame]
+            the valid rows (typed, in `bill_import_columns` order) and the error report 
+            (row: 1 based row number in the file, error: reasons the row is rejected).
+    """
+
+    missing_columns: list[str] = [column for column in bill_import_columns if column not in bills_df.columns]
+
+    if missing_columns:
+        raise ValueError(f"Bill file is missing the columns : {', '.join(missing_columns)}")
+
+    df: pd.DataFrame = bills_df.reset_index(drop = True)
+    items_df: pd.DataFrame | None = get_all_items()
+    units: dict[int, str] = (
+        {} if items_df is None 
+        else dict(zip(items_df["item_id"], items_df["unit_of_measurement"].str.lower()))
+    )
+
+    bill_book_code: pd.Series = df["bill_book_code"].str.strip().str.upper()
+    bill_id: pd.Series = pd.to_numeric(df["bill_id"], errors = "coerce")
+    item_id: pd.Series = pd.to_numeric(df["item_id"], errors = "coerce")
+    quantity: pd.Series = pd.to_numeric(df["quantity"], errors = "coerce")
+    donar_name: pd.Series = df["donar_name"].str.strip()
+    donar_phone_num: pd.Series = df["donar_phone_num"].str.strip()
+    item_unit: pd.Series = item_id.map(units)
+
+    checks: list[tuple[pd.Series, str]] = [
+        (~bill_book_code.isin(bill_book_codes), "unknown bill book code"),
+        (bill_id.isna() | (bill_id % 1 != 0) | (bill_id < 1), "bill id must be a whole number from 1"),
+        (item_id.isna() | (item_id % 1 != 0), "item id must be a whole number"),
+        (item_id.notna() & item_unit.isna(), "unknown item id"),
+        (quantity.isna() | (quantity <= 0), "quantity must be a number greater than 0"),
+        (donar_name.str.len() > 100, "donar name longer than 100 characters"),
+        (donar_phone_num.str.len() > 12, "donar phone number longer than 12 characters"),
+    ]
+
+    if "unit_of_measurement" in df.columns:
+        given_unit: pd.Series = df["unit_of_measurement"].str.strip().str.lower()
+        checks.append((
+            given_unit.notna() & (given_unit != "") & item_unit.notna() & (given_unit != item_unit), 
+            "unit does not match the item's unit"
+        ))
+
+    # the same item may appear only once per bill.
+    checks.append((
+        pd.concat([bill_book_code, bill_id, item_id], axis = 1).duplicated(keep = "first"), 
+        "duplicate item in the same bill"
+    ))
+
+    errors: pd.Series = pd.Series("", index = df.index)
+    for mask, message in checks:
+        mask = mask.fillna(False).astype(bool)
+        errors = errors.where(~mask, errors + message + "; ")
+
+    invalid: pd.Series = errors != ""
+
+    error_report: pd.DataFrame = pd.DataFrame({
+        "row": df.index[invalid] + 1,
+        "error": errors[invalid].str.rstrip("; ")
+    }).reset_index(drop = True)
+
+    valid_df: pd.DataFrame = pd.DataFrame({
+        "bill_book_code": bill_book_code,
+        "bill_id": bill_id,
+        "donar_name": donar_name,
+        "donar_phone_num": donar_phone_num,
+        "item_id": item_id,
+        "quantity": quantity
+    })[~invalid]
+    valid_df = valid_df.astype({"bill_id": int, "item_id": int})
+
+    return (valid_df.reset_index(drop = True), error_report)
+
+
+def bill_line_quantities(contribution_df: pd.DataFrame) -> pd.Series:
+
+    """
+        Quantity per item id of the lines of a bill (item id index, an item listed more than once is summed).
+
+        Reads the item_id column of validated lines, else parses the ids out of the 
+        "<item_id> - <item> - <unit>" items column.
+    """
+
+    if "item_id" in contribution_df.columns:
+        item_ids: pd.Series = contribution_df["item_id"].astype(int)
+    else:
+        item_ids = contribution_df["items"].str.split("-").str[0].astype(int)
+
+    return contribution_df["quantity"].groupby(item_ids.values).sum()
+
+
+def validate_item_lines(lines_df: pd.DataFrame, catalog: "Catalog | None" = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+
+    """
+        Validates the item lines entered in the app (data_editor) against the catalog in one 
+        vectorized pass, so an invalid bill or allocation never reaches the database.
+
+        The chosen options are mapped to their item through the catalog's precomputed index. 
+        Rows left blank are ignored, an item entered on several rows is summed.
+
+        Parameters
+        ----------
+        lines_df: pd.DataFrame
+            items (the chosen "<item_id> - <item> - <unit>" option) and quantity.
+        catalog: Catalog | None
+            Catalog the options were picked from, the current one if None.
+
+        Returns
+        -------
+        tuple[pd.DataFrame, pd.DataFrame]
+            the lines (item_id, item, quantity, unit_of_measurement, one row per item in entry order) 
+            and the error report (row: 1 based row number, error: reasons the row is rejected).
+            Write the lines only if the error report is empty.
+    """
+
+    catalog = catalog_snapshot.get() if catalog is None else catalog
+    df: pd.DataFrame = lines_df.reset_index(drop = True)
+
+    chosen: pd.Series = df["items"].astype("string").str.strip().fillna("")
+    quantity: pd.Series = pd.to_numeric(df["quantity"], errors = "coerce")
+    blank: pd.Series = (chosen == "") & quantity.isna()
+
+    # -1 for an option the catalog does not know (eg. an item renamed since the page was loaded).
+    positions: pd.Series = pd.Series(catalog.option_index.get_indexer(chosen), index = df.index)
+    item_id: pd.Series = positions.map(pd.Series(catalog.item_ids))
+    item: pd.Series = positions.map(pd.Series(np.asarray(catalog.item_names)))
+    unit: pd.Series = positions.map(pd.Series(np.asarray(catalog.units)))
+
+    checks: list[tuple[pd.Series, str]] = [
+        (chosen == "", "no item chosen"),
+        ((chosen != "") & item_id.isna(), "unknown item"),
+        (quantity.isna() | (quantity <= 0), "quantity must be a number greater than 0"),
+        (
+            (unit.astype("string").str.lower() == "nos") & quantity.notna() & (quantity % 1 != 0), 
+            "quantity of an item counted in numbers must be a whole number"
+        ),
+    ]
+
+    errors: pd.Series = pd.Series("", index = df.index)
+    for mask, message in checks:
+        mask = mask.fillna(False).astype(bool) & ~blank
+        errors = errors.where(~mask, errors + message + "; ")
+
+    invalid: pd.Series = errors != ""
+
+    error_report: pd.DataFrame = pd.DataFrame({
+        "row": df.index[invalid] + 1,
+        "error": errors[invalid].str.rstrip("; ")
+    }).reset_index(drop = True)
+
+    valid: pd.Series = ~invalid & ~blank
+    lines_df = pd.DataFrame({
+        "item_id": item_id[valid].astype(int),
+        "item": item[valid],
+        "quantity": quantity[valid],
+        "unit_of_measurement": unit[valid]
+    }).groupby(["item_id", "item", "unit_of_measurement"], as_index = False, sort = False)["quantity"].sum()
+
+    return (lines_df[["item_id", "item", "quantity", "unit_of_measurement"]], error_report)
+
+
+@instrumented
+def import_bills(bills_df: pd.DataFrame) -> tuple[int, pd.DataFrame]:
+
+    """
+        Bulk loads many bills (eg. a whole paper bill book) in one transaction.
+
+        The rows are validated with `validate_bill_rows`, the valid ones are staged with `COPY` 
+        and upserted into `bill_books` and `transactions`: donor details of existing bills are updated 
+        and the quantity of an item already recorded on a bill is replaced by the file's quantity.
+        Inventory balances are adjusted by the difference in the same transaction.
+
+        Returns
+        -------
+        tuple[int, pd.DataFrame]
+            number of line items imported and the per row error report of the rejected rows.
+    """
+
+    valid_df, error_report = validate_bill_rows(bills_df)
+
+    if valid_df.empty:
+        print(f"No valid rows to import, {len(error_report)} rows rejected.")
+        return (0, error_report)
+
+    buffer: io.StringIO = io.StringIO()
+    valid_df[bill_import_columns].to_csv(buffer, header = False, index = False)
+    buffer.seek(0)
+
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            cur.execute("""
+                create temp table bill_import_staging (
+                    bill_book_code varchar(5) not null,
+                    bill_id integer not null,
+                    donar_name varchar(100),
+                    donar_phone_num varchar(12),
+                    item_id integer not null,
+                    quantity numeric not null
+                ) on commit drop;
+            """)
+            cur.copy_expert(
+                f"copy bill_import_staging ({', '.join(bill_import_columns)}) from stdin with (format csv);", 
+                buffer
+            )
+
+            # other writers of transactions wait until the import commits, so the balance deltas stay exact.
+            cur.execute("lock table transactions in share row exclusive mode;")
+
+            bills: pd.DataFrame = valid_df[["bill_book_code", "bill_id"]].drop_duplicates()
+            summary_vars: dict = {
+                "bill_book_codes": bills["bill_book_code"].tolist(), 
+                "bill_ids": bills["bill_id"].astype(int).tolist()
+            }
+            # the previous lines of the bills are taken out of the contribution summaries.
+            cur.execute(contribution_summary_delta_sql(-1), vars = summary_vars)
+
+            cur.execute("""
+                insert into bill_books
+                    (bill_book_code, bill_id, donar_name, donar_phone_num)
+                select distinct on (s.bill_book_code, s.bill_id)
+                    s.bill_book_code, s.bill_id, s.donar_name, s.donar_phone_num
+                from 
+                    bill_import_staging as s
+                order by 
+                    s.bill_book_code, s.bill_id, s.donar_name nulls last
+                on conflict (bill_book_code, bill_id) do update set 
+                    donar_name = coalesce(excluded.donar_name, bill_books.donar_name),
+                    donar_phone_num = coalesce(excluded.donar_phone_num, bill_books.donar_phone_num)
+                ;
+            """)
+
+            cur.execute("""
+                insert into inventory_balances
+                    (item_id, received_quantity)
+                select 
+                    s.item_id,
+                    sum(s.quantity - coalesce(t.quantity, 0))
+                from 
+                    bill_import_staging as s
+                left join 
+                    transactions as t
+                on 
+                    t.bill_book_code = s.bill_book_code and 
+                    t.bill_id = s.bill_id and 
+                    t.item_id = s.item_id
+                group by 
+                    s.item_id
+                order by 
+                    s.item_id
+                on conflict (item_id) do update set 
+                    received_quantity = inventory_balances.received_quantity + excluded.received_quantity,
+                    updated_at = now()
+                ;
+            """)
+
+            cur.execute("""
+                insert into transactions
+                    (bill_book_code, bill_id, item_id, quantity)
+                select 
+                    s.bill_book_code, s.bill_id, s.item_id, s.quantity
+                from 
+                    bill_import_staging as s
+                on conflict (bill_book_code, bill_id, item_id) do update set 
+                    quantity = excluded.quantity
+                ;
+            """)
+            imported: int = cur.rowcount
+
+            # and their new lines added back.
+            cur.execute(
+                contribution_summary_delta_sql(1) + 
+                notify_changes_sql("bill_books", "transactions", "inventory_balances", *contribution_summary_tables), 
+                vars = summary_vars
+            )
+
+            conn.commit()
+            get_query_cache().invalidate("bill_books", "transactions", "inventory_balances", *contribution_summary_tables)
+
+        except Exception as e:
+            conn.rollback()
+            print(f"Error occur during importing the bills: {str(e)}")
+            raise e
+
+    print(f"{imported} line items imported, {len(error_report)} rows rejected.")
+
+    return (imported, error_report)
+
+
+# Offline write queue: a bill or an allocation that cannot reach the database (see `is_offline_error`) 
+# is appended to a local journal instead of being lost, and flushed to postgres in batches when 
+# the database is reachable again. Every write carries an idempotency key, claimed in `applied_writes` 
+# in the same transaction as the write, so a retried or re-flushed entry is applied exactly once.
+
+def claim_write(cur: pg.extensions.cursor, idempotency_key: str, kind: Literal["bill", "allocation"]) -> bool:
+
+    "Records the key in the cursor's transaction, returns False if it was already applied."
+
+    cur.execute("""
+        insert into applied_writes
+            (idempotency_key, kind)
+        values
+            (%(idempotency_key)s, %(kind)s)
+        on conflict (idempotency_key) do nothing
+        returning 
+            idempotency_key
+        ;
+    """, vars = {"idempotency_key": idempotency_key, "kind": kind})
+
+    return cur.fetchone() is not None
+
+
+class WriteJournal:
+
+    """
+        Durable, append only journal (a local sqlite file) of the writes waiting for the database.
+
+        Entries are flushed in the order they were queued. An entry that the database refuses 
+        (eg. not enough stock left for a queued allocation) is kept as rejected for review instead 
+        of being retried. The file and its table are created when the journal is opened.
+    """
+
+    def __init__(self, path: str) -> None:
+
+        self.path: str = path
+        # one connection per thread, opened on first use (the app polls `counts` on every rerun).
+        self._local: threading.local = threading.local()
+
+        self._connection().execute("""
+            create table if not exists pending_writes (
+                sequence integer primary key autoincrement,
+                idempotency_key text not null unique,
+                kind text not null,
+                payload text not null,
+                queued_at text not null default (datetime('now', 'localtime')),
+                status text not null default 'pending',
+                error text
+            );
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+
+        conn: sqlite3.Connection | None = getattr(self._local, "connection", None)
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout = 10.0, isolation_level = None)
+            conn.execute("pragma journal_mode = wal;")
+            conn.execute("pragma synchronous = full;") # an acknowledged entry survives a power cut.
+            self._local.connection = conn
+
+        return conn
+
+    def append(self, idempotency_key: str, kind: Literal["bill", "allocation"], payload: dict) -> None:
+
+        conn: sqlite3.Connection = self._connection()
+
+        conn.execute(
+            "insert into pending_writes (idempotency_key, kind, payload) values (?, ?, ?) on conflict do nothing;",
+            (idempotency_key, kind, json.dumps(payload))
+        )
+
+    def pending(self, limit: int) -> list[tuple[str, str, dict]]:
+
+        "Returns the oldest pending entries (idempotency_key, kind, payload)."
+
+        conn: sqlite3.Connection = self._connection()
+
+        rows: list[tuple] = conn.execute(
+            "select idempotency_key, kind, payload from pending_writes where status = 'pending' order by sequence limit ?;",
+            (limit,)
+        ).fetchall()
+
+        return [(idempotency_key, kind, json.loads(payload)) for idempotency_key, kind, payload in rows]
+
+    def remove(self, idempotency_keys: list[str]) -> None:
+
+        conn: sqlite3.Connection = self._connection()
+
+        conn.executemany("delete from pending_writes where idempotency_key = ?;", [(key,) for key in idempotency_keys])
+
+    def reject(self, rejected: dict[str, str]) -> None:
+
+        "Marks the entries (idempotency_key -> reason) as rejected."
+
+        conn: sqlite3.Connection = self._connection()
+
+        conn.executemany(
+            "update pending_writes set status = 'rejected', error = ? where idempotency_key = ?;",
+            [(error, key) for key, error in rejected.items()]
+        )
+
+    def counts(self) -> dict[str, int]:
+
+        "Number of pending and rejected entries."
+
+        conn: sqlite3.Connection = self._connection()
+
+        counts: dict[str, int] = dict(conn.execute("select status, count(*) from pending_writes group by status;").fetchall())
+
+        return {"pending": counts.get("pending", 0), "rejected": counts.get("rejected", 0)}
+
+    def rejected(self) -> pd.DataFrame:
+
+        "The rejected entries, for review."
+
+        conn: sqlite3.Connection = self._connection()
+
+        rows: list[tuple] = conn.execute(
+            "select queued_at, kind, payload, error from pending_writes where status = 'rejected' order by sequence;"
+        ).fetchall()
+
+        return pd.DataFrame(rows, columns = ["queued_at", "kind", "payload", "error"])
+
+
+def queue_bill_record(
+    idempotency_key: str,
+    bill_book_code: str, 
+    bill_id: int, 
+    contributor_name: str, 
+    contributor_phone_num: str, 
+    contribution_df: pd.DataFrame,
+    policy: Literal["replace", "add", "skip"] = "replace"
+) -> None:
+
+    "Journals a `create_new_bill_record` call, use the idempotency key of the failed attempt."
+
+    get_write_journal().append(idempotency_key, "bill", {
+        "bill_book_code": bill_book_code,
+        "bill_id": int(bill_id),
+        "contributor_name": contributor_name,
+        "contributor_phone_num": contributor_phone_num,
+        "contribution": [
+            {"item_id": int(item_id), "quantity": float(quantity)} 
+            for item_id, quantity in bill_line_quantities(contribution_df).items()
+        ],
+        "policy": policy
+    })
+
+
+def queue_allocation(
+    idempotency_key: str,
+    cooking_team_id: int, 
+    item_ids: list[int],
+    quantities: list[int | float], 
+    dish: str | None = None
+) -> None:
+
+    "Journals an `allocate_items_to_cooking_team` call, use the idempotency key of the failed attempt."
+
+    get_write_journal().append(idempotency_key, "allocation", {
+        "cooking_team_id": int(cooking_team_id),
+        "item_ids": [int(item_id) for item_id in item_ids],
+        "quantities": [float(quantity) for quantity in quantities],
+        "dish": dish
+    })
+
+
+# attempts of a queued entry rolled back by a deadlock or a serialization failure within one flush.
+queued_write_attempts: int = 3
+
+
+@instrumented
+def flush_pending_writes(batch_size: int | None = None) -> dict[str, int]:
+
+    """
+        Applies the oldest pending journal entries to the database in one transaction.
+
+        Each entry runs under a savepoint: an entry rolled back by a deadlock or a serialization 
+        failure is retried right away (up to `queued_write_attempts` times, then kept pending for 
+        the next flush), an entry the database refuses otherwise is rolled back alone and marked 
+        rejected, the others are committed together. If the database cannot be reached 
+        (see `is_offline_error`) the error is raised and every entry stays pending.
+
+        Returns
+        -------
+        dict[str, int]
+            applied, duplicates (already applied before), rejected and deferred (kept pending) entry counts.
+    """
+
+    journal: WriteJournal = get_write_journal()
+    entries: list[tuple[str, str, dict]] = journal.pending(batch_size or get_settings().write_queue_batch_size)
+    done: list[str] = []
+    duplicates: int = 0
+    rejected: dict[str, str] = {}
+    deferred: int = 0
+
+    if not entries:
+        return {"applied": 0, "duplicates": 0, "rejected": 0, "deferred": 0}
+
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        for idempotency_key, kind, payload in entries:
+            for _ in range(queued_write_attempts):
+                cur.execute("savepoint queued_write;")
+
+                try:
+                    if kind == "bill":
+                        # the bill write claims its key itself, None if it was already applied.
+                        duplicates += write_bill_record(
+                            cur, payload["bill_book_code"], payload["bill_id"], 
+                            payload["contributor_name"], payload["contributor_phone_num"], 
+                            # item_id and quantity (items and quantity in the entries of older versions).
+                            pd.DataFrame(payload["contribution"]), 
+                            payload["policy"], idempotency_key = idempotency_key
+                        ) is None
+
+                    elif not claim_write(cur, idempotency_key, kind):
+                        duplicates += 1
+
+                    else:
+                        allocations, shortfall_df = write_allocation(
+                            cur, payload["cooking_team_id"], payload["item_ids"], payload["quantities"], payload["dish"]
+                        )
+                        if allocations is None:
+                            raise ValueError(f"Not enough stock : {shortfall_df.to_dict('records')}")
+
+                    cur.execute("release savepoint queued_write;")
+                    done.append(idempotency_key)
+                    break
+
+                except Exception as e:
+                    if is_offline_error(e):
+                        raise
+
+                    cur.execute("rollback to savepoint queued_write;")
+
+                    if isinstance(e, pg.extensions.TransactionRollbackError):
+                        # transient (deadlock, serialization failure), tried again right away.
+                        continue
+
+                    # the entry itself cannot be applied, the rest of the batch goes on.
+                    rejected[idempotency_key] = str(e)
+                    break
+
+            else:
+                # still contended after the last attempt, kept pending for the next flush.
+                deferred += 1
+
+        conn.commit()
+
+    get_query_cache().invalidate(
+        "bill_books", "transactions", "inventory_balances", "allocations", 
+        *contribution_summary_tables, *allocation_summary_tables
+    )
 
-    model_config = SettingsConfigDict(env_file = ".env")
+    # a crash before this point leaves the entries pending, they are counted as duplicates next time.
+    journal.remove(done)
+    journal.reject(rejected)
 
+    if rejected:
+        logger.warning("Rejected queued writes: %s", rejected)
 
-settings = Settings()
+    return {"applied": len(done) - duplicates, "duplicates": duplicates, "rejected": len(rejected), "deferred": deferred}
 
-    
 
-#Database Setup
+class WriteQueueFlusher:
 
-#connection parameters
-connection_params: dict[str, str] = {
+    """
+        Background thread flushing the journal every `interval` seconds while entries are pending.
+        While the database is unreachable it backs off (up to a minute) and keeps the entries.
+    """
 
-        'host': settings.db_host,
-        'database': settings.db_name,
-        'password': settings.db_password,
-        'user': settings.db_user,
-        "cursor_factory": RealDictCursor
-    }
+    def __init__(self, interval: float) -> None:
 
-db: pool.SimpleConnectionPool = pool.SimpleConnectionPool(
-    minconn = 4, maxconn = 12,
-    **connection_params
-)
+        self.interval: float = interval
+        self._stopped: threading.Event = threading.Event()
+        self._thread: threading.Thread = threading.Thread(
+            target = self._run, name = "write-queue-flusher", daemon = True
+        )
 
+    def start(self) -> None:
 
- 
+        self._thread.start()
 
-def execute_sql_select_query(
-        sql_statement: str, 
-        vars: tuple | dict | None = None
-) -> (pd.DataFrame | None):
+    def stop(self) -> None:
 
-    "Return the select sql statement as pandas dataframe object"
+        self._stopped.set()
 
-    conn: pg.extensions.connection = db.getconn()
-    cur: pg.extensions.cursor = conn.cursor()
+    def _run(self) -> None:
 
-    # executing the sql statement
-    cur.execute(sql_statement, vars = vars) # stores the value in cursor object
+        wait: float = self.interval
 
-    db.putconn(conn) # releasing the connection back to the pool.
+        while not self._stopped.wait(wait):
+            try:
+                while get_write_journal().counts()["pending"]:
+                    flushed: dict[str, int] = flush_pending_writes()
+                    logger.info("Flushed queued writes: %s", flushed)
 
-    #fetching the data from the cursor
-    data: RealDictCursor | None = cur.fetchall()
+                    if flushed["deferred"]:
+                        # contended entries are tried again at the next interval, not in a busy loop.
+                        break
+                wait = self.interval
 
-    if not data:
-        # if the result is empty list then we return None
-        return None
-    
-    df = pd.DataFrame(data)
-    df = df.map(lambda x: float(x) if isinstance(x, Decimal) else x)
+            except Exception as e:
+                if is_offline_error(e):
+                    logger.info("Database still unreachable (%s), queued writes kept.", e)
+                else:
+                    logger.exception("Flushing the queued writes failed.")
+                wait = min(wait * 2, 60.0)
 
-    #closing the cursor object
-    cur.close()
-    
-    return df
 
-def execute_sql_statements(
-        sql: str, vars: tuple | dict | None = None, 
-        # fetch: Literal["all", "one", "no_fetch"] = "no_fetch"
-) -> list[tuple] : 
+_write_queue_flusher: WriteQueueFlusher | None = None
+_write_queue_flusher_lock: threading.Lock = threading.Lock()
 
-    """
-        This function is used to execute the sql statements specially Insert clause except Select clause
 
-        Args
-        -----
-            sql: str 
-                sql statement.
-            vars: tuple 
-                A parameter which need to insert.
-    """
+def start_write_queue_flusher() -> WriteQueueFlusher:
 
-    # creating a new connection.
-    conn: pg.extensions.connection = db.getconn()
-    # creating a cursor object to execute sql statement.
-    cur: pg.extensions.cursor = conn.cursor()
+    "Starts the process wide flusher of the offline write queue once, returns it."
 
-    # executing the statement.
-    cur.execute(sql, vars = vars)
+    global _write_queue_flusher
 
-    #save the changes in the db.
-    conn.commit()
-    db.putconn(conn) # releasing the connection back to the pool.
+    with _write_queue_flusher_lock:
+        if _write_queue_flusher is None:
+            _write_queue_flusher = WriteQueueFlusher(get_settings().write_queue_flush_interval)
+            _write_queue_flusher.start()
 
-    result: list[RealDictCursor] = cur.fetchall() # fetching results from a cur obj.
-    cur.close()
-    
-    return result
-  
-  
-def get_all_items() -> (pd.DataFrame | None) : 
+    return _write_queue_flusher
 
-    "This function returns all the items list"
 
-    sql: str = """
-        select 
-            i.id as item_id,
-            initcap(i.name) as item,
-            i.unit_of_measurement
-        from
-            items as i
-        order by 
-            i.id
-    """    
-    items_df = execute_sql_select_query(sql)
-    
-    return items_df
+# Contribution summaries: pre aggregated quantities by donor, bill book, item and day (each per item, 
+# as the quantities of different items have different units). They are maintained incrementally by 
+# the bill write paths: the lines of the written bills are subtracted before the write and added back 
+# after it, in the same transaction.
 
+# donors are identified by their normalized name and the digits of their phone number.
+donor_name_key_sql: str = "lower(btrim(coalesce({table}.donar_name, '')))"
+donor_phone_key_sql: str = "regexp_replace(coalesce({table}.donar_phone_num, ''), '\\D', '', 'g')"
 
-def get_all_contribution() -> (pd.DataFrame | None):
+contribution_summary_tables: tuple[str, ...] = (
+    "donor_contribution_summary", "bill_book_contribution_summary", 
+    "item_contribution_summary", "daily_contribution_summary"
+)
 
-    "This returns the contribution of all donar"
 
-    sql: str = """
+def contribution_summary_delta_sql(sign: Literal[1, -1], condition: str = "true") -> str:
 
+    """
+        Returns the statement adding (sign 1) or subtracting (sign -1) the current lines of the bills 
+        `%(bill_book_codes)s` / `%(bill_ids)s` to the contribution summaries. 
+        The bill rows are locked so the lines cannot change in between. 
+        Nothing is summarized unless the sql `condition` holds.
+    """
+
+    cleanup_sql: str = "".join(
+        f"delete from {table} where bill_count = 0;\n" for table in contribution_summary_tables
+    ) if sign == 1 else ""
+
+    return f"""
+        with lines as (
+            select 
+                b.bill_book_code,
+                t.item_id,
+                t.quantity * {sign} as quantity,
+                {sign} as bills,
+                t.donated_at::date as donated_on,
+                {donor_name_key_sql.format(table = "b")} as donor_name_key,
+                {donor_phone_key_sql.format(table = "b")} as donor_phone_key,
+                initcap(btrim(b.donar_name)) as donor_name
+            from (
+                select 
+                    *
+                from 
+                    bill_books as bb
+                where 
+                    (bb.bill_book_code, bb.bill_id) in (
+                        select * from unnest(%(bill_book_codes)s::varchar[], %(bill_ids)s::integer[])
+                    ) and 
+                    {condition}
+                for update
+            ) as b
+            join 
+                transactions as t
+            on 
+                t.bill_book_code = b.bill_book_code and t.bill_id = b.bill_id
+        ),
+        donors as (
+            insert into donor_contribution_summary as s
+                (donor_name_key, donor_phone_key, item_id, donor_name, total_quantity, bill_count)
+            select 
+                donor_name_key, donor_phone_key, item_id, max(donor_name), sum(quantity), sum(bills)
+            from 
+                lines
+            group by 
+                donor_name_key, donor_phone_key, item_id
+            order by 
+                1, 2, 3
+            on conflict (donor_name_key, donor_phone_key, item_id) do update set 
+                donor_name = coalesce(excluded.donor_name, s.donor_name),
+                total_quantity = s.total_quantity + excluded.total_quantity,
+                bill_count = s.bill_count + excluded.bill_count
+        ),
+        books as (
+            insert into bill_book_contribution_summary as s
+                (bill_book_code, item_id, total_quantity, bill_count)
+            select 
+                bill_book_code, item_id, sum(quantity), sum(bills)
+            from 
+                lines
+            group by 
+                bill_book_code, item_id
+            order by 
+                1, 2
+            on conflict (bill_book_code, item_id) do update set 
+                total_quantity = s.total_quantity + excluded.total_quantity,
+                bill_count = s.bill_count + excluded.bill_count
+        ),
+        items_summary as (
+            insert into item_contribution_summary as s
+                (item_id, total_quantity, bill_count)
+            select 
+                item_id, sum(quantity), sum(bills)
+            from 
+                lines
+            group by 
+                item_id
+            order by 
+                1
+            on conflict (item_id) do update set 
+                total_quantity = s.total_quantity + excluded.total_quantity,
+                bill_count = s.bill_count + excluded.bill_count
+        ),
+        days as (
+            insert into daily_contribution_summary as s
+                (donated_on, item_id, total_quantity, bill_count)
+            select 
+                donated_on, item_id, sum(quantity), sum(bills)
+            from 
+                lines
+            group by 
+                donated_on, item_id
+            order by 
+                1, 2
+            on conflict (donated_on, item_id) do update set 
+                total_quantity = s.total_quantity + excluded.total_quantity,
+                bill_count = s.bill_count + excluded.bill_count
+        )
         select 
-            b.*,
-            i.name as item,
-            t.quantity,
-            i.unit_of_measurement,
-            t.donated_at::date
+            count(*) as summarized_lines
         from 
-            transactions as t 
-        join 
-            items as i 
-        on 
-            i.id = t.item_id
-        join 
-            bill_books as b
-        on 
-            (b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id)
+            lines
         ;
-
+        {cleanup_sql}
     """
 
-    contribution_df = execute_sql_select_query(sql)
-    
-    return contribution_df
 
+# Recomputes every contribution summary from the raw bill_books and transactions tables.
+contribution_summary_rebuild_sql: str = f"""
+    delete from donor_contribution_summary;
+    delete from bill_book_contribution_summary;
+    delete from item_contribution_summary;
+    delete from daily_contribution_summary;
 
- 
-def get_particular_contribution(
-        bill_book_code: str, 
-        bill_id: int
-) -> (tuple[str, pd.DataFrame] | tuple[None, None]): 
+    create temp table contribution_summary_lines on commit drop as
+    select 
+        b.bill_book_code,
+        t.item_id,
+        t.quantity,
+        t.donated_at::date as donated_on,
+        {donor_name_key_sql.format(table = "b")} as donor_name_key,
+        {donor_phone_key_sql.format(table = "b")} as donor_phone_key,
+        initcap(btrim(b.donar_name)) as donor_name
+    from 
+        transactions as t
+    join 
+        bill_books as b
+    on 
+        b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id
+    ;
+
+    insert into donor_contribution_summary
+        (donor_name_key, donor_phone_key, item_id, donor_name, total_quantity, bill_count)
+    select 
+        donor_name_key, donor_phone_key, item_id, max(donor_name), sum(quantity), count(*)
+    from 
+        contribution_summary_lines
+    group by 
+        donor_name_key, donor_phone_key, item_id
+    ;
+
+    insert into bill_book_contribution_summary
+        (bill_book_code, item_id, total_quantity, bill_count)
+    select 
+        bill_book_code, item_id, sum(quantity), count(*)
+    from 
+        contribution_summary_lines
+    group by 
+        bill_book_code, item_id
+    ;
+
+    insert into item_contribution_summary
+        (item_id, total_quantity, bill_count)
+    select 
+        item_id, sum(quantity), count(*)
+    from 
+        contribution_summary_lines
+    group by 
+        item_id
+    ;
+
+    insert into daily_contribution_summary
+        (donated_on, item_id, total_quantity, bill_count)
+    select 
+        donated_on, item_id, sum(quantity), count(*)
+    from 
+        contribution_summary_lines
+    group by 
+        donated_on, item_id
+    ;
+
+    drop table contribution_summary_lines;
+"""
+
+
+@instrumented
+def rebuild_contribution_summaries() -> None:
+
+    "Recomputes the contribution summaries from the raw bill_books and transactions tables."
+
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            # block the bill writers while rebuilding so no bill is missed.
+            cur.execute("lock table bill_books, transactions in share mode;")
+            cur.execute(contribution_summary_rebuild_sql + notify_changes_sql(*contribution_summary_tables))
+            conn.commit()
+            get_query_cache().invalidate(*contribution_summary_tables)
+
+        except Exception as e:
+            conn.rollback()
+            print(f"Error occur during rebuilding contribution summaries: {str(e)}")
+            raise e
+
+    print("Contribution summaries rebuilt.")
+
+
+@instrumented
+def get_contribution_summary(
+        by: Literal["donor", "bill_book", "item", "day"],
+        item_id: int | None = None,
+        limit: int | None = None
+) -> (pd.DataFrame | None):
     
     """
-    This function returns the items contributed in a particular bill.
+        Returns the pre aggregated contributions, one row per group and item.
 
-    Parameter
-    ----------
-    bill_book_code: str 
-        Unique code represents particular bill_book eg.B1, B2 etc.   
-    bill_id: int 
-        Unique id/page represents the particular bill entered in the bill book.
-        
-    Returns
-    --------
-        tuple[str, pd.DataFrame] 
-            which is the donar name and the contribution if bill found with bill_id and bill_book_code.
-        tuple[None, None] 
-            if no bill is found with bill_id and bill_book_code.
+        Parameters
+        ----------
+        by: Literal["donor", "bill_book", "item", "day"]
+            donor: donor_name, donor_phone, item, total_quantity, bill_count (largest first).
+            bill_book: bill_book_code, item, total_quantity, bill_count.
+            item: item, total_quantity, bill_count (most bills first).
+            day: donated_on, item, total_quantity, bill_count (oldest first).
+        item_id: int | None 
+            Only the rows of this item.
+        limit: int | None 
+            Maximum number of rows.
 
+        Returns
+        -------
+        pd.DataFrame
+            the summary rows (with item_id and unit_of_measurement).
+        None
+            if there is nothing to summarize.
     """
 
-    sql: str = """
+    summaries: dict[str, tuple[str, str, str]] = {
+        # by: (table, group columns, order)
+        "donor": (
+            "donor_contribution_summary", 
+            "s.donor_name, nullif(s.donor_phone_key, '') as donor_phone,", 
+            "s.total_quantity desc"
+        ),
+        "bill_book": (
+            "bill_book_contribution_summary", 
+            "s.bill_book_code,", 
+            "length(s.bill_book_code), s.bill_book_code, s.item_id"
+        ),
+        # quantities of different units (Kg, L, Nos) do not compare, items are ranked by their bills.
+        "item": ("item_contribution_summary", "", "s.bill_count desc, s.item_id"),
+        "day": ("daily_contribution_summary", "s.donated_on,", "s.donated_on, s.item_id"),
+    }
 
-        select
+    if by not in summaries:
+        raise ValueError(f"Invalid summary : {by}")
+
+    table, group_columns, order = summaries[by]
+    vars: dict = {}
+    where_clause: str = ""
+    limit_clause: str = ""
+
+    if item_id is not None:
+        where_clause = "where s.item_id = %(item_id)s"
+        vars["item_id"] = int(item_id)
+
+    if limit is not None:
+        limit_clause = "limit %(limit)s"
+        vars["limit"] = int(limit)
+
+    sql: str = f"""
+        select 
+            {group_columns}
+            s.item_id,
             initcap(i.name) as item,
-            x.quantity,
+            s.total_quantity,
             i.unit_of_measurement,
-            x.donated_at::date as donated_on, 
-            to_char(x.donated_at, 'HH12 : MI : SS AM') as donated_at,
-            b.donar_name
-        from(
-            select 
-                *
-            from 
-                transactions as t 
-            where 
-                t.bill_book_code = %(bill_book_code)s and t.bill_id = %(bill_id)s
-        )x
-        join 
-            bill_books as b
-        on 
-            b.bill_book_code = x.bill_book_code and b.bill_id = x.bill_id
+            s.bill_count
+        from 
+            {table} as s
         join 
-            items as i 
+            items as i
         on 
-            i.id = x.item_id
+            i.id = s.item_id
+        {where_clause}
+        order by 
+            {order}
+        {limit_clause}
         ;
     """
 
-    contribution_df = execute_sql_select_query(sql, vars = {
-        'bill_book_code': bill_book_code, 
-        'bill_id': bill_id
-    })
-    
-    if contribution_df is None:
-        print("The contribution df is ", contribution_df)
-        return (None, None)
-    
-    donar_column: str = 'donar_name'
-    donar_name: str = contribution_df[donar_column].iloc[0]
+    summary_df = execute_sql_select_query(sql, vars = vars, cache_tables = (table, "items"))
 
-    final_df = contribution_df.drop(donar_column, axis=1)
+    return summary_df
 
-    return (donar_name, final_df)
 
+# Donor search: bills found by a part of the donor name (trigram index) or of the phone number 
+# digits (trigram index on the normalized phone), grouped per donor (same keys as the donor summary).
+donor_search_min_trigram_length: int = 3
 
 
+def escape_like_pattern(text: str) -> str:
 
-def add_new_items(
-        item_name: str, 
-        unit_of_measurement: Literal['Kg', 'L', 'Nos']
-) -> tuple | None:
+    "Escapes the like wildcards (%, _) and the escape character of a user text."
+
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_donor_search_query(search: str, limit: int = 20) -> tuple[str, dict]:
 
     """
-        This function is used to add a new item in the items table
+        Builds the donor search select statement and its parameters.
+        See `search_donors` for the parameters.
     """
 
-    if not item_name:
-        print('Item name must include')
-        return None
-    
-    # Check the item is already exists in our database.
+    search = search.strip()
+    phone_digits: str = "".join(character for character in search if character.isdigit())
+    by_phone: bool = bool(phone_digits) and not any(character.isalpha() for character in search)
 
-    existance_check_sql: str = """
+    name_key: str = donor_name_key_sql.format(table = "b")
+    phone_key: str = donor_phone_key_sql.format(table = "b")
+    term: str = phone_digits if by_phone else search.lower()
+    vars: dict = {"term": term, "limit": int(limit)}
+
+    if len(term) < donor_search_min_trigram_length:
+        # too short for trigrams, a prefix match served by the btree key index.
+        vars["pattern"] = f"{escape_like_pattern(term)}%"
+    else:
+        vars["pattern"] = f"%{escape_like_pattern(term)}%"
+
+    if by_phone:
+        condition: str = f"{phone_key} like %(pattern)s"
+        rank: str = "min(position(%(term)s in x.donor_phone_key))"
+    else:
+        # a close spelling (trigram similarity, `%` operator) also matches: "Lakshmi" finds "Laxmi".
+        condition = f"({name_key} like %(pattern)s or {name_key} %% %(term)s)"
+        rank = "max(similarity(x.donor_name_key, %(term)s)) desc"
+
+    sql: str = f"""
         select 
-            1
-        from 
-            items as i 
-        where 
-            i.name like lower(%(item_name)s)
+            max(x.donor_name) as donor_name,
+            nullif(x.donor_phone_key, '') as donor_phone,
+            count(*) as bill_count,
+            string_agg(
+                x.bill_book_code || '-' || x.bill_id, ', ' 
+                order by length(x.bill_book_code), x.bill_book_code, x.bill_id
+            ) as bills
+        from (
+            select 
+                {name_key} as donor_name_key,
+                {phone_key} as donor_phone_key,
+                initcap(btrim(b.donar_name)) as donor_name,
+                b.bill_book_code,
+                b.bill_id
+            from 
+                bill_books as b
+            where 
+                {condition}
+        ) as x
+        group by 
+            x.donor_name_key, x.donor_phone_key
+        order by 
+            {rank}, count(*) desc
+        limit %(limit)s
         ;
     """
 
-    previous_record = execute_sql_select_query(existance_check_sql, vars = {"item_name": item_name})
+    return (sql, vars)
 
-    if previous_record is not None:
-        print(previous_record)
+
+@instrumented
+def search_donors(search: str, limit: int = 20) -> (pd.DataFrame | None):
+
+    """
+        Finds the donors by a part of their name or phone number.
+
+        A search without letters is matched against the digits of the phone numbers ("98450 12" 
+        finds "+91 9845012345"), otherwise against the names, case insensitive, also accepting 
+        close spellings. Searches of 1 or 2 characters match the start of the name / phone number.
+
+        Parameters
+        ----------
+        search: str
+            part of the donor name or phone number.
+        limit: int
+            Maximum number of donors.
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per donor (best match first): donor_name, donor_phone, bill_count, 
+            bills (bill_book_code-bill_id list).
+        None
+            if the search is empty or nothing matches.
+    """
+
+    if not search or not search.strip():
         return None
-    
-    item_name = item_name.strip().lower() # standardizing the item names for backend convenience.
-    
-    sql: str = """
-        
-        insert into items
-            (name, unit_of_measurement)
-        values
-            (%(item_name)s, %(unit_of_measurement)s)
-        returning *
-        ;
+
+    sql, vars = build_donor_search_query(search, limit)
+
+    donors_df = execute_sql_select_query(sql, vars = vars, cache_tables = ("bill_books",))
+
+    return donors_df
+
+
+def build_donor_history_query(donor_name: str | None, donor_phone: str | None, aggregate: bool = False) -> tuple[str, dict]:
 
     """
-    result: tuple = execute_sql_statements(
-        sql, 
-        vars = {
-            'item_name': item_name,
-            'unit_of_measurement': unit_of_measurement
-        }
+        Builds the donor history select statement and its parameters.
+        See `get_donor_history` for the parameters.
+    """
+
+    vars: dict = {"donor_name": donor_name or "", "donor_phone": donor_phone or ""}
+    # the parameters are normalized like the stored keys.
+    donor_condition: str = """
+        {name_key} = lower(btrim(%(donor_name)s))
+        and {phone_key} = regexp_replace(%(donor_phone)s, '\\D', '', 'g')
+    """
+
+    if aggregate:
+        condition: str = donor_condition.format(name_key = "s.donor_name_key", phone_key = "s.donor_phone_key")
+        sql: str = f"""
+            select 
+                s.item_id,
+                initcap(i.name) as item,
+                s.total_quantity,
+                i.unit_of_measurement,
+                s.bill_count
+            from 
+                donor_contribution_summary as s
+            join 
+                items as i
+            on 
+                i.id = s.item_id
+            where 
+                {condition}
+            order by 
+                s.total_quantity desc
+            ;
+        """
+    else:
+        condition = donor_condition.format(
+            name_key = donor_name_key_sql.format(table = "b"), phone_key = donor_phone_key_sql.format(table = "b")
+        )
+        sql = f"""
+            select 
+                b.bill_book_code,
+                b.bill_id,
+                t.donated_at::date as donated_on,
+                t.item_id,
+                initcap(i.name) as item,
+                t.quantity,
+                i.unit_of_measurement
+            from 
+                bill_books as b
+            join 
+                transactions as t
+            on 
+                t.bill_book_code = b.bill_book_code
+                and t.bill_id = b.bill_id
+            join 
+                items as i
+            on 
+                i.id = t.item_id
+            where 
+                {condition}
+            order by 
+                t.donated_at, length(b.bill_book_code), b.bill_book_code, b.bill_id, t.item_id
+            ;
+        """
+
+    return (sql, vars)
+
+
+@instrumented
+def get_donor_history(
+        donor_name: str | None,
+        donor_phone: str | None = None,
+        aggregate: bool = False
+) -> (pd.DataFrame | None):
+
+    """
+        Returns what a donor gave across all their bills.
+
+        The donor is identified like in the donor summary: the name case and surrounding spaces 
+        and the non digits of the phone number do not matter (pass a row of `search_donors`).
+
+        Parameters
+        ----------
+        donor_name: str | None
+            name of the donor.
+        donor_phone: str | None
+            phone number of the donor, None for a donor without phone number.
+        aggregate: bool
+            False: one row per bill and item (bill_book_code, bill_id, donated_on, item_id, item, 
+                quantity, unit_of_measurement), oldest first.
+            True: per item totals (item_id, item, total_quantity, unit_of_measurement, bill_count), 
+                read from the donor summary, largest first.
+
+        Returns
+        -------
+        pd.DataFrame
+            the history rows.
+        None
+            if the donor has no contribution.
+    """
+
+    sql, vars = build_donor_history_query(donor_name, donor_phone, aggregate)
+    cache_tables: tuple[str, ...] = (
+        ("donor_contribution_summary", "items") if aggregate else ("bill_books", "transactions", "items")
     )
 
-    print(f"{item_name} added successfully.")
-    
-    return result 
+    history_df = execute_sql_select_query(sql, vars = vars, cache_tables = cache_tables)
 
-def add_new_cooking_team(
-        supervisor_name: str, 
-        supervisor_phone_num: str | None = None,         
-) -> (tuple | None):
-    # need to fix the empty strings ' '
-    if not supervisor_name:
-        print('Supervisor name must include')
-        return None
+    return history_df
+
+
+# Allocation summaries: pre aggregated allocations by day and by cooking team (per item), 
+# maintained by `allocate_items_to_cooking_team` in the same statement as the allocation.
+allocation_summary_tables: tuple[str, ...] = ("daily_allocation_summary", "team_allocation_summary")
+
+allocation_summary_rebuild_sql: str = """
+    delete from daily_allocation_summary;
+    delete from team_allocation_summary;
+
+    insert into daily_allocation_summary
+        (allocated_on, item_id, total_quantity, allocation_count)
+    select 
+        a.allocated_at::date, a.item_id, sum(a.quantity), count(*)
+    from 
+        allocations as a
+    group by 
+        a.allocated_at::date, a.item_id
+    ;
+
+    insert into team_allocation_summary
+        (cooking_team_id, item_id, total_quantity, allocation_count)
+    select 
+        a.cooking_team_id, a.item_id, sum(a.quantity), count(*)
+    from 
+        allocations as a
+    group by 
+        a.cooking_team_id, a.item_id
+    ;
+"""
+
+
+@instrumented
+def rebuild_allocation_summaries() -> None:
+
+    "Recomputes the allocation summaries from the raw allocations table."
+
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            # block the allocation writers while rebuilding so no allocation is missed.
+            cur.execute("lock table allocations in share mode;")
+            cur.execute(allocation_summary_rebuild_sql + notify_changes_sql(*allocation_summary_tables))
+            conn.commit()
+            get_query_cache().invalidate(*allocation_summary_tables)
+
+        except Exception as e:
+            conn.rollback()
+            print(f"Error occur during rebuilding allocation summaries: {str(e)}")
+            raise e
+
+    print("Allocation summaries rebuilt.")
+
+
+@instrumented
+def get_daily_flow(item_id: int | None = None) -> (pd.DataFrame | None):
 
-    sql: str = """
-        
-        insert into cooking_teams
-            (supervisor_name, supervisor_phone_num)
-        values
-            (%(supervisor_name)s, %(supervisor_phone_num)s)
-        returning *
-        ;
     """
-    result = None 
-    try:
-        result = execute_sql_statements(
-            sql, 
-            vars = {
-                "supervisor_name": supervisor_name,
-                "supervisor_phone_num": supervisor_phone_num
-            }
-        )
-    except UniqueViolation:
-        print("Error occuring in inserting the data: Cooking team already found with this supervisor name")
-        return result
-    
-    return result
+        Returns the donation inflow and the allocation outflow per day, from the summaries.
 
-def get_inventory() -> (pd.DataFrame | None) :
+        Parameters
+        ----------
+        item_id: int | None 
+            If given, the quantities of this item donated and allocated per day.
+            Else the number of donated and allocated line items per day (the units of different items do not add up).
+
+        Returns
+        -------
+        pd.DataFrame
+            day, inflow, outflow (oldest first).
+        None
+            if nothing was donated or allocated.
+    """
 
-    sql : str = """
+    measure: str = "total_quantity" if item_id is not None else "{count}"
+    where_clause: str = "where item_id = %(item_id)s" if item_id is not None else ""
 
-        with cte1 as (
+    sql: str = f"""
+        with inflow as (
             select 
-                t.item_id,
-                sum(quantity) as total_quantity
+                donated_on as day, 
+                sum({measure.format(count = "bill_count")}) as inflow
             from 
-                transactions as t
+                daily_contribution_summary
+            {where_clause}
             group by 
-                t.item_id
-        ), 
-        cte2 as (
+                donated_on
+        ),
+        outflow as (
             select 
-                a.item_id,
-                sum(quantity) as total_quantity
+                allocated_on as day, 
+                sum({measure.format(count = "allocation_count")}) as outflow
             from 
-                allocations as a
+                daily_allocation_summary
+            {where_clause}
             group by 
-                a.item_id
+                allocated_on
         )
-
         select 
-            cte1.item_id,
-            initcap(i.name) as item,
-            (cte1.total_quantity - coalesce(cte2.total_quantity, 0)) as available_quantity, 
-            i.unit_of_measurement
-            -- cte1.total_quantity as total_quantity_taken,
-            -- cte2.total_quantity as total_quantity_given
+            coalesce(i.day, o.day) as day,
+            coalesce(i.inflow, 0) as inflow,
+            coalesce(o.outflow, 0) as outflow
         from 
-            cte1
-        left join 
-            cte2
+            inflow as i
+        full join 
+            outflow as o
         on 
-            cte1.item_id = cte2.item_id
-        left join
-            items as i
-        on 
-            i.id = cte1.item_id
+            o.day = i.day
         order by 
-            cte1.item_id
+            1
         ;
-
     """
 
-    inventory_df = execute_sql_select_query(sql)
+    flow_df = execute_sql_select_query(
+        sql, 
+        vars = {"item_id": item_id} if item_id is not None else None,
+        cache_tables = ("daily_contribution_summary", "daily_allocation_summary")
+    )
 
-    return inventory_df
+    return flow_df
 
 
-def check_for_item_availability(
-        item_ids: list[int],
-        quantites: list[int | float]
-) -> (pd.DataFrame):
-    
+@instrumented
+def get_top_donors(item_id: int | None = None, limit: int = 10) -> (pd.DataFrame | None):
+
     """
-        Returns the items that are requested greater than available quantity.
+        Returns the top donors, from the donor summary.
+
+        With an item they are ranked by the quantity of that item, else by the number of line items donated.
 
-        Parameters
-        ---------
-        item_ids: list[int]
-            List of item ids requesting to allocate.
-        quantities: list[int | float]
-            List of quantities that maps the item.
-        
         Returns
         -------
-        availability_df: pd.DataFrame
-            items which are requested greater than available quantity.
+        pd.DataFrame
+            donor_name, donor_phone, total_quantity (only with an item), bill_count.
+        None
+            if there is no donation.
     """
-    
-    inventory_df: pd.DataFrame = get_inventory() # get the inventory data for all items.
-    required_columns: list[str] = ['item_id', 'item', 'unit_of_measurement', 'available_quantity']
-    required_items_df: pd.DataFrame = inventory_df[required_columns]
-
-    requested_items_df: pd.DataFrame = pd.DataFrame({'item_id': item_ids, 'requested_quantity': quantites}) # create temporary dataframe with input item_ids and quantites for further operations(join).
-
-    final_df: pd.DataFrame = pd.merge(required_items_df, requested_items_df, how ='inner', on ='item_id') # join(inner) the two dataframe to get necessary details of required items.
 
-    avaialability_df: pd.DataFrame = final_df[final_df['available_quantity'] < final_df['requested_quantity']] # filter the items that are requested greater than the available quantity.
-
-    return avaialability_df
-        
-    
-
-def allocate_items_to_cooking_team(
-    cooking_team_id: int, 
-    item_ids: list[int],
-    quantities: list[int | float], 
-    dish: str | None = None,
-) -> (list[tuple] | None):
+    if item_id is not None:
+        top_donors_df = get_contribution_summary("donor", item_id = item_id, limit = limit)
+        return None if top_donors_df is None else top_donors_df[
+            ["donor_name", "donor_phone", "item", "total_quantity", "unit_of_measurement", "bill_count"]
+        ]
 
-    if len(item_ids) != len(quantities):
-        print("Size of Item and Quantity must be same.")
-        return None
-    
-    # check whether the cooking team exists or not.
     sql: str = """
         select 
-            *
+            max(s.donor_name) as donor_name,
+            nullif(s.donor_phone_key, '') as donor_phone,
+            sum(s.bill_count) as bill_count,
+            count(*) as distinct_items
         from 
-            cooking_teams
-        where 
-            cooking_teams.id = %(cooking_team_id)s
+            donor_contribution_summary as s
+        group by 
+            s.donor_name_key, s.donor_phone_key
+        order by 
+            3 desc
+        limit 
+            %(limit)s
         ;
-    """     
-    cooking_team: list[tuple] | None = execute_sql_select_query(sql, vars = {'cooking_team_id': cooking_team_id})
+    """
 
-    if cooking_team is None:
-        # if no cooking team is found with the id, we stop the operation and return None.
-        raise ValueError(f"No cooking team found with this id : {cooking_team_id}.\nPlease create the team to allocate items.")
-    
-    # # check for the availability of each items to allocate.
-    # availability_df: pd.DataFrame = check_for_item_availability(item_ids, quantities)
-
-    # if not availability_df.empty:
-    #     # If any item requested greater than available quantity, we are not perform this operation further, So we return None.
-    #     # Items requested the quantity greater than available quantity.
-    #     for _, row in availability_df.iterrows():
-    #         row: tuple = tuple(row)
-    #         item_id, item, unit, available_quantity, requested_quantity = row 
-            
-    #         print(f'You are requesting the item {item} of item_id {item_id} for {requested_quantity} {unit} but the available quantity is {available_quantity} {unit}.')
-    #     print('\nNote: Please enter the items within the available quantity.')
-
-    #     return None
-    
-    # If we have all items, Then allocate that to cooking team.
-    conn: pg.extensions.connection = db.getconn() # get a db connection. 
-    cur: pg.extensions.cursor = conn.cursor() # create a cursor object to interact with database.
+    top_donors_df = execute_sql_select_query(
+        sql, vars = {"limit": int(limit)}, cache_tables = ("donor_contribution_summary",)
+    )
 
-    cooking_team_ids: list[int] = [cooking_team_id] * len(item_ids) # make the cooking_team_id into list of ids to insert into table. 
-    dishes: list = [dish] * len(item_ids)
+    return top_donors_df
+
+
+@instrumented
+def get_team_consumption(item_id: int | None = None) -> (pd.DataFrame | None):
 
-    sql: str = """
-        insert into allocations
-            (cooking_team_id, item_id, quantity, dish)
-        values
-            %s
-        returning *
     """
-    values: list[tuple] = [
-            (team_id, item_id, quantity, dish) \
-        for team_id, item_id, quantity, dish in zip(
-            cooking_team_ids, item_ids, quantities, dishes, strict = True
-        )
-    ]
+        Returns what each cooking team was allocated, from the team summary.
 
-    try:
-        execute_values(cur, sql, argslist = values) # insert the records
-        conn.commit() # save the data into the database.
-        result: list[tuple] = cur.fetchall() # fetch the inserted record.
-        return result
-    
-    except Exception as e:
-        print(f'Error occur during inserting the record: {str(e)}')
-        return None
-    
-    finally:
-        cur.close() # close the cursor object.
-        db.putconn(conn) # release the back to the pool. 
+        Returns
+        -------
+        pd.DataFrame
+            supervisor_name, item, total_quantity, unit_of_measurement, allocation_count (largest first).
+        None
+            if nothing was allocated.
+    """
 
-def get_allocations() -> pd.DataFrame:
+    where_clause: str = "where s.item_id = %(item_id)s" if item_id is not None else ""
 
-    sql: str = """
+    sql: str = f"""
         select 
-            a.cooking_team_id,
             upper(c.supervisor_name) as supervisor_name,
-            --c.supervisor_phone_num,
+            s.item_id,
             initcap(i.name) as item,
-            a.quantity,
-            i.id as item_id,
+            s.total_quantity,
             i.unit_of_measurement,
-            a.allocated_at::date as alloacted_on,
-            to_char(a.allocated_at, 'HH12 : MI : SS AM') as allocated_at
+            s.allocation_count
         from 
-            allocations as a
+            team_allocation_summary as s
         join 
             cooking_teams as c
         on 
-            a.cooking_team_id = c.id
+            c.id = s.cooking_team_id
         join 
-            items as i 
+            items as i
         on 
-            a.item_id = i.id
+            i.id = s.item_id
+        {where_clause}
         order by 
-            a.allocated_at
+            s.allocation_count desc, s.total_quantity desc
         ;
     """
-    alloactions = execute_sql_select_query(sql)
 
-    return alloactions    
+    consumption_df = execute_sql_select_query(
+        sql, 
+        vars = {"item_id": item_id} if item_id is not None else None,
+        cache_tables = ("team_allocation_summary", "cooking_teams", "items")
+    )
 
+    return consumption_df
 
-def is_bill_exists(
-    bill_book_code: str, 
-    bill_id: int, 
-    cur: pg.extensions.cursor | None = None
-) -> bool: 
-    
-    """
-        Helper function used to check the bill is already created.
-    """
-    sql: str = """
+
+# Versioned schema migrations (version, description, sql), applied in order by `migrate_db`.
+# Never edit a migration that has been applied, append a new one instead.
+migrations: list[tuple[int, str, str]] = [
+
+    (1, "base tables", """
+        create table if not exists items (
+            id serial primary key, 
+            name varchar(100) not null unique, 
+            unit_of_measurement varchar(10) not null, 
+            created_at timestamp default now()
+        ); 
+
+        create table if not exists bill_books (
+            bill_book_code varchar(5) not null,
+            bill_id integer not null,
+            donar_name varchar(100),
+            donar_phone_num varchar(12),
+            unique(bill_book_code, bill_id)
+        );
+
+        create table if not exists transactions (
+            bill_book_code varchar(5) not null,
+            bill_id integer not null,
+            item_id integer not null references items(id),
+            quantity numeric not null, 
+            donated_at timestamp not null default now(),
+            unique(bill_book_code, bill_id, item_id),
+            foreign key (bill_book_code, bill_id) references bill_books(bill_book_code, bill_id)
+        );
+
+        create table if not exists cooking_teams (
+            id serial primary key,
+            supervisor_name varchar(200) not null unique,
+            supervisor_phone_num varchar(12) not null unique,
+            created_at timestamp not null default now()
+        );
+
+        create table if not exists allocations (
+            allocation_id serial primary key,
+            cooking_team_id integer not null references cooking_teams(id),
+            item_id integer not null references items(id),
+            quantity numeric not null,
+            dish varchar(100),
+            allocated_at timestamp not null default now()
+        );
+
+        alter table allocations add column if not exists dish varchar(100);
+    """),
+
+    (2, "inventory balances", f"""
+        create table if not exists inventory_balances (
+            item_id integer primary key references items(id),
+            received_quantity numeric not null default 0,
+            allocated_quantity numeric not null default 0,
+            updated_at timestamp not null default now()
+        );
+
+        -- existing database: seed the balances from the raw tables.
+        insert into inventory_balances
+            (item_id, received_quantity, allocated_quantity)
         select 
-            1 as bill_exist
-        from 
-            bill_books
+            *
+        from (
+            {inventory_ledger_sql}
+        ) as ledger
         where 
-            bill_book_code = %(bill_book_code)s and 
-            bill_id = %(bill_id)s
+            not exists (select 1 from inventory_balances)
         ;
+    """),
+
+    (3, "indexes for the allocations and transactions lookups", """
+        create index if not exists allocations_item_id_idx on allocations (item_id);
+        create index if not exists allocations_cooking_team_id_idx on allocations (cooking_team_id);
+        create index if not exists allocations_allocated_at_idx on allocations (allocated_at, allocation_id);
+        create index if not exists transactions_item_id_idx on transactions (item_id);
+    """),
+
+    (4, "contribution summaries", f"""
+        create table if not exists donor_contribution_summary (
+            donor_name_key text not null,
+            donor_phone_key text not null,
+            item_id integer not null references items(id),
+            donor_name varchar(100),
+            total_quantity numeric not null,
+            bill_count integer not null,
+            primary key (donor_name_key, donor_phone_key, item_id)
+        );
+
+        create table if not exists bill_book_contribution_summary (
+            bill_book_code varchar(5) not null,
+            item_id integer not null references items(id),
+            total_quantity numeric not null,
+            bill_count integer not null,
+            primary key (bill_book_code, item_id)
+        );
+
+        create table if not exists item_contribution_summary (
+            item_id integer primary key references items(id),
+            total_quantity numeric not null,
+            bill_count integer not null
+        );
+
+        create table if not exists daily_contribution_summary (
+            donated_on date not null,
+            item_id integer not null references items(id),
+            total_quantity numeric not null,
+            bill_count integer not null,
+            primary key (donated_on, item_id)
+        );
+
+        {contribution_summary_rebuild_sql}
+    """),
+
+    (5, "allocation summaries", f"""
+        create table if not exists daily_allocation_summary (
+            allocated_on date not null,
+            item_id integer not null references items(id),
+            total_quantity numeric not null,
+            allocation_count integer not null,
+            primary key (allocated_on, item_id)
+        );
+
+        create table if not exists team_allocation_summary (
+            cooking_team_id integer not null references cooking_teams(id),
+            item_id integer not null references items(id),
+            total_quantity numeric not null,
+            allocation_count integer not null,
+            primary key (cooking_team_id, item_id)
+        );
+
+        {allocation_summary_rebuild_sql}
+    """),
+
+    (6, "idempotency keys of the applied writes", """
+        create table if not exists applied_writes (
+            idempotency_key varchar(64) primary key,
+            kind varchar(20) not null,
+            applied_at timestamp not null default now()
+        );
+    """),
+
+    (7, "donor search indexes", f"""
+        create extension if not exists pg_trgm;
+
+        -- part of a name / phone number (like '%...%', similarity).
+        create index if not exists bill_books_donor_name_trgm_idx 
+            on bill_books using gin (({donor_name_key_sql.format(table = "bill_books")}) gin_trgm_ops);
+        create index if not exists bill_books_donor_phone_trgm_idx 
+            on bill_books using gin (({donor_phone_key_sql.format(table = "bill_books")}) gin_trgm_ops);
+
+        -- a donor's bills (equality) and the short searches (prefix like).
+        create index if not exists bill_books_donor_key_idx 
+            on bill_books (
+                ({donor_name_key_sql.format(table = "bill_books")}) text_pattern_ops, 
+                ({donor_phone_key_sql.format(table = "bill_books")}) text_pattern_ops
+            );
+    """),
+]
+
+
+@instrumented
+def get_schema_version() -> int:
+
+    "Returns the latest applied migration version, 0 for a database that was never migrated."
+
+    with get_db().cursor() as cur:
+        cur.execute("select to_regclass('schema_version') is not null as initialized;")
+
+        if not cur.fetchone()["initialized"]:
+            return 0
+        
+        cur.execute("select coalesce(max(version), 0) as version from schema_version;")
+
+        return cur.fetchone()["version"]
+
+
+@instrumented
+def migrate_db() -> list[int]:
+
     """
-    
-    if not cur: 
-        conn: pg.extensions.connection = db.getconn()
-        cur: pg.extensions.cursor = conn.cursor()
-        cur.execute(sql, vars = {"bill_book_code": bill_book_code, "bill_id": bill_id})
-        db.putconn(conn)
-    else:
-        cur.execute(sql, vars = {"bill_book_code": bill_book_code, "bill_id": bill_id})
+        Applies the pending `migrations` in one transaction.
 
-    result = cur.fetchone()
+        The applied versions are recorded in the `schema_version` table, an up to date 
+        database costs a single select and runs no DDL.
 
-    return bool(result)    
+        Returns
+        -------
+        list[int]
+            versions applied by this call.
+    """
 
+    latest_version: int = migrations[-1][0]
 
-def create_new_bill_record(
-    bill_book_code: str, 
-    bill_id: int, 
-    contributor_name: str, 
-    contributor_phone_num: str, 
-    contribution_df: pd.DataFrame
-):
+    if get_schema_version() >= latest_version:
+        return []
 
-    conn: pg.extensions.connection = db.getconn()
-    cur: pg.extensions.cursor = conn.cursor()
+    applied: list[int] = []
 
-    try:
+    with get_db().connection() as conn, conn.cursor() as cur:
+
+        try:
+            # only one process migrates at a time, the others wait and find nothing left to apply.
+            cur.execute("select pg_advisory_xact_lock(hashtext('schema_version'));")
+            cur.execute("""
+                create table if not exists schema_version (
+                    version integer primary key,
+                    description text not null,
+                    applied_at timestamp not null default now()
+                );
+            """)
+            cur.execute("select coalesce(max(version), 0) as version from schema_version;")
+            current_version: int = cur.fetchone()["version"]
 
-        previous_bill_record = is_bill_exists(bill_book_code, bill_id, cur)
+            for version, description, sql in migrations:
+                if version <= current_version:
+                    continue
 
-        if not previous_bill_record:
-            # Create the bill record. 
-            create_bill_entry_sql: str = """
-                insert into bill_books(
-                    bill_book_code, bill_id, donar_name, donar_phone_num
+                cur.execute(sql)
+                cur.execute(
+                    "insert into schema_version (version, description) values (%(version)s, %(description)s);",
+                    {"version": version, "description": description}
                 )
-                values(
-                    %(bill_book_code)s, %(bill_id)s, %(donar_name)s, %(donar_phone_num)s
-                );
-            """
-            new_record = cur.execute(
-                create_bill_entry_sql, {
-                    "bill_book_code": bill_book_code, "bill_id": bill_id, 
-                    "donar_name": contributor_name, "donar_phone_num": contributor_phone_num
-                }
-            )
+                applied.append(version)
+                print(f"Applied migration {version}: {description}")
 
-        # # Create transactions.
-        contribution_df["item_ids"] = contribution_df["items"].str.split("-").str[0].astype(int)
-        contribution_df["bill_book_code"] = bill_book_code
-        contribution_df["bill_id"] = bill_id
-        contribution_df.drop("items", axis = 1, inplace = True)
+            conn.commit()
 
-        # print(contribution_df)
-        # return contribution_df.to_dict("records")
+        except Exception as e:
+            conn.rollback()
+            print(f"Error occur during migrating the database: {str(e)}")
+            raise e
 
-        create_transactions_sql: str = """
-            insert into 
-                transactions(
-                    bill_book_code, bill_id, item_id, quantity
-                )
-            values
-                %s
-            ;
-        """
-        execute_values(
-            cur, create_transactions_sql, 
-            argslist = contribution_df.to_dict("records"),
-            template = "(%(bill_book_code)s, %(bill_id)s, %(item_ids)s, %(quantity)s)"
-        )
+    get_query_cache().clear()
+
+    return applied
 
-        conn.commit()
 
-        print("All records inserted")
+@instrumented
+def check_query_plans() -> pd.DataFrame:
 
-    except Exception as e: 
-        conn.rollback()
-        print(str(e))
-        raise e
+    """
+        Verifies with EXPLAIN that the hot queries can use an index on their filtered table.
+
+        Sequential scans are disabled for the check (`enable_seqscan = off`) so the result does not 
+        depend on the table sizes: a small table is cheaper to scan sequentially, but a query 
+        that still gets a sequential scan has no usable index.
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per query: query, relation, scans (plan nodes on the relation) and uses_index.
+    """
 
-    finally:
-        cur.close()
-        db.putconn(conn)
+    today: date = date.today()
+    hot_queries: list[tuple[str, str, str, dict | None]] = [
+        ("inventory", "inventory_balances", inventory_sql, None),
+        # explain does not run the statement, nothing is allocated.
+        ("allocation balance lock", "inventory_balances", write_allocation_sql, 
+            {"cooking_team_id": 1, "item_ids": [1, 2], "quantities": [1, 1], "dish": None}),
+        ("allocations of a team", "allocations", *build_allocations_query(cooking_team_id = 1)),
+        ("allocations of an item", "allocations", *build_allocations_query(item_id = 1, aggregate = True)),
+        ("allocations in a date range", "allocations", *build_allocations_query(start_date = today, end_date = today)),
+        ("allocations page", "allocations", *build_allocations_query(after = 1, limit = 50)),
+        ("contribution of a bill", "transactions", 
+            "select * from transactions where bill_book_code = %(bill_book_code)s and bill_id = %(bill_id)s", 
+            {"bill_book_code": "B1", "bill_id": 1}),
+        ("donor search by name", "bill_books", *build_donor_search_query("donor 1")),
+        ("donor search by name prefix", "bill_books", *build_donor_search_query("do")),
+        ("donor search by phone", "bill_books", *build_donor_search_query("90000")),
+        ("donor history", "bill_books", *build_donor_history_query("donor 1", "9000000001")),
+    ]
+    index_scans: set[str] = {"Index Scan", "Index Only Scan", "Bitmap Index Scan", "Bitmap Heap Scan"}
 
+    def relation_scans(plan: dict, relation: str) -> list[str]:
+        # walks the plan tree and collects the scan nodes on the relation (not the insert / update nodes).
+        scans: list[str] = []
+        if plan.get("Relation Name") == relation and plan["Node Type"].endswith("Scan"):
+            scans.append(plan["Node Type"])
+        for child in plan.get("Plans", []):
+            scans.extend(relation_scans(child, relation))
+        return scans
 
+    results: list[dict] = []
 
+    with get_db().cursor(commit = False) as cur:
+        cur.execute("set local enable_seqscan = off;")
 
+        for name, relation, sql, vars in hot_queries:
+            cur.execute("explain (format json) " + sql.strip().rstrip(";"), vars)
+            plan: dict = cur.fetchone()["QUERY PLAN"][0]["Plan"]
+            scans: list[str] = relation_scans(plan, relation)
 
-def inititalize_db_tables() -> None:
+            results.append({
+                "query": name,
+                "relation": relation,
+                "scans": ", ".join(scans),
+                "uses_index": bool(scans) and all(scan in index_scans for scan in scans)
+            })
 
-    sql: str = """
-          create table if not exists items (
-        id serial primary key, 
-        name varchar(100) not null unique, 
-        unit_of_measurement varchar(10) not null, 
-        created_at timestamp default now()
-    ); 
-
-    create table if not exists bill_books (
-        bill_book_code varchar(5) not null,
-        bill_id integer not null,
-        donar_name varchar(100),
-        donar_phone_num varchar(12),
-        unique(bill_book_code, bill_id)
-    );
-
-    create table if not exists transactions (
-        bill_book_code varchar(5) not null,
-        bill_id integer not null,
-        item_id integer not null references items(id),
-        quantity numeric not null, 
-        donated_at timestamp not null default now(),
-        unique(bill_book_code, bill_id, item_id),
-        foreign key (bill_book_code, bill_id) references bill_books(bill_book_code, bill_id)
-    );
-
-    create table if not exists cooking_teams (
-        id serial primary key,
-        supervisor_name varchar(200) not null unique,
-        supervisor_phone_num varchar(12) not null unique,
-        created_at timestamp not null default now()
-    );
-
-    create table if not exists allocations (
-        allocation_id serial primary key,
-        cooking_team_id integer not null references cooking_teams(id),
-        item_id integer not null references items(id),
-        quantity numeric not null,
-        allocated_at timestamp not null default now()
-    );
-    """
-
-    conn = db.getconn()
-    cur = conn.cursor()
-
-    cur.execute(sql)
-    conn.commit()
-
-    db.putconn(conn)
-
-    print("All Tables Initialized")
+    return pd.DataFrame(results)
 
 
+@instrumented
 def get_all_cooking_teams():
     sql: str = "select * from cooking_teams;"
 
-    cooking_teams = execute_sql_select_query(sql)
+    cooking_teams = execute_sql_select_query(sql, cache_tables = ("cooking_teams",))
 
     return cooking_teams
 
-
-inititalize_db_tables()
     
 
 def main() -> None :
-    
-    pass
+
+    parser = argparse.ArgumentParser(description = "Maintenance commands for the Meenakshi donation database.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    commands.add_parser("rebuild-inventory", help = "recompute inventory balances from the raw tables.")
+    commands.add_parser("verify-inventory", help = "compare the inventory balances against the raw tables.")
+    commands.add_parser("rebuild-summaries", help = "recompute the contribution and allocation summaries from the raw tables.")
+
+    export_parser = commands.add_parser("export", help = "export a full history report to csv.")
+    export_parser.add_argument("report", choices = ["contributions", "allocations"])
+    export_parser.add_argument("path", help = "csv file to write.")
+    export_parser.add_argument("--chunk-size", type = int, default = 10_000, help = "rows fetched per round trip.")
+
+    commands.add_parser("migrate", help = "apply the pending schema migrations.")
+    commands.add_parser("check-indexes", help = "verify with EXPLAIN that the hot queries use index scans.")
+
+    import_parser = commands.add_parser("import-bills", help = "bulk import bills from a csv or excel file.")
+    import_parser.add_argument("path", help = f"csv/excel file with the columns: {', '.join(bill_import_columns)}.")
+    import_parser.add_argument("--errors-out", help = "csv file to write the rejected rows report to.")
+
+    commands.add_parser("flush-writes", help = "apply the bills and allocations queued while the database was unreachable.")
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        applied = migrate_db()
+        print(f"Applied migrations: {applied}" if applied else f"Schema is up to date (version {get_schema_version()}).")
+
+    elif args.command == "check-indexes":
+        plans_df = check_query_plans()
+        print(plans_df.to_string(index = False))
+
+        if not plans_df["uses_index"].all():
+            raise SystemExit(1)
+
+    elif args.command == "rebuild-inventory":
+        rebuild_inventory_balances()
+
+    elif args.command == "rebuild-summaries":
+        rebuild_contribution_summaries()
+        rebuild_allocation_summaries()
+
+    elif args.command == "verify-inventory":
+        mismatch_df = verify_inventory_balances()
+
+        if mismatch_df is None:
+            print("Inventory balances are consistent with transactions and allocations.")
+        else:
+            print("Inventory balances differ from transactions and allocations:")
+            print(mismatch_df.to_string(index = False))
+            raise SystemExit(1)
+
+    elif args.command == "export":
+        export_report_to_csv(args.report, args.path, chunk_size = args.chunk_size)
+
+    elif args.command == "import-bills":
+        _, error_report = import_bills(read_bill_file(args.path))
+
+        if not error_report.empty:
+            print(error_report.to_string(index = False))
+
+            if args.errors_out:
+                error_report.to_csv(args.errors_out, index = False)
+                print(f"Error report written to {args.errors_out}")
+
+    elif args.command == "flush-writes":
+        while get_write_journal().counts()["pending"]:
+            flushed: dict[str, int] = flush_pending_writes()
+            print(flushed)
+
+            if flushed["deferred"]:
+                # contended entries stay pending, run the command again later.
+                print("Some queued writes are still contended, kept pending.")
+                break
+
+        print(get_write_journal().counts())
     
 
 if __name__ == '__main__':
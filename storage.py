@@ -0,0 +1,1095 @@
+"""
+    Storage backends of the app.
+
+    The app talks to a `Repository` (see `get_repository`), selected by `settings.storage_backend`:
+
+        postgres: the query functions of main.py (connection pool, caches, summaries, notifications).
+        sqlite: an embedded database file (python's sqlite3, no database server), for the kitchen
+            laptop running alone. The reports are computed from the raw tables, which is fast enough
+            at the size of one deployment.
+
+    Both return the same dataframes (columns and order) and tuples, so app.py does not know which one it uses.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Iterator, Literal, Protocol
+
+import pandas as pd
+
+import main
+
+
+class Repository(Protocol):
+
+    "Data access used by the app, see the functions of the same name in main.py for the details."
+
+    def get_all_items(self) -> (pd.DataFrame | None): ...
+
+    def get_all_cooking_teams(self) -> (pd.DataFrame | None): ...
+
+    def get_inventory(self) -> (pd.DataFrame | None): ...
+
+    def get_particular_contribution(
+            self, bill_book_code: str, bill_id: int
+    ) -> (tuple[str, pd.DataFrame] | tuple[None, None]): ...
+
+    def get_bill_contributions(
+            self,
+            bills: list[tuple[str, int]] | None = None,
+            bill_book_code: str | None = None,
+            first_bill_id: int | None = None,
+            last_bill_id: int | None = None
+    ) -> dict[tuple[str, int], dict]: ...
+
+    def is_bill_exists(self, bill_book_code: str, bill_id: int) -> bool: ...
+
+    def add_new_items(self, item_name: str, unit_of_measurement: Literal['Kg', 'L', 'Nos']) -> (list | None): ...
+
+    def add_new_cooking_team(self, supervisor_name: str, supervisor_phone_num: str | None = None) -> (list | None): ...
+
+    def create_new_bill_record(
+            self,
+            bill_book_code: str,
+            bill_id: int,
+            contributor_name: str,
+            contributor_phone_num: str,
+            contribution_df: pd.DataFrame,
+            policy: Literal["create", "replace", "add", "skip"] = "replace",
+            idempotency_key: str | None = None
+    ) -> tuple[bool, list[dict]]: ...
+
+    def allocate_items_to_cooking_team(
+            self, 
+            cooking_team_id: int, 
+            item_ids: list[int], 
+            quantities: list[int | float], 
+            dish: str | None = None, 
+            idempotency_key: str | None = None
+    ) -> (tuple[list[dict] | None, pd.DataFrame]): ...
+
+    def get_allocations(
+            self,
+            cooking_team_id: int | None = None,
+            item_id: int | None = None,
+            start_date: date | None = None,
+            end_date: date | None = None,
+            dish: str | None = None,
+            after: int | None = None,
+            limit: int | None = None,
+            aggregate: bool = False
+    ) -> (pd.DataFrame | None): ...
+
+    def get_contribution_summary(
+            self, by: Literal["donor", "bill_book", "item", "day"], item_id: int | None = None, limit: int | None = None
+    ) -> (pd.DataFrame | None): ...
+
+    def search_donors(self, search: str, limit: int = 20) -> (pd.DataFrame | None): ...
+
+    def get_donor_history(
+            self, donor_name: str | None, donor_phone: str | None = None, aggregate: bool = False
+    ) -> (pd.DataFrame | None): ...
+
+    def get_daily_flow(self, item_id: int | None = None) -> (pd.DataFrame | None): ...
+
+    def get_top_donors(self, item_id: int | None = None, limit: int = 10) -> (pd.DataFrame | None): ...
+
+    def get_team_consumption(self, item_id: int | None = None) -> (pd.DataFrame | None): ...
+
+
+class PostgresRepository:
+
+    "The postgres backend: main.py's query functions."
+
+    get_all_items = staticmethod(main.get_all_items)
+    get_all_cooking_teams = staticmethod(main.get_all_cooking_teams)
+    get_inventory = staticmethod(main.get_inventory)
+    get_particular_contribution = staticmethod(main.get_particular_contribution)
+    get_bill_contributions = staticmethod(main.get_bill_contributions)
+    is_bill_exists = staticmethod(main.is_bill_exists)
+    add_new_items = staticmethod(main.add_new_items)
+    add_new_cooking_team = staticmethod(main.add_new_cooking_team)
+    create_new_bill_record = staticmethod(main.create_new_bill_record)
+    allocate_items_to_cooking_team = staticmethod(main.allocate_items_to_cooking_team)
+    get_allocations = staticmethod(main.get_allocations)
+    get_contribution_summary = staticmethod(main.get_contribution_summary)
+    search_donors = staticmethod(main.search_donors)
+    get_donor_history = staticmethod(main.get_donor_history)
+    get_daily_flow = staticmethod(main.get_daily_flow)
+    get_top_donors = staticmethod(main.get_top_donors)
+    get_team_consumption = staticmethod(main.get_team_consumption)
+
+
+# Same tables as the postgres migrations 1 - 3 and 6 (sqlite types), timestamps are stored as local time text.
+sqlite_schema_version: int = 2
+
+sqlite_schema_sql: str = """
+    create table if not exists items (
+        id integer primary key autoincrement,
+        name text not null unique,
+        unit_of_measurement text not null,
+        created_at text default (datetime('now', 'localtime'))
+    );
+
+    create table if not exists bill_books (
+        bill_book_code text not null,
+        bill_id integer not null,
+        donar_name text,
+        donar_phone_num text,
+        primary key (bill_book_code, bill_id)
+    );
+
+    create table if not exists transactions (
+        bill_book_code text not null,
+        bill_id integer not null,
+        item_id integer not null references items(id),
+        quantity real not null,
+        donated_at text not null default (datetime('now', 'localtime')),
+        primary key (bill_book_code, bill_id, item_id),
+        foreign key (bill_book_code, bill_id) references bill_books(bill_book_code, bill_id)
+    );
+
+    create table if not exists cooking_teams (
+        id integer primary key autoincrement,
+        supervisor_name text not null unique,
+        supervisor_phone_num text not null unique,
+        created_at text not null default (datetime('now', 'localtime'))
+    );
+
+    create table if not exists allocations (
+        allocation_id integer primary key autoincrement,
+        cooking_team_id integer not null references cooking_teams(id),
+        item_id integer not null references items(id),
+        quantity real not null,
+        dish text,
+        allocated_at text not null default (datetime('now', 'localtime'))
+    );
+
+    create table if not exists inventory_balances (
+        item_id integer primary key references items(id),
+        received_quantity real not null default 0,
+        allocated_quantity real not null default 0,
+        updated_at text not null default (datetime('now', 'localtime'))
+    );
+
+    create table if not exists applied_writes (
+        idempotency_key text primary key,
+        kind text not null,
+        applied_at text not null default (datetime('now', 'localtime'))
+    );
+
+    create index if not exists allocations_item_id_idx on allocations (item_id);
+    create index if not exists allocations_cooking_team_id_idx on allocations (cooking_team_id);
+    create index if not exists allocations_allocated_at_idx on allocations (allocated_at, allocation_id);
+    create index if not exists transactions_item_id_idx on transactions (item_id);
+"""
+
+
+def clock_time(value: str | None) -> str | None:
+
+    "sqlite counterpart of postgres' to_char(value, 'HH12 : MI : SS AM')."
+
+    return None if value is None else datetime.fromisoformat(value).strftime("%I : %M : %S %p")
+
+
+def digits(value: str | None) -> str:
+
+    "The digits of a phone number (the donor phone key)."
+
+    return "".join(character for character in value or "" if character.isdigit())
+
+
+class SQLiteRepository:
+
+    """
+        The embedded backend: one sqlite database file, no server.
+
+        Every thread gets its own connection. Writes run in `begin immediate` transactions,
+        which take the database write lock up front: concurrent writers queue (up to `timeout`
+        seconds) instead of overdrawing a balance, readers are not blocked (WAL journal).
+        The tables are created on the first connection.
+
+        Parameters
+        ----------
+        path: str
+            Database file, created if missing.
+        timeout: float
+            Seconds a write waits for the write lock.
+    """
+
+    shortfall_columns: list[str] = ['item_id', 'item', 'unit_of_measurement', 'available_quantity', 'requested_quantity']
+
+    def __init__(self, path: str, timeout: float = 10.0) -> None:
+
+        self.path: str = path
+        self.timeout: float = timeout
+        self._local: threading.local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+
+        conn: sqlite3.Connection | None = getattr(self._local, "connection", None)
+
+        if conn is None:
+            # autocommit mode, the transactions are opened explicitly.
+            conn = sqlite3.connect(self.path, timeout = self.timeout, isolation_level = None)
+            conn.execute("pragma journal_mode = wal;")
+            conn.execute("pragma foreign_keys = on;")
+            conn.create_function("initcap", 1, lambda value: None if value is None else value.title(), deterministic = True)
+            conn.create_function("clock_time", 1, clock_time, deterministic = True)
+            conn.create_function("digits", 1, digits, deterministic = True)
+
+            if conn.execute("pragma user_version;").fetchone()[0] < sqlite_schema_version:
+                conn.executescript(
+                    f"begin immediate; {sqlite_schema_sql} pragma user_version = {sqlite_schema_version}; commit;"
+                )
+
+            self._local.connection = conn
+
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+
+        "Write transaction, committed on success and rolled back on error."
+
+        conn: sqlite3.Connection = self._connection()
+        conn.execute("begin immediate;")
+
+        try:
+            yield conn
+            conn.execute("commit;")
+
+        except Exception:
+            conn.execute("rollback;")
+            raise
+
+    @staticmethod
+    def _claim_write(conn: sqlite3.Connection, idempotency_key: str | None, kind: Literal["bill", "allocation"]) -> bool:
+
+        "Records the key in the transaction (see `main.claim_write`), returns False if it was already applied."
+
+        if idempotency_key is None:
+            return True
+
+        return conn.execute(
+            "insert into applied_writes (idempotency_key, kind) values (?, ?) on conflict do nothing returning idempotency_key;",
+            (idempotency_key, kind)
+        ).fetchone() is not None
+
+    def _select(self, sql: str, params: dict | None = None) -> (pd.DataFrame | None):
+
+        cur: sqlite3.Cursor = self._connection().execute(sql, params or {})
+        rows: list[tuple] = cur.fetchall()
+
+        if not rows:
+            return None
+
+        return main.rows_to_dataframe(rows, [column[0] for column in cur.description])
+
+    @staticmethod
+    def _as_dates(df: pd.DataFrame | None, *columns: str) -> (pd.DataFrame | None):
+
+        "sqlite returns dates as text, postgres as dates."
+
+        if df is not None:
+            for column in columns:
+                df[column] = pd.to_datetime(df[column]).dt.date
+
+        return df
+
+    @staticmethod
+    def _as_dicts(cur: sqlite3.Cursor) -> list[dict]:
+
+        columns: list[str] = [column[0] for column in cur.description]
+
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def get_all_items(self) -> (pd.DataFrame | None):
+
+        return self._select("""
+            select
+                i.id as item_id,
+                initcap(i.name) as item,
+                i.unit_of_measurement
+            from
+                items as i
+            order by
+                i.id
+            ;
+        """)
+
+    def get_all_cooking_teams(self) -> (pd.DataFrame | None):
+
+        return self._select("select * from cooking_teams;")
+
+    def get_inventory(self) -> (pd.DataFrame | None):
+
+        return self._select("""
+            select
+                b.item_id,
+                initcap(i.name) as item,
+                (b.received_quantity - b.allocated_quantity) as available_quantity,
+                i.unit_of_measurement
+            from
+                inventory_balances as b
+            join
+                items as i
+            on
+                i.id = b.item_id
+            where
+                b.received_quantity > 0
+            order by
+                b.item_id
+            ;
+        """)
+
+    def get_particular_contribution(
+            self, bill_book_code: str, bill_id: int
+    ) -> (tuple[str, pd.DataFrame] | tuple[None, None]):
+
+        contribution_df = self._select("""
+            select
+                initcap(i.name) as item,
+                t.quantity,
+                i.unit_of_measurement,
+                date(t.donated_at) as donated_on,
+                clock_time(t.donated_at) as donated_at,
+                b.donar_name
+            from
+                transactions as t
+            join
+                bill_books as b
+            on
+                b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id
+            join
+                items as i
+            on
+                i.id = t.item_id
+            where
+                t.bill_book_code = :bill_book_code and t.bill_id = :bill_id
+            ;
+        """, {"bill_book_code": bill_book_code, "bill_id": int(bill_id)})
+
+        if contribution_df is None:
+            return (None, None)
+
+        contribution_df = self._as_dates(contribution_df, "donated_on")
+        donar_name: str = contribution_df["donar_name"].iloc[0]
+
+        return (donar_name, contribution_df.drop("donar_name", axis = 1))
+
+    def get_bill_contributions(
+            self,
+            bills: list[tuple[str, int]] | None = None,
+            bill_book_code: str | None = None,
+            first_bill_id: int | None = None,
+            last_bill_id: int | None = None
+    ) -> dict[tuple[str, int], dict]:
+
+        if bills is not None:
+            if not bills:
+                return {}
+
+            # the pairs are sent as one json array, read back by json_each.
+            source: str = """
+                (
+                    select distinct
+                        json_extract(value, '$[0]') as bill_book_code,
+                        json_extract(value, '$[1]') as bill_id
+                    from
+                        json_each(:bills)
+                ) as r
+                join
+                    bill_books as b
+                on
+                    b.bill_book_code = r.bill_book_code and b.bill_id = r.bill_id
+            """
+            where_clause: str = ""
+            params: dict = {"bills": json.dumps([[code, int(bill_id)] for code, bill_id in bills])}
+
+        elif bill_book_code is not None:
+            source = "bill_books as b"
+            where_clause = """
+                where
+                    b.bill_book_code = :bill_book_code
+                    and b.bill_id >= coalesce(:first_bill_id, b.bill_id)
+                    and b.bill_id <= coalesce(:last_bill_id, b.bill_id)
+            """
+            params = {"bill_book_code": bill_book_code, "first_bill_id": first_bill_id, "last_bill_id": last_bill_id}
+
+        else:
+            raise ValueError("Pass either bills or a bill_book_code.")
+
+        rows: list[tuple] = self._connection().execute(f"""
+            select
+                b.bill_book_code,
+                b.bill_id,
+                b.donar_name,
+                b.donar_phone_num,
+                t.item_id,
+                initcap(i.name) as item,
+                t.quantity,
+                i.unit_of_measurement,
+                date(t.donated_at) as donated_on,
+                clock_time(t.donated_at) as donated_at
+            from
+                {source}
+            left join
+                transactions as t
+            on
+                t.bill_book_code = b.bill_book_code and t.bill_id = b.bill_id
+            left join
+                items as i
+            on
+                i.id = t.item_id
+            {where_clause}
+            order by
+                length(b.bill_book_code), b.bill_book_code, b.bill_id, t.item_id
+            ;
+        """, params).fetchall()
+
+        # sqlite returns dates as text, postgres as dates.
+        return main.group_bill_contributions([
+            row[:8] + (None if row[8] is None else date.fromisoformat(row[8]),) + row[9:] for row in rows
+        ])
+
+    def is_bill_exists(self, bill_book_code: str, bill_id: int) -> bool:
+
+        row = self._connection().execute(
+            "select 1 from bill_books where bill_book_code = :bill_book_code and bill_id = :bill_id;",
+            {"bill_book_code": bill_book_code, "bill_id": int(bill_id)}
+        ).fetchone()
+
+        return row is not None
+
+    def add_new_items(self, item_name: str, unit_of_measurement: Literal['Kg', 'L', 'Nos']) -> (list | None):
+
+        if not item_name:
+            print('Item name must include')
+            return None
+
+        item_name = item_name.strip().lower() # standardizing the item names for backend convenience.
+
+        with self._transaction() as conn:
+            if conn.execute("select 1 from items where name = :item_name;", {"item_name": item_name}).fetchone():
+                print(f"{item_name} already exists.")
+                return None
+
+            cur: sqlite3.Cursor = conn.execute(
+                "insert into items (name, unit_of_measurement) values (:item_name, :unit_of_measurement) returning *;",
+                {"item_name": item_name, "unit_of_measurement": unit_of_measurement}
+            )
+            result: list[dict] = self._as_dicts(cur)
+
+        print(f"{item_name} added successfully.")
+
+        return result
+
+    def add_new_cooking_team(self, supervisor_name: str, supervisor_phone_num: str | None = None) -> (list | None):
+
+        if not supervisor_name:
+            print('Supervisor name must include')
+            return None
+
+        try:
+            with self._transaction() as conn:
+                cur: sqlite3.Cursor = conn.execute(
+                    """
+                        insert into cooking_teams (supervisor_name, supervisor_phone_num)
+                        values (:supervisor_name, :supervisor_phone_num)
+                        returning *;
+                    """,
+                    {"supervisor_name": supervisor_name, "supervisor_phone_num": supervisor_phone_num}
+                )
+                return self._as_dicts(cur)
+
+        except sqlite3.IntegrityError:
+            print("Error occuring in inserting the data: Cooking team already found with this supervisor name")
+            return None
+
+    def create_new_bill_record(
+            self,
+            bill_book_code: str,
+            bill_id: int,
+            contributor_name: str,
+            contributor_phone_num: str,
+            contribution_df: pd.DataFrame,
+            policy: Literal["create", "replace", "add", "skip"] = "replace",
+            idempotency_key: str | None = None
+    ) -> tuple[bool, list[dict]]:
+
+        "Same merge policies, idempotency key and returned diff as `main.create_new_bill_record`."
+
+        if policy not in ("create", "replace", "add", "skip"):
+            raise ValueError(f"Invalid policy : {policy}")
+
+        new_lines: dict[int, float] = main.bill_line_quantities(contribution_df).to_dict()
+        bill: dict = {"bill_book_code": bill_book_code, "bill_id": int(bill_id)}
+
+        with self._transaction() as conn:
+            if not self._claim_write(conn, idempotency_key, "bill"):
+                return (False, [])
+
+            bill_created: bool = conn.execute(
+                "select 1 from bill_books where bill_book_code = :bill_book_code and bill_id = :bill_id;", bill
+            ).fetchone() is None
+
+            if policy == "create" and not bill_created:
+                return (False, [])
+
+            conn.execute("""
+                insert into bill_books
+                    (bill_book_code, bill_id, donar_name, donar_phone_num)
+                values
+                    (:bill_book_code, :bill_id, :donar_name, :donar_phone_num)
+                on conflict (bill_book_code, bill_id) do update set
+                    donar_name = coalesce(excluded.donar_name, donar_name),
+                    donar_phone_num = coalesce(excluded.donar_phone_num, donar_phone_num)
+                ;
+            """, bill | {"donar_name": contributor_name or None, "donar_phone_num": contributor_phone_num or None})
+
+            old_lines: dict[int, float] = dict(conn.execute(
+                "select item_id, quantity from transactions where bill_book_code = :bill_book_code and bill_id = :bill_id;", bill
+            ).fetchall())
+
+            changes: list[dict] = []
+
+            for item_id in sorted(set(new_lines) | set(old_lines)):
+                previous_quantity: float | None = old_lines.get(item_id)
+                quantity: float | None = new_lines.get(item_id)
+
+                if previous_quantity is not None:
+                    if quantity is None:
+                        quantity = None if policy == "replace" else previous_quantity
+                    elif policy == "add":
+                        quantity = previous_quantity + quantity
+                    elif policy == "skip":
+                        quantity = previous_quantity
+
+                if quantity is None:
+                    conn.execute(
+                        "delete from transactions where bill_book_code = :bill_book_code and bill_id = :bill_id and item_id = :item_id;",
+                        bill | {"item_id": item_id}
+                    )
+                elif quantity != previous_quantity:
+                    conn.execute("""
+                        insert into transactions
+                            (bill_book_code, bill_id, item_id, quantity)
+                        values
+                            (:bill_book_code, :bill_id, :item_id, :quantity)
+                        on conflict (bill_book_code, bill_id, item_id) do update set
+                            quantity = excluded.quantity
+                        ;
+                    """, bill | {"item_id": item_id, "quantity": float(quantity)})
+
+                if quantity != previous_quantity:
+                    conn.execute("""
+                        insert into inventory_balances
+                            (item_id, received_quantity)
+                        values
+                            (:item_id, :change)
+                        on conflict (item_id) do update set
+                            received_quantity = received_quantity + excluded.received_quantity,
+                            updated_at = datetime('now', 'localtime')
+                        ;
+                    """, {"item_id": item_id, "change": float((quantity or 0) - (previous_quantity or 0))})
+
+                change: str = (
+                    "added" if previous_quantity is None
+                    else "removed" if quantity is None
+                    else "unchanged" if quantity == previous_quantity
+                    else "updated"
+                )
+                changes.append({
+                    "item_id": item_id, "previous_quantity": previous_quantity, "quantity": quantity, "change": change
+                })
+
+        print("All records inserted")
+
+        return (bill_created, changes)
+
+    def allocate_items_to_cooking_team(
+            self, 
+            cooking_team_id: int, 
+            item_ids: list[int], 
+            quantities: list[int | float], 
+            dish: str | None = None, 
+            idempotency_key: str | None = None
+    ) -> (tuple[list[dict] | None, pd.DataFrame]):
+
+        "Same checks, idempotency key and result as `main.allocate_items_to_cooking_team`, under the database write lock."
+
+        if len(item_ids) != len(quantities):
+            print("Size of Item and Quantity must be same.")
+            return (None, pd.DataFrame(columns = self.shortfall_columns))
+
+        main.check_allocation_quantities(item_ids, quantities)
+
+        lines: list[tuple[int, float]] = [(int(item_id), float(quantity)) for item_id, quantity in zip(item_ids, quantities)]
+        requested: dict[int, float] = {}
+        for item_id, quantity in lines:
+            requested[item_id] = requested.get(item_id, 0.0) + quantity
+
+        try:
+            with self._transaction() as conn:
+                if not self._claim_write(conn, idempotency_key, "allocation"):
+                    return ([], pd.DataFrame(columns = self.shortfall_columns))
+
+                if conn.execute("select 1 from cooking_teams where id = ?;", (int(cooking_team_id),)).fetchone() is None:
+                    raise ValueError(f"No cooking team found with this id : {cooking_team_id}.\nPlease create the team to allocate items.")
+
+                placeholders: str = ", ".join("?" * len(requested))
+                available: dict[int, tuple[str, str, float]] = {
+                    item_id: (item, unit_of_measurement, available_quantity)
+                    for item_id, item, unit_of_measurement, available_quantity in conn.execute(f"""
+                        select
+                            i.id, initcap(i.name), i.unit_of_measurement,
+                            coalesce(b.received_quantity - b.allocated_quantity, 0)
+                        from
+                            items as i
+                        left join
+                            inventory_balances as b
+                        on
+                            b.item_id = i.id
+                        where
+                            i.id in ({placeholders})
+                        ;
+                    """, list(requested))
+                }
+
+                shortfalls: list[tuple] = []
+                for item_id, quantity in sorted(requested.items()):
+                    item, unit_of_measurement, available_quantity = available.get(item_id, (None, None, 0.0))
+                    if available_quantity < quantity:
+                        shortfalls.append((item_id, item, unit_of_measurement, available_quantity, quantity))
+
+                if shortfalls:
+                    # nothing is allocated, the transaction is rolled back.
+                    raise _Shortfall(pd.DataFrame(shortfalls, columns = self.shortfall_columns))
+
+                allocations: list[dict] = []
+                for item_id, quantity in lines:
+                    cur: sqlite3.Cursor = conn.execute("""
+                        insert into allocations
+                            (cooking_team_id, item_id, quantity, dish)
+                        values
+                            (?, ?, ?, ?)
+                        returning *
+                        ;
+                    """, (int(cooking_team_id), item_id, quantity, dish))
+                    allocations.extend(self._as_dicts(cur))
+
+                conn.executemany("""
+                    update
+                        inventory_balances
+                    set
+                        allocated_quantity = allocated_quantity + ?,
+                        updated_at = datetime('now', 'localtime')
+                    where
+                        item_id = ?
+                    ;
+                """, [(quantity, item_id) for item_id, quantity in requested.items()])
+
+            return (allocations, pd.DataFrame(columns = self.shortfall_columns))
+
+        except _Shortfall as shortfall:
+            return (None, shortfall.shortfall_df)
+
+        except ValueError:
+            raise
+
+        except Exception as e:
+            print(f'Error occur during inserting the record: {str(e)}')
+            return (None, pd.DataFrame(columns = self.shortfall_columns))
+
+    def get_allocations(
+            self,
+            cooking_team_id: int | None = None,
+            item_id: int | None = None,
+            start_date: date | None = None,
+            end_date: date | None = None,
+            dish: str | None = None,
+            after: int | None = None,
+            limit: int | None = None,
+            aggregate: bool = False
+    ) -> (pd.DataFrame | None):
+
+        conditions: list[str] = []
+        params: dict = {}
+
+        if cooking_team_id is not None:
+            conditions.append("a.cooking_team_id = :cooking_team_id")
+            params["cooking_team_id"] = int(cooking_team_id)
+
+        if item_id is not None:
+            conditions.append("a.item_id = :item_id")
+            params["item_id"] = int(item_id)
+
+        if start_date is not None:
+            conditions.append("a.allocated_at >= :start_date")
+            params["start_date"] = start_date.isoformat()
+
+        if end_date is not None:
+            # end date is inclusive.
+            conditions.append("a.allocated_at < :end_date")
+            params["end_date"] = (end_date + timedelta(days = 1)).isoformat()
+
+        if dish:
+            # like is case insensitive in sqlite.
+            conditions.append("a.dish like :dish escape '\\'")
+            params["dish"] = f"%{main.escape_like_pattern(dish.strip())}%"
+
+        if aggregate:
+            where_clause: str = f"where {' and '.join(conditions)}" if conditions else ""
+            return self._select(f"""
+                select
+                    i.id as item_id,
+                    initcap(i.name) as item,
+                    sum(a.quantity) as quantity,
+                    i.unit_of_measurement
+                from
+                    allocations as a
+                join
+                    items as i
+                on
+                    i.id = a.item_id
+                {where_clause}
+                group by
+                    i.id
+                order by
+                    3 desc
+                ;
+            """, params)
+
+        if after is not None:
+            # keyset pagination: rows strictly after the last allocation of the previous page.
+            conditions.append("""
+                (a.allocated_at, a.allocation_id) > (
+                    select p.allocated_at, p.allocation_id from allocations as p where p.allocation_id = :after
+                )
+            """)
+            params["after"] = int(after)
+
+        where_clause: str = f"where {' and '.join(conditions)}" if conditions else ""
+        limit_clause: str = ""
+
+        if limit is not None:
+            limit_clause = "limit :limit"
+            params["limit"] = int(limit)
+
+        allocations_df = self._select(f"""
+            select
+                a.allocation_id,
+                a.cooking_team_id,
+                upper(c.supervisor_name) as supervisor_name,
+                initcap(i.name) as item,
+                a.quantity,
+                i.id as item_id,
+                i.unit_of_measurement,
+                a.dish,
+                date(a.allocated_at) as alloacted_on,
+                clock_time(a.allocated_at) as allocated_at
+            from
+                allocations as a
+            join
+                cooking_teams as c
+            on
+                a.cooking_team_id = c.id
+            join
+                items as i
+            on
+                a.item_id = i.id
+            {where_clause}
+            order by
+                a.allocated_at, a.allocation_id
+            {limit_clause}
+            ;
+        """, params)
+
+        return self._as_dates(allocations_df, "alloacted_on")
+
+    def get_contribution_summary(
+            self, by: Literal["donor", "bill_book", "item", "day"], item_id: int | None = None, limit: int | None = None
+    ) -> (pd.DataFrame | None):
+
+        summaries: dict[str, tuple[str, str, str, str]] = {
+            # by: (group keys, group columns, outer columns, order)
+            "donor": (
+                "lower(trim(coalesce(b.donar_name, ''))), digits(b.donar_phone_num),",
+                "max(initcap(trim(b.donar_name))) as donor_name, nullif(digits(b.donar_phone_num), '') as donor_phone,",
+                "s.donor_name, s.donor_phone,",
+                "s.total_quantity desc"
+            ),
+            "bill_book": (
+                "t.bill_book_code,", "t.bill_book_code,", "s.bill_book_code,",
+                "length(s.bill_book_code), s.bill_book_code, s.item_id"
+            ),
+            "item": ("", "", "", "s.bill_count desc, s.item_id"),
+            "day": ("date(t.donated_at),", "date(t.donated_at) as donated_on,", "s.donated_on,", "s.donated_on, s.item_id"),
+        }
+
+        if by not in summaries:
+            raise ValueError(f"Invalid summary : {by}")
+
+        group_keys, group_columns, outer_columns, order = summaries[by]
+        params: dict = {}
+        where_clause: str = ""
+        limit_clause: str = ""
+
+        if item_id is not None:
+            where_clause = "where t.item_id = :item_id"
+            params["item_id"] = int(item_id)
+
+        if limit is not None:
+            limit_clause = "limit :limit"
+            params["limit"] = int(limit)
+
+        summary_df = self._select(f"""
+            select
+                {outer_columns}
+                s.item_id,
+                initcap(i.name) as item,
+                s.total_quantity,
+                i.unit_of_measurement,
+                s.bill_count
+            from (
+                select
+                    {group_columns}
+                    t.item_id,
+                    sum(t.quantity) as total_quantity,
+                    count(*) as bill_count
+                from
+                    transactions as t
+                join
+                    bill_books as b
+                on
+                    b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id
+                {where_clause}
+                group by
+                    {group_keys} t.item_id
+            ) as s
+            join
+                items as i
+            on
+                i.id = s.item_id
+            order by
+                {order}
+            {limit_clause}
+            ;
+        """, params)
+
+        return self._as_dates(summary_df, "donated_on") if by == "day" else summary_df
+
+    def search_donors(self, search: str, limit: int = 20) -> (pd.DataFrame | None):
+
+        if not search or not search.strip():
+            return None
+
+        # no trigram index here: a plain like over the bills, without the close spellings of postgres.
+        search = search.strip()
+        by_phone: bool = bool(digits(search)) and not any(character.isalpha() for character in search)
+        term: str = digits(search) if by_phone else search.lower()
+        key: str = "digits(b.donar_phone_num)" if by_phone else "lower(trim(coalesce(b.donar_name, '')))"
+
+        return self._select(f"""
+            select
+                max(initcap(trim(b.donar_name))) as donor_name,
+                nullif(digits(b.donar_phone_num), '') as donor_phone,
+                count(*) as bill_count,
+                group_concat(b.bill_book_code || '-' || b.bill_id, ', ') as bills
+            from (
+                select * from bill_books order by length(bill_book_code), bill_book_code, bill_id
+            ) as b
+            where
+                {key} like :pattern escape '\\'
+            group by
+                lower(trim(coalesce(b.donar_name, ''))), digits(b.donar_phone_num)
+            order by
+                min(instr({key}, :term)), 3 desc
+            limit
+                :limit
+            ;
+        """, {"pattern": f"%{main.escape_like_pattern(term)}%", "term": term, "limit": int(limit)})
+
+    def get_donor_history(
+            self, donor_name: str | None, donor_phone: str | None = None, aggregate: bool = False
+    ) -> (pd.DataFrame | None):
+
+        params: dict = {"donor_name": donor_name or "", "donor_phone": donor_phone or ""}
+        donor_condition: str = """
+            lower(trim(coalesce(b.donar_name, ''))) = lower(trim(:donor_name))
+            and digits(b.donar_phone_num) = digits(:donor_phone)
+        """
+
+        if aggregate:
+            return self._select(f"""
+                select
+                    t.item_id,
+                    initcap(i.name) as item,
+                    sum(t.quantity) as total_quantity,
+                    i.unit_of_measurement,
+                    count(*) as bill_count
+                from
+                    transactions as t
+                join
+                    bill_books as b
+                on
+                    b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id
+                join
+                    items as i
+                on
+                    i.id = t.item_id
+                where
+                    {donor_condition}
+                group by
+                    t.item_id
+                order by
+                    3 desc
+                ;
+            """, params)
+
+        history_df = self._select(f"""
+            select
+                b.bill_book_code,
+                b.bill_id,
+                date(t.donated_at) as donated_on,
+                t.item_id,
+                initcap(i.name) as item,
+                t.quantity,
+                i.unit_of_measurement
+            from
+                bill_books as b
+            join
+                transactions as t
+            on
+                t.bill_book_code = b.bill_book_code and t.bill_id = b.bill_id
+            join
+                items as i
+            on
+                i.id = t.item_id
+            where
+                {donor_condition}
+            order by
+                t.donated_at, length(b.bill_book_code), b.bill_book_code, b.bill_id, t.item_id
+            ;
+        """, params)
+
+        return self._as_dates(history_df, "donated_on")
+
+    def get_daily_flow(self, item_id: int | None = None) -> (pd.DataFrame | None):
+
+        # the quantities of the item, else the number of line items (the units of different items do not add up).
+        measure: str = "quantity" if item_id is not None else "1"
+        where_clause: str = "where item_id = :item_id" if item_id is not None else ""
+
+        flow_df = self._select(f"""
+            select
+                day,
+                sum(inflow) as inflow,
+                sum(outflow) as outflow
+            from (
+                select date(donated_at) as day, {measure} as inflow, 0 as outflow from transactions {where_clause}
+                union all
+                select date(allocated_at) as day, 0 as inflow, {measure} as outflow from allocations {where_clause}
+            )
+            group by
+                day
+            order by
+                day
+            ;
+        """, {"item_id": item_id} if item_id is not None else None)
+
+        return self._as_dates(flow_df, "day")
+
+    def get_top_donors(self, item_id: int | None = None, limit: int = 10) -> (pd.DataFrame | None):
+
+        if item_id is not None:
+            top_donors_df = self.get_contribution_summary("donor", item_id = item_id, limit = limit)
+            return None if top_donors_df is None else top_donors_df[
+                ["donor_name", "donor_phone", "item", "total_quantity", "unit_of_measurement", "bill_count"]
+            ]
+
+        return self._select("""
+            select
+                max(initcap(trim(b.donar_name))) as donor_name,
+                nullif(digits(b.donar_phone_num), '') as donor_phone,
+                count(*) as bill_count,
+                count(distinct t.item_id) as distinct_items
+            from
+                transactions as t
+            join
+                bill_books as b
+            on
+                b.bill_book_code = t.bill_book_code and b.bill_id = t.bill_id
+            group by
+                lower(trim(coalesce(b.donar_name, ''))), digits(b.donar_phone_num)
+            order by
+                3 desc
+            limit
+                :limit
+            ;
+        """, {"limit": int(limit)})
+
+    def get_team_consumption(self, item_id: int | None = None) -> (pd.DataFrame | None):
+
+        where_clause: str = "where a.item_id = :item_id" if item_id is not None else ""
+
+        return self._select(f"""
+            select
+                upper(c.supervisor_name) as supervisor_name,
+                a.item_id,
+                initcap(i.name) as item,
+                sum(a.quantity) as total_quantity,
+                i.unit_of_measurement,
+                count(*) as allocation_count
+            from
+                allocations as a
+            join
+                cooking_teams as c
+            on
+                c.id = a.cooking_team_id
+            join
+                items as i
+            on
+                i.id = a.item_id
+            {where_clause}
+            group by
+                a.cooking_team_id, a.item_id
+            order by
+                6 desc, 4 desc
+            ;
+        """, {"item_id": item_id} if item_id is not None else None)
+
+
+class _Shortfall(Exception):
+
+    "Rolls the allocation back, carrying the items that are short."
+
+    def __init__(self, shortfall_df: pd.DataFrame) -> None:
+
+        self.shortfall_df: pd.DataFrame = shortfall_df
+
+
+_repository: Repository | None = None
+_repository_lock: threading.Lock = threading.Lock()
+
+
+def get_repository() -> Repository:
+
+    "Returns the process wide repository of `settings.storage_backend`, created on first use."
+
+    global _repository
+
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                settings: main.Settings = main.get_settings()
+                _repository = (
+                    SQLiteRepository(settings.sqlite_path) if settings.storage_backend == "sqlite"
+                    else PostgresRepository()
+                )
+
+    return _repository
@@ -0,0 +1,88 @@
+import os
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import pytest
+
+# main.py and storage.py are top level modules of the repository root.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main
+from storage import SQLiteRepository
+
+
+@pytest.fixture
+def items_df() -> pd.DataFrame:
+
+    return pd.DataFrame({
+        "item_id": [1, 2, 3],
+        "item": ["Rice", "Oil", "Coconut"],
+        "unit_of_measurement": ["Kg", "L", "Nos"]
+    })
+
+
+@pytest.fixture
+def catalog(items_df: pd.DataFrame) -> main.Catalog:
+
+    return main.Catalog(1, items_df, None)
+
+
+@pytest.fixture
+def repository(tmp_path: Path, items_df: pd.DataFrame) -> SQLiteRepository:
+
+    "An embedded database with the items of `items_df` and one cooking team (id 1)."
+
+    repository: SQLiteRepository = SQLiteRepository(str(tmp_path / "meenakshi.sqlite3"))
+
+    for item, unit_of_measurement in zip(items_df["item"], items_df["unit_of_measurement"]):
+        repository.add_new_items(item, unit_of_measurement)
+    repository.add_new_cooking_team("Supervisor", "9000000001")
+
+    return repository
+
+
+# the postgres tests write and truncate every table: they run only against the database named by 
+# TEST_DB_NAME (the other db_* settings are read from the environment or .env as usual).
+test_db_name: str | None = os.environ.get("TEST_DB_NAME")
+
+
+@pytest.fixture
+def postgres(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, items_df: pd.DataFrame) -> Iterator[None]:
+
+    "A migrated, empty test database with the items of `items_df` and one cooking team (id 1), skipped if not configured."
+
+    if not test_db_name:
+        pytest.skip("No test database configured (set TEST_DB_NAME).")
+
+    monkeypatch.setenv("storage_backend", "postgres")
+    monkeypatch.setenv("db_name", test_db_name)
+    monkeypatch.setenv("write_journal_path", str(tmp_path / "pending_writes.sqlite3"))
+    monkeypatch.setenv("admin_username", "test")
+    monkeypatch.setenv("admin_password", "test")
+    # a fresh app context (settings, pool, cache) per test.
+    monkeypatch.setattr(main, "_app_context", None)
+
+    try:
+        main.migrate_db()
+    except main.offline_errors as e:
+        if not main.is_offline_error(e):
+            raise
+        pytest.skip(f"Test database unreachable: {e}")
+
+    with main.get_db().cursor() as cur:
+        cur.execute(f"""
+            truncate 
+                items, cooking_teams, bill_books, transactions, allocations, inventory_balances, applied_writes, 
+                {", ".join(main.contribution_summary_tables + main.allocation_summary_tables)}
+            restart identity cascade;
+        """)
+
+    for item, unit_of_measurement in zip(items_df["item"], items_df["unit_of_measurement"]):
+        main.add_new_items(item, unit_of_measurement)
+    main.add_new_cooking_team("Supervisor", "9000000001")
+
+    yield
+
+    main.get_db().closeall()
@@ -0,0 +1,31 @@
+from datetime import date
+
+import main
+
+
+def test_group_bill_contributions() -> None:
+
+    rows: list[tuple] = [
+        ("B1", 1, "Donor", "9000000001", 1, "Rice", 2, "Kg", date(2026, 1, 5), "10 : 00 : 00 AM"),
+        ("B1", 1, "Donor", "9000000001", 2, "Oil", 1, "L", date(2026, 1, 5), "10 : 00 : 00 AM"),
+        # a bill without line items (left joined).
+        ("B1", 2, "Other", None, None, None, None, None, None, None),
+        ("B2", 1, None, None, 3, "Coconut", 5, "Nos", date(2026, 1, 6), "09 : 30 : 00 AM"),
+    ]
+
+    bills: dict[tuple[str, int], dict] = main.group_bill_contributions(rows)
+
+    assert list(bills) == [("B1", 1), ("B1", 2), ("B2", 1)]
+    assert bills[("B1", 1)]["donar_name"] == "Donor"
+    assert bills[("B1", 1)]["donar_phone_num"] == "9000000001"
+    assert bills[("B1", 1)]["items"] == [
+        {"item_id": 1, "item": "Rice", "quantity": 2, "unit_of_measurement": "Kg", "donated_on": date(2026, 1, 5), "donated_at": "10 : 00 : 00 AM"},
+        {"item_id": 2, "item": "Oil", "quantity": 1, "unit_of_measurement": "L", "donated_on": date(2026, 1, 5), "donated_at": "10 : 00 : 00 AM"},
+    ]
+    assert bills[("B1", 2)] == {"donar_name": "Other", "donar_phone_num": None, "items": []}
+    assert [item["item"] for item in bills[("B2", 1)]["items"]] == ["Coconut"]
+
+
+def test_group_bill_contributions_of_no_rows() -> None:
+
+    assert main.group_bill_contributions([]) == {}
@@ -0,0 +1,223 @@
+"""
+    The postgres write paths against their ledgers: every test writes through the incremental path,
+    then checks the maintained tables (inventory_balances, the summaries) against a rebuild from the
+    raw tables. Skipped unless a test database is configured (see `postgres` in conftest.py).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import pandas as pd
+import pytest
+
+import main
+
+pytestmark = pytest.mark.usefixtures("postgres")
+
+
+def bill_lines(quantities: dict[int, float]) -> pd.DataFrame:
+
+    return pd.DataFrame({"item_id": list(quantities), "quantity": list(quantities.values())})
+
+
+def table_rows(table: str, columns: str = "*", where: str = "true") -> pd.DataFrame:
+
+    "The rows of the table, sorted on all the columns."
+
+    with main.get_db().cursor() as cur:
+        cur.execute(f"select {columns} from {table} where {where};")
+        rows_df: pd.DataFrame = pd.DataFrame(cur.fetchall())
+
+    return rows_df if rows_df.empty else rows_df.sort_values(list(rows_df.columns)).reset_index(drop = True)
+
+
+def assert_rebuild_matches(tables: tuple[str, ...], rebuild: Callable[[], None]) -> None:
+
+    "The incrementally maintained tables hold the same rows as their rebuild from the raw tables."
+
+    incremental: dict[str, pd.DataFrame] = {table: table_rows(table) for table in tables}
+    rebuild()
+
+    for table in tables:
+        pd.testing.assert_frame_equal(table_rows(table), incremental[table], check_dtype = False, obj = table)
+
+
+def assert_contribution_summaries_exact() -> None:
+
+    assert_rebuild_matches(main.contribution_summary_tables, main.rebuild_contribution_summaries)
+
+
+def test_bill_policies() -> None:
+
+    created, _ = main.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 10, 2: 2}))
+    assert created
+
+    created, changes = main.create_new_bill_record("B1", 1, "", "", bill_lines({1: 4, 3: 5}), policy = "replace")
+    assert not created
+    assert [(change["item_id"], change["previous_quantity"], change["quantity"], change["change"]) for change in changes] == [
+        (1, 10, 4, "updated"), (2, 2, None, "removed"), (3, None, 5, "added")
+    ]
+
+    _, changes = main.create_new_bill_record("B1", 1, "", "", bill_lines({1: 1, 2: 1}), policy = "add")
+    assert [(change["item_id"], change["quantity"], change["change"]) for change in changes] == [
+        (1, 5, "updated"), (2, 1, "added"), (3, 5, "unchanged")
+    ]
+
+    _, changes = main.create_new_bill_record("B1", 1, "", "", bill_lines({1: 9, 2: 9}), policy = "skip")
+    assert [change["change"] for change in changes] == ["unchanged", "unchanged", "unchanged"]
+
+    assert main.create_new_bill_record("B1", 1, "Someone else", "", bill_lines({1: 1}), policy = "create") == (False, [])
+
+    assert main.verify_inventory_balances() is None
+    assert_contribution_summaries_exact()
+
+
+def test_a_donor_change_moves_the_bill_between_donors() -> None:
+
+    main.create_new_bill_record("B1", 1, "Donor A", "9000000001", bill_lines({1: 10, 2: 2}))
+    main.create_new_bill_record("B1", 2, "Donor B", "9000000002", bill_lines({1: 1}))
+
+    # the bill was entered under the wrong donor.
+    main.create_new_bill_record("B1", 1, "Donor B", "9000000002", bill_lines({1: 4}), policy = "replace")
+
+    donors_df: pd.DataFrame = table_rows("donor_contribution_summary")
+    assert donors_df[["donor_phone_key", "item_id", "total_quantity", "bill_count"]].to_dict("records") == [
+        {"donor_phone_key": "9000000002", "item_id": 1, "total_quantity": 5, "bill_count": 2}
+    ]
+    assert_contribution_summaries_exact()
+
+
+def test_a_replayed_bill_is_applied_once() -> None:
+
+    main.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 10}))
+
+    for _ in range(2):
+        main.create_new_bill_record("B1", 1, "", "", bill_lines({1: 5}), policy = "add", idempotency_key = "bill-1")
+
+    assert main.get_inventory()["available_quantity"].tolist() == [15]
+    assert main.verify_inventory_balances() is None
+    assert_contribution_summaries_exact()
+
+
+def test_concurrent_writes_of_a_new_bill_are_applied_on_top_of_each_other() -> None:
+
+    def add_one(_: int) -> tuple[bool, list[dict]]:
+        return main.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 1}), policy = "add")
+
+    with ThreadPoolExecutor(max_workers = 4) as executor:
+        results: list[tuple[bool, list[dict]]] = list(executor.map(add_one, range(8)))
+
+    # one session created the bill, every other one added to it.
+    assert sum(created for created, _ in results) == 1
+    assert sorted(changes[0]["quantity"] for _, changes in results) == list(range(1, 9))
+    assert main.get_inventory()["available_quantity"].tolist() == [8]
+    assert main.verify_inventory_balances() is None
+    assert_contribution_summaries_exact()
+
+
+def test_inventory_balances_match_the_ledger() -> None:
+
+    main.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 10, 2: 2}))
+    main.create_new_bill_record("B1", 2, "Donor", "9000000001", bill_lines({1: 5, 3: 4}))
+    main.create_new_bill_record("B1", 2, "", "", bill_lines({3: 1}), policy = "replace")
+    main.allocate_items_to_cooking_team(1, [1, 2], [6, 2])
+
+    assert main.verify_inventory_balances() is None
+
+    # the rebuild also writes the items never received, with zero balances.
+    columns: str = "item_id, received_quantity, allocated_quantity"
+    nonzero: str = "received_quantity <> 0 or allocated_quantity <> 0"
+    incremental_df: pd.DataFrame = table_rows("inventory_balances", columns, nonzero)
+    main.rebuild_inventory_balances()
+
+    pd.testing.assert_frame_equal(table_rows("inventory_balances", columns, nonzero), incremental_df, check_dtype = False)
+    assert incremental_df.to_dict("records") == [
+        {"item_id": 1, "received_quantity": 10, "allocated_quantity": 6},
+        {"item_id": 2, "received_quantity": 2, "allocated_quantity": 2},
+        {"item_id": 3, "received_quantity": 1, "allocated_quantity": 0},
+    ]
+
+
+def test_allocation_reserves_the_stock() -> None:
+
+    main.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 10, 2: 2}))
+
+    allocations, shortfall_df = main.allocate_items_to_cooking_team(1, [1, 2], [4, 3])
+    assert allocations is None
+    assert shortfall_df[["item_id", "available_quantity", "requested_quantity"]].to_dict("records") == [
+        {"item_id": 2, "available_quantity": 2, "requested_quantity": 3}
+    ]
+
+    with pytest.raises(ValueError, match = "greater than 0"):
+        main.allocate_items_to_cooking_team(1, [1, 2], [4, -1])
+
+    # concurrent allocations cannot overdraw an item: 5 of the 8 requests of 2 Kg fit in the 10 Kg.
+    with ThreadPoolExecutor(max_workers = 4) as executor:
+        results: list[tuple] = list(executor.map(lambda _: main.allocate_items_to_cooking_team(1, [1], [2]), range(8)))
+
+    assert sum(allocations is not None for allocations, _ in results) == 5
+    assert main.get_inventory()[["item_id", "available_quantity"]].to_dict("records") == [
+        {"item_id": 1, "available_quantity": 0}, {"item_id": 2, "available_quantity": 2}
+    ]
+    assert main.verify_inventory_balances() is None
+
+
+def test_allocation_summaries_match_their_rebuild() -> None:
+
+    main.add_new_cooking_team("Second supervisor", "9000000002")
+    main.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 10, 2: 2, 3: 6}))
+    main.allocate_items_to_cooking_team(1, [1, 1, 2], [2, 3, 1], dish = "Pongal")
+    main.allocate_items_to_cooking_team(2, [1, 3], [1, 6])
+    # a shortfall changes nothing.
+    main.allocate_items_to_cooking_team(2, [2], [5])
+
+    team_df: pd.DataFrame = table_rows("team_allocation_summary")
+    assert team_df[["cooking_team_id", "item_id", "total_quantity", "allocation_count"]].values.tolist() == [
+        [1, 1, 5, 2], [1, 2, 1, 1], [2, 1, 1, 1], [2, 3, 6, 1]
+    ]
+    assert_rebuild_matches(main.allocation_summary_tables, main.rebuild_allocation_summaries)
+
+
+def test_contribution_summaries_match_their_rebuild() -> None:
+
+    main.create_new_bill_record("B1", 1, "Donor A", "9000000001", bill_lines({1: 10, 2: 2}))
+    main.create_new_bill_record("B1", 2, "Donor B", "9000000002", bill_lines({1: 3}))
+    main.create_new_bill_record("B2", 1, "Donor A", "9000000001", bill_lines({2: 1, 3: 4}))
+    main.create_new_bill_record("B2", 1, "", "", bill_lines({3: 2}), policy = "add")
+    # every line of the bill taken away: its items drop out of the summaries.
+    main.create_new_bill_record("B1", 2, "", "", bill_lines({}), policy = "replace")
+
+    books_df: pd.DataFrame = table_rows("bill_book_contribution_summary")
+    assert books_df[["bill_book_code", "item_id", "total_quantity", "bill_count"]].values.tolist() == [
+        ["B1", 1, 10, 1], ["B1", 2, 2, 1], ["B2", 2, 1, 1], ["B2", 3, 6, 1]
+    ]
+    assert_contribution_summaries_exact()
+
+
+def test_imported_bills_match_the_ledger() -> None:
+
+    main.create_new_bill_record("B1", 1, "Donor A", "9000000001", bill_lines({1: 10, 2: 2}))
+
+    bills_df: pd.DataFrame = pd.DataFrame(
+        [
+            # replaces the rice of the existing bill, keeps its oil.
+            ["B1", "1", "", "", "1", "4"],
+            ["B1", "2", "Donor B", "9000000002", "1", "3"],
+            ["B1", "2", "Donor B", "9000000002", "3", "5"],
+            ["B1", "2", "Donor B", "9000000002", "3", "1"],
+            ["B9999", "1", "Donor C", "", "1", "1"],
+        ],
+        columns = main.bill_import_columns
+    )
+
+    imported, error_report = main.import_bills(bills_df)
+
+    assert imported == 3
+    assert error_report.to_dict("records") == [
+        {"row": 4, "error": "duplicate item in the same bill"}, {"row": 5, "error": "unknown bill book code"}
+    ]
+    assert table_rows("transactions", "bill_book_code, bill_id, item_id, quantity").values.tolist() == [
+        ["B1", 1, 1, 4], ["B1", 1, 2, 2], ["B1", 2, 1, 3], ["B1", 2, 3, 5]
+    ]
+    assert main.verify_inventory_balances() is None
+    assert_contribution_summaries_exact()
@@ -0,0 +1,40 @@
+import main
+
+
+def test_register_numbers_the_parameters_in_order_of_first_use() -> None:
+
+    statements: main.PreparedStatements = main.PreparedStatements()
+
+    name, prepare_sql, parameters = statements.register("""
+        select * from transactions
+        where bill_book_code = %(bill_book_code)s and bill_id = %(bill_id)s and bill_book_code <> %(bill_book_code)s;
+    """)
+
+    assert name == "prepared_1"
+    assert parameters == ["bill_book_code", "bill_id"]
+    assert prepare_sql.startswith("prepare prepared_1 as select * from transactions")
+    assert prepare_sql.endswith("bill_book_code = $1 and bill_id = $2 and bill_book_code <> $1")
+
+
+def test_register_unescapes_the_percent_signs() -> None:
+
+    statements: main.PreparedStatements = main.PreparedStatements()
+
+    _, prepare_sql, parameters = statements.register("select * from items where name like 'r%%' and id = %(id)s;")
+
+    assert prepare_sql == "prepare prepared_1 as select * from items where name like 'r%' and id = $1"
+    assert parameters == ["id"]
+
+
+def test_register_returns_the_same_statement_for_the_same_text() -> None:
+
+    statements: main.PreparedStatements = main.PreparedStatements()
+
+    first: tuple = statements.register("select * from items;")
+    other: tuple = statements.register("select * from cooking_teams;")
+
+    assert statements.register("select * from items;") == first
+    assert (first[0], other[0]) == ("prepared_1", "prepared_2")
+    assert first[2] == []
+    assert statements.names() == {"prepared_1": "select * from items;", "prepared_2": "select * from cooking_teams;"}
+
@@ -0,0 +1,63 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+
+    "The monotonic time seen by the cache, advanced by the test."
+
+    now: list[float] = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock: list[float]) -> None:
+
+    cache: main.QueryCache = main.QueryCache(ttl = 30.0)
+    key: tuple = cache.make_key("select * from items where id = %(id)s", {"id": 1})
+    cache.set(key, "rice", tables = ("items",))
+
+    clock[0] += 29.0
+    assert cache.get(key) == (True, "rice")
+
+    clock[0] += 2.0
+    assert cache.get(key) == (False, None)
+    # kept as the fallback while the database is unreachable.
+    assert cache.get(key, stale_ok = True) == (True, "rice")
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_the_least_recently_used_entry_is_evicted(clock: list[float]) -> None:
+
+    cache: main.QueryCache = main.QueryCache(maxsize = 2)
+    cache.set(("a",), 1, tables = ("items",))
+    cache.set(("b",), 2, tables = ("items",))
+    cache.get(("a",))
+    cache.set(("c",), 3, tables = ("items",))
+
+    assert cache.get(("a",)) == (True, 1)
+    assert cache.get(("b",)) == (False, None)
+    assert cache.get(("c",)) == (True, 3)
+
+
+def test_invalidate_drops_only_the_entries_reading_the_tables(clock: list[float]) -> None:
+
+    cache: main.QueryCache = main.QueryCache()
+    cache.set(("inventory",), 1, tables = ("inventory_balances", "items"))
+    cache.set(("teams",), 2, tables = ("cooking_teams",))
+    cache.set(("bill",), 3, tables = ("bill_books", "transactions"))
+
+    cache.invalidate("transactions", "inventory_balances")
+
+    assert cache.get(("inventory",)) == (False, None)
+    assert cache.get(("bill",)) == (False, None)
+    assert cache.get(("teams",)) == (True, 2)
+
+
+def test_make_key_is_independent_of_the_parameter_order() -> None:
+
+    assert main.QueryCache.make_key("sql", {"a": [1, 2], "b": 3}) == main.QueryCache.make_key("sql", {"b": 3, "a": [1, 2]})
+    assert main.QueryCache.make_key("sql", {"a": 1}) != main.QueryCache.make_key("sql", {"a": 2})
@@ -0,0 +1,166 @@
+import pandas as pd
+import pytest
+
+from storage import SQLiteRepository
+
+
+def bill_lines(quantities: dict[int, float]) -> pd.DataFrame:
+
+    return pd.DataFrame({"item_id": list(quantities), "quantity": list(quantities.values())})
+
+
+def available(repository: SQLiteRepository) -> dict[int, float]:
+
+    inventory_df: pd.DataFrame | None = repository.get_inventory()
+
+    return {} if inventory_df is None else dict(zip(inventory_df["item_id"], inventory_df["available_quantity"]))
+
+
+def recorded(repository: SQLiteRepository, bill_book_code: str, bill_id: int) -> dict[str, float]:
+
+    _, contribution_df = repository.get_particular_contribution(bill_book_code, bill_id)
+
+    return {} if contribution_df is None else dict(zip(contribution_df["item"], contribution_df["quantity"]))
+
+
+@pytest.fixture
+def bill(repository: SQLiteRepository) -> SQLiteRepository:
+
+    "Bill B1-1 recorded with 10 Kg rice and 2 L oil."
+
+    created, changes = repository.create_new_bill_record("B1", 1, "Donor", "9000000001", bill_lines({1: 10, 2: 2}))
+
+    assert created
+    assert [change["change"] for change in changes] == ["added", "added"]
+
+    return repository
+
+
+def test_replace_keeps_only_the_given_items(bill: SQLiteRepository) -> None:
+
+    created, changes = bill.create_new_bill_record("B1", 1, "", "", bill_lines({1: 4, 3: 5}), policy = "replace")
+
+    assert not created
+    assert changes == [
+        {"item_id": 1, "previous_quantity": 10, "quantity": 4, "change": "updated"},
+        {"item_id": 2, "previous_quantity": 2, "quantity": None, "change": "removed"},
+        {"item_id": 3, "previous_quantity": None, "quantity": 5, "change": "added"},
+    ]
+    assert recorded(bill, "B1", 1) == {"Rice": 4, "Coconut": 5}
+    # nothing received of oil any more, it leaves the inventory.
+    assert available(bill) == {1: 4, 3: 5}
+
+
+def test_add_adds_to_the_recorded_quantities(bill: SQLiteRepository) -> None:
+
+    _, changes = bill.create_new_bill_record("B1", 1, "", "", bill_lines({1: 5, 3: 1}), policy = "add")
+
+    assert [(change["item_id"], change["quantity"], change["change"]) for change in changes] == [
+        (1, 15, "updated"), (2, 2, "unchanged"), (3, 1, "added")
+    ]
+    assert recorded(bill, "B1", 1) == {"Rice": 15, "Oil": 2, "Coconut": 1}
+    assert available(bill) == {1: 15, 2: 2, 3: 1}
+
+
+def test_skip_only_adds_new_items(bill: SQLiteRepository) -> None:
+
+    _, changes = bill.create_new_bill_record("B1", 1, "", "", bill_lines({1: 5, 3: 1}), policy = "skip")
+
+    assert [(change["item_id"], change["quantity"], change["change"]) for change in changes] == [
+        (1, 10, "unchanged"), (2, 2, "unchanged"), (3, 1, "added")
+    ]
+    assert available(bill) == {1: 10, 2: 2, 3: 1}
+
+
+def test_create_leaves_an_existing_bill_untouched(bill: SQLiteRepository) -> None:
+
+    assert bill.create_new_bill_record("B1", 1, "Someone else", "", bill_lines({1: 1}), policy = "create") == (False, [])
+    assert recorded(bill, "B1", 1) == {"Rice": 10, "Oil": 2}
+
+    created, changes = bill.create_new_bill_record("B1", 2, "", "", bill_lines({1: 1}), policy = "create")
+
+    assert created
+    assert changes == [{"item_id": 1, "previous_quantity": None, "quantity": 1, "change": "added"}]
+
+
+def test_invalid_policy(bill: SQLiteRepository) -> None:
+
+    with pytest.raises(ValueError, match = "policy"):
+        bill.create_new_bill_record("B1", 1, "", "", bill_lines({1: 1}), policy = "merge")
+
+
+def test_a_replayed_bill_is_applied_once(bill: SQLiteRepository) -> None:
+
+    first: tuple = bill.create_new_bill_record("B1", 1, "", "", bill_lines({1: 5}), policy = "add", idempotency_key = "bill-1")
+    replayed: tuple = bill.create_new_bill_record("B1", 1, "", "", bill_lines({1: 5}), policy = "add", idempotency_key = "bill-1")
+
+    assert first[1][0]["quantity"] == 15
+    assert replayed == (False, [])
+    assert available(bill) == {1: 15, 2: 2}
+
+
+def test_allocation_takes_the_stock(bill: SQLiteRepository) -> None:
+
+    allocations, shortfall_df = bill.allocate_items_to_cooking_team(1, [1, 1, 2], [3, 2, 2], dish = "Pongal")
+
+    assert shortfall_df.empty
+    assert [(allocation["item_id"], allocation["quantity"]) for allocation in allocations] == [(1, 3), (1, 2), (2, 2)]
+    assert available(bill) == {1: 5, 2: 0}
+
+
+def test_allocation_shortfall_allocates_nothing(bill: SQLiteRepository) -> None:
+
+    allocations, shortfall_df = bill.allocate_items_to_cooking_team(1, [1, 2], [4, 3])
+
+    assert allocations is None
+    assert shortfall_df.to_dict("records") == [
+        {"item_id": 2, "item": "Oil", "unit_of_measurement": "L", "available_quantity": 2.0, "requested_quantity": 3.0}
+    ]
+    assert available(bill) == {1: 10, 2: 2}
+    assert bill.get_allocations() is None
+
+
+def test_a_replayed_allocation_is_applied_once(bill: SQLiteRepository) -> None:
+
+    first, _ = bill.allocate_items_to_cooking_team(1, [1], [4], idempotency_key = "allocation-1")
+    replayed, shortfall_df = bill.allocate_items_to_cooking_team(1, [1], [4], idempotency_key = "allocation-1")
+
+    assert len(first) == 1
+    assert replayed == [] and shortfall_df.empty
+    assert available(bill) == {1: 6, 2: 2}
+
+
+def test_a_short_allocation_does_not_use_up_its_idempotency_key(bill: SQLiteRepository) -> None:
+
+    assert bill.allocate_items_to_cooking_team(1, [1], [40], idempotency_key = "allocation-1")[0] is None
+    bill.create_new_bill_record("B1", 2, "", "", bill_lines({1: 30}))
+
+    allocations, _ = bill.allocate_items_to_cooking_team(1, [1], [40], idempotency_key = "allocation-1")
+
+    assert len(allocations) == 1
+    assert available(bill) == {1: 0, 2: 2}
+
+
+@pytest.mark.parametrize("quantity", [0, -5])
+def test_allocation_rejects_non_positive_quantities(bill: SQLiteRepository, quantity: float) -> None:
+
+    with pytest.raises(ValueError, match = "greater than 0"):
+        bill.allocate_items_to_cooking_team(1, [1, 2], [1, quantity])
+
+    assert available(bill) == {1: 10, 2: 2}
+
+
+def test_allocation_to_an_unknown_team(bill: SQLiteRepository) -> None:
+
+    with pytest.raises(ValueError, match = "No cooking team"):
+        bill.allocate_items_to_cooking_team(7, [1], [1])
+
+
+def test_dish_filter_matches_the_text_literally(bill: SQLiteRepository) -> None:
+
+    bill.allocate_items_to_cooking_team(1, [1], [1], dish = "100% rice")
+    bill.allocate_items_to_cooking_team(1, [1], [1], dish = "1000 rice")
+
+    allocations_df: pd.DataFrame | None = bill.get_allocations(dish = "0% r")
+
+    assert allocations_df["dish"].tolist() == ["100% rice"]
@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+import main
+
+
+def test_validate_item_lines_sums_repeated_items_and_ignores_blank_rows(catalog: main.Catalog) -> None:
+
+    lines_df, error_report = main.validate_item_lines(pd.DataFrame({
+        "items": ["1 - Rice - Kg", None, "2 - Oil - L", "1 - Rice - Kg"],
+        "quantity": [2.5, None, 1, 1.5]
+    }), catalog = catalog)
+
+    assert error_report.empty
+    assert lines_df.to_dict("records") == [
+        {"item_id": 1, "item": "Rice", "quantity": 4.0, "unit_of_measurement": "Kg"},
+        {"item_id": 2, "item": "Oil", "quantity": 1.0, "unit_of_measurement": "L"},
+    ]
+
+
+def test_validate_item_lines_reports_every_invalid_row(catalog: main.Catalog) -> None:
+
+    lines_df, error_report = main.validate_item_lines(pd.DataFrame({
+        "items": ["1 - Rice - Kg", "9 - Sugar - Kg", None, "3 - Coconut - Nos", "2 - Oil - L", "3 - Coconut - Nos"],
+        "quantity": [1, 1, 2, 1.5, -1, None]
+    }), catalog = catalog)
+
+    assert lines_df["item_id"].tolist() == [1]
+    assert error_report.to_dict("records") == [
+        {"row": 2, "error": "unknown item"},
+        {"row": 3, "error": "no item chosen"},
+        {"row": 4, "error": "quantity of an item counted in numbers must be a whole number"},
+        {"row": 5, "error": "quantity must be a number greater than 0"},
+        {"row": 6, "error": "quantity must be a number greater than 0"},
+    ]
+
+
+def test_validate_item_lines_of_an_all_blank_table(catalog: main.Catalog) -> None:
+
+    lines_df, error_report = main.validate_item_lines(
+        pd.DataFrame({"items": [None, None], "quantity": [None, None]}), catalog = catalog
+    )
+
+    assert lines_df.empty
+    assert error_report.empty
+
+
+@pytest.fixture
+def bill_rows_df(monkeypatch: pytest.MonkeyPatch, items_df: pd.DataFrame) -> pd.DataFrame:
+
+    # the items table is read through get_all_items.
+    monkeypatch.setattr(main, "get_all_items", lambda: items_df.copy())
+
+    return pd.DataFrame({
+        "bill_book_code": ["b1", "B1", "B200", "B2", "B2", "B2", "B3"],
+        "bill_id": ["1", "1", "1", "2.5", "3", "3", "4"],
+        "donar_name": ["Donor", "Donor", "Donor", "Donor", "Donor", "Donor", "x" * 101],
+        "donar_phone_num": ["9000000001"] * 7,
+        "item_id": ["1", "2", "1", "1", "7", "7", "3"],
+        "quantity": ["2", "1.5", "1", "1", "1", "1", "0"],
+        "unit_of_measurement": ["kg", "Kg", "", "Kg", "", "", "Nos"]
+    })
+
+
+def test_validate_bill_rows(bill_rows_df: pd.DataFrame) -> None:
+
+    valid_df, error_report = main.validate_bill_rows(bill_rows_df)
+
+    assert valid_df.to_dict("records") == [
+        {"bill_book_code": "B1", "bill_id": 1, "donar_name": "Donor", "donar_phone_num": "9000000001", "item_id": 1, "quantity": 2.0},
+    ]
+    assert error_report.to_dict("records") == [
+        {"row": 2, "error": "unit does not match the item's unit"},
+        {"row": 3, "error": "unknown bill book code"},
+        {"row": 4, "error": "bill id must be a whole number from 1"},
+        {"row": 5, "error": "unknown item id"},
+        {"row": 6, "error": "unknown item id; duplicate item in the same bill"},
+        {"row": 7, "error": "quantity must be a number greater than 0; donar name longer than 100 characters"},
+    ]
+
+
+def test_validate_bill_rows_requires_the_import_columns(bill_rows_df: pd.DataFrame) -> None:
+
+    with pytest.raises(ValueError, match = "item_id"):
+        main.validate_bill_rows(bill_rows_df.drop(columns = ["item_id"]))
@@ -0,0 +1,57 @@
+import psycopg2 as pg
+import pytest
+
+import main
+
+
+def test_is_offline_error() -> None:
+
+    assert main.is_offline_error(main.PoolTimeout())
+    assert main.is_offline_error(pg.InterfaceError("connection already closed"))
+    # raised by libpq without an SQLSTATE when the server cannot be reached.
+    assert main.is_offline_error(pg.OperationalError("server closed the connection unexpectedly"))
+    assert main.is_offline_error(pg.errors.AdminShutdown())
+
+    # errors of a reachable server.
+    assert not main.is_offline_error(pg.errors.DeadlockDetected())
+    assert not main.is_offline_error(pg.errors.SerializationFailure())
+    assert not main.is_offline_error(pg.errors.QueryCanceled())
+    assert not main.is_offline_error(pg.errors.UniqueViolation())
+    assert not main.is_offline_error(ValueError())
+
+
+def test_write_journal_keeps_the_entries_in_order(tmp_path) -> None:
+
+    journal: main.WriteJournal = main.WriteJournal(str(tmp_path / "pending_writes.sqlite3"))
+    journal.append("bill-1", "bill", {"bill_id": 1})
+    journal.append("allocation-1", "allocation", {"item_ids": [1]})
+    # a retried append of the same entry is kept once.
+    journal.append("bill-1", "bill", {"bill_id": 1})
+
+    assert journal.pending(10) == [("bill-1", "bill", {"bill_id": 1}), ("allocation-1", "allocation", {"item_ids": [1]})]
+    assert journal.counts() == {"pending": 2, "rejected": 0}
+
+    journal.reject({"allocation-1": "Not enough stock"})
+    journal.remove(["bill-1"])
+
+    assert journal.pending(10) == []
+    assert journal.counts() == {"pending": 0, "rejected": 1}
+    assert journal.rejected()[["kind", "error"]].to_dict("records") == [{"kind": "allocation", "error": "Not enough stock"}]
+
+    # the file outlives the journal object.
+    assert main.WriteJournal(str(tmp_path / "pending_writes.sqlite3")).counts() == {"pending": 0, "rejected": 1}
+
+
+def test_the_embedded_database_has_no_write_journal(monkeypatch, tmp_path) -> None:
+
+    journal_path = tmp_path / "pending_writes.sqlite3"
+    monkeypatch.setenv("storage_backend", "sqlite")
+    monkeypatch.setenv("write_journal_path", str(journal_path))
+    monkeypatch.setenv("admin_username", "test")
+    monkeypatch.setenv("admin_password", "test")
+    monkeypatch.setattr(main, "_app_context", None)
+
+    with pytest.raises(ValueError, match = "postgres backend only"):
+        main.get_write_journal()
+
+    assert not journal_path.exists()